@@ -1,134 +1,685 @@
+import os
 import json
+import asyncio
+import hashlib
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import requests
 import google.generativeai as genai
-from typing import Dict, Any
-from config import GOOGLE_GEMINI_API_KEY, GEMINI_MODEL, GEMINI_STT_MODEL, INTENT_CATEGORIES, PRIORITIES, SENTIMENTS, DEPARTMENTS
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+from typing import Callable, Dict, Any, Optional, Set, Tuple
+from config import (
+    GOOGLE_GEMINI_API_KEY, GEMINI_MODEL, GEMINI_STT_MODEL, GEMINI_TRANSPORT, GEMINI_API_ENDPOINT,
+    COMBINED_AUDIO_ANALYSIS, ANALYSIS_CACHE_ENABLED, INLINE_AUDIO_MAX_BYTES, GEMINI_REQUEST_MAX_BYTES,
+    GEMINI_TIMEOUT_SECONDS, GEMINI_MAX_ATTEMPTS, GEMINI_BACKOFF_BASE_SECONDS, GEMINI_BACKOFF_MAX_SECONDS,
+    GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN_SECONDS, GEMINI_HEDGE_REQUESTS, GEMINI_HEDGE_MIN_SAMPLES,
+    INTENT_CATEGORIES, PRIORITIES, SENTIMENTS, DEPARTMENTS
+)
+from utils.resilience import Resilience, CircuitBreaker, CircuitOpenError
+import analysis_cache
+import db
+from utils.audio import get_audio_mime_type
+
+logger = logging.getLogger(__name__)
+
+# GenerativeModel has no public way to pick its async client: these SDK
+# versions bind it lazily to the private _async_client attribute, which
+# get_async_model() sets to give each event loop its own client. Check the
+# attribute is still used before adding a version here.
+SDK_ASYNC_CLIENT_VERSIONS = [(0, 7)]
+
+def _sdk_version() -> Tuple[int, ...]:
+    """The installed google-generativeai version as a (major, minor) tuple."""
+    try:
+        return tuple(int(part) for part in genai.__version__.split(".")[:2])
+    except (AttributeError, ValueError):
+        return ()
+
+class GeminiClientManager:
+    """
+    Process-wide owner of the Gemini SDK configuration and model objects.
+    
+    genai.configure() throws away the SDK's service clients, and with them
+    the open gRPC channel or HTTP session, so calling it per request pays
+    connection setup and the TLS handshake every time. The manager
+    configures once and hands out cached GenerativeModel objects; each one
+    binds the shared service client on first use and keeps reusing its
+    transport afterwards.
+    """
+    
+    def __init__(self, api_key: Optional[str] = GOOGLE_GEMINI_API_KEY,
+                 transport: Optional[str] = GEMINI_TRANSPORT,
+                 api_endpoint: Optional[str] = GEMINI_API_ENDPOINT):
+        self.api_key = api_key
+        self.transport = transport
+        self.api_endpoint = api_endpoint
+        self._configured = False
+        self._models: Dict[Tuple, genai.GenerativeModel] = {}
+        self._async_models: Dict[asyncio.AbstractEventLoop, Dict] = {}
+        self._warned_async_client = False
+        self._lock = threading.Lock()
+        self._stats = {"configures": 0, "models_created": 0, "model_reuses": 0}
+    
+    def configure(self):
+        """
+        Configure the SDK once per manager.
+        
+        Raises:
+            ValueError: If no API key is set
+        """
+        with self._lock:
+            self._configure_locked()
+    
+    def _configure_locked(self):
+        if self._configured:
+            return
+        if not self.api_key:
+            raise ValueError("Google Gemini API key is not set. Please set the GOOGLE_GEMINI_API_KEY environment variable.")
+        
+        options = {}
+        if self.transport:
+            options["transport"] = self.transport
+        if self.api_endpoint:
+            options["client_options"] = {"api_endpoint": self.api_endpoint}
+        genai.configure(api_key=self.api_key, **options)
+        self._configured = True
+        self._stats["configures"] += 1
+    
+    def get_model(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None,
+                  system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+        """
+        Get the cached model for a model name, generation config and system instruction.
+        
+        Args:
+            model_name (str): Model name, e.g. GEMINI_MODEL
+            generation_config (Optional[Dict[str, Any]]): Default generation settings
+            system_instruction (Optional[str]): System instruction baked into the model
+            
+        Returns:
+            genai.GenerativeModel: A model shared by every caller with the same settings
+        """
+        key = (model_name, json.dumps(generation_config or {}, sort_keys=True), system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._stats["model_reuses"] += 1
+                return model
+            
+            self._configure_locked()
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=generation_config,
+                system_instruction=system_instruction
+            )
+            self._models[key] = model
+            self._stats["models_created"] += 1
+            return model
+    
+    def get_async_model(self, model_name: str, generation_config: Optional[Dict[str, Any]] = None,
+                        system_instruction: Optional[str] = None) -> genai.GenerativeModel:
+        """
+        Like get_model(), for generate_content_async() on the running event loop.
+        
+        The async transport is a grpc.aio channel bound to the loop that
+        created it, while the SDK shares one async client per process. So
+        models are cached per event loop, each with its own async client;
+        a loop reuses its channel for every call it makes. On SDK versions
+        not in SDK_ASYNC_CLIENT_VERSIONS the models keep the SDK's shared
+        client, which only supports a single event loop.
+        
+        Returns:
+            genai.GenerativeModel: A model whose async client belongs to the running loop
+            
+        Raises:
+            RuntimeError: If called outside a running event loop
+        """
+        loop = asyncio.get_running_loop()
+        key = (model_name, json.dumps(generation_config or {}, sort_keys=True), system_instruction)
+        with self._lock:
+            # A client's channel keeps its loop alive, so drop finished loops here
+            for old_loop in [l for l in self._async_models if l.is_closed()]:
+                del self._async_models[old_loop]
+            models = self._async_models.setdefault(loop, {})
+            model = models.get(key)
+            if model is not None:
+                self._stats["model_reuses"] += 1
+                return model
+            
+            self._configure_locked()
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=generation_config,
+                system_instruction=system_instruction
+            )
+            if _sdk_version() in SDK_ASYNC_CLIENT_VERSIONS:
+                client = models.get("client")
+                if client is None:
+                    client_options = {"api_key": self.api_key}
+                    if self.api_endpoint:
+                        client_options["api_endpoint"] = self.api_endpoint
+                    client = models["client"] = glm.GenerativeServiceAsyncClient(client_options=client_options)
+                # Normally bound lazily to the process-wide async client
+                model._async_client = client
+            elif not self._warned_async_client:
+                self._warned_async_client = True
+                logger.warning(
+                    "google-generativeai %s is not verified for per-loop async clients; "
+                    "async models share the SDK client, so use a single event loop",
+                    getattr(genai, "__version__", "unknown")
+                )
+            models[key] = model
+            self._stats["models_created"] += 1
+            return model
+    
+    def stats(self) -> Dict[str, int]:
+        """Configure and model cache counters."""
+        with self._lock:
+            return {**self._stats, "cached_models": len(self._models)}
+
+_client_manager: Optional[GeminiClientManager] = None
+_client_manager_lock = threading.Lock()
+
+def get_client_manager() -> GeminiClientManager:
+    """Return the process-wide Gemini client manager, creating it on first use."""
+    global _client_manager
+    with _client_manager_lock:
+        if _client_manager is None:
+            _client_manager = GeminiClientManager()
+        return _client_manager
 
 def get_gemini_client():
     """
     Get a Google Gemini client instance.
     Raises an error if API key is not set.
     """
-    if not GOOGLE_GEMINI_API_KEY:
-        raise ValueError("Google Gemini API key is not set. Please set the GOOGLE_GEMINI_API_KEY environment variable.")
-    
-    # Configure the Gemini client
-    genai.configure(api_key=GOOGLE_GEMINI_API_KEY)
+    # Configured once per process by the client manager
+    get_client_manager().configure()
     return genai
 
+# HTTP statuses worth retrying: request timeout, quota, server-side failures
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+def is_quota_error(error: BaseException) -> bool:
+    """Whether an API error means the request or token quota was exceeded (HTTP 429)."""
+    return isinstance(error, google_exceptions.TooManyRequests) or getattr(error, "code", None) == 429
+
+def is_timeout_error(error: BaseException) -> bool:
+    """Whether a call ran past its deadline (gRPC DeadlineExceeded, HTTP 504, REST read timeout)."""
+    return isinstance(error, (google_exceptions.GatewayTimeout, requests.exceptions.Timeout, TimeoutError))
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Whether a failed call may succeed if repeated: quota, 5xx, timeouts and dropped connections."""
+    if isinstance(error, google_exceptions.GoogleAPICallError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              ConnectionError, TimeoutError))
+
+# False inside no_quota_retries(): the caller meters its own requests
+_retry_quota_errors: contextvars.ContextVar = contextvars.ContextVar("retry_quota_errors", default=True)
+
+@contextmanager
+def no_quota_retries():
+    """
+    Raise quota errors (429) at once instead of retrying them, inside this block.
+    
+    For callers that reserve every request from their own rate limiter and
+    back off on 429 themselves (batch_processor): a retry here would send a
+    request their limiter never granted. Other transient errors are still
+    retried. Scoped to the current thread or task.
+    """
+    token = _retry_quota_errors.set(False)
+    try:
+        yield
+    finally:
+        _retry_quota_errors.reset(token)
+
+def _should_retry(error: BaseException) -> bool:
+    if is_quota_error(error) and not _retry_quota_errors.get():
+        return False
+    return is_retryable_error(error)
+
+_resilience: Optional[Resilience] = None
+_resilience_lock = threading.Lock()
+
+def get_resilience() -> Resilience:
+    """
+    Return the process-wide retry policy and circuit breaker for Gemini calls.
+    
+    Every generate, upload and delete request goes through it. Quota
+    errors are retried, except inside no_quota_retries(), but do not open
+    the circuit: the API is up, it is asking us to slow down.
+    """
+    global _resilience
+    with _resilience_lock:
+        if _resilience is None:
+            _resilience = Resilience(
+                is_retryable=_should_retry,
+                is_timeout=is_timeout_error,
+                is_outage=lambda e: not is_quota_error(e),
+                max_attempts=GEMINI_MAX_ATTEMPTS,
+                backoff_base=GEMINI_BACKOFF_BASE_SECONDS,
+                backoff_max=GEMINI_BACKOFF_MAX_SECONDS,
+                breaker=CircuitBreaker(GEMINI_BREAKER_FAILURES, GEMINI_BREAKER_COOLDOWN_SECONDS),
+                hedge_min_samples=GEMINI_HEDGE_MIN_SAMPLES,
+            )
+        return _resilience
+
+def get_resilience_stats() -> Dict[str, Any]:
+    """Retry, timeout, circuit breaker and hedging counters plus latency per operation."""
+    return get_resilience().stats()
+
+def _generate(model, contents, operation: str):
+    """generate_content() with the per-call timeout, retries, circuit breaker and optional hedging."""
+    return get_resilience().call(
+        operation,
+        lambda: model.generate_content(contents, request_options={"timeout": GEMINI_TIMEOUT_SECONDS}),
+        hedge=GEMINI_HEDGE_REQUESTS,
+    )
+
+async def _generate_async(model, contents, operation: str):
+    """Awaitable _generate(); a losing hedge is cancelled."""
+    return await get_resilience().call_async(
+        operation,
+        lambda: model.generate_content_async(contents, request_options={"timeout": GEMINI_TIMEOUT_SECONDS}),
+        hedge=GEMINI_HEDGE_REQUESTS,
+    )
+
+# Generation settings for analyze_call(); part of the cached model's key
+ANALYSIS_GENERATION_CONFIG = {"temperature": 0.3, "response_mime_type": "application/json"}
+
+# Fields every analysis returns, with the value description shown to the model
+ANALYSIS_FIELDS = {
+    "caller_name": "string or null",
+    "caller_contact": "string or null",
+    "intent_category": f"one of: {', '.join(INTENT_CATEGORIES)}",
+    "sentiment": f"one of: {', '.join(SENTIMENTS)}",
+    "priority": f"one of: {', '.join(PRIORITIES)}",
+    "department": f"one of: {', '.join(DEPARTMENTS)}",
+    "summary_short": "1-2 line summary",
+    "summary_full": "3-6 line detailed summary",
+}
+
+ANALYSIS_GUIDELINES = """
+    Guidelines:
+    - Extract caller information (name, contact) only if explicitly mentioned in the transcript
+    - For contact information, prioritize email over phone number if both are available
+    - Choose the most appropriate intent category from the provided list
+    - Assess sentiment based on the tone and content of the call
+    - Assign priority based on urgency and importance of the issue
+    - Route to the most appropriate department
+    - Provide a concise summary and a more detailed summary
+    - Respond ONLY with valid JSON, no additional text or markdown
+    """
+
+TRANSCRIPTION_PROMPT = "Transcribe this audio file. Provide only the transcription text without any additional explanation."
+
+def _json_schema(fields: Dict[str, str]) -> str:
+    """Render field descriptions as the JSON skeleton used in the prompts."""
+    lines = ",\n".join(f'        "{name}": "{description}"' for name, description in fields.items())
+    return "    {\n" + lines + "\n    }"
+
+ANALYSIS_PROMPT = f"""
+    You are an AI assistant that analyzes customer service calls and extracts structured information.
+    
+    Please analyze the following call transcript and respond ONLY with a JSON object that follows this exact schema:
+{_json_schema(ANALYSIS_FIELDS)}
+    {ANALYSIS_GUIDELINES}"""
+
+# Fingerprint of everything besides the transcript that shapes an analysis;
+# part of the analysis cache key, so editing any of it invalidates the cache
+ANALYSIS_PROMPT_VERSION = hashlib.sha256(json.dumps([
+    ANALYSIS_PROMPT, ANALYSIS_GENERATION_CONFIG, INTENT_CATEGORIES, PRIORITIES, SENTIMENTS, DEPARTMENTS
+], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+# One request for process_call_audio(): the transcript plus every analysis field
+COMBINED_PROMPT = f"""
+    You are an AI assistant that transcribes customer service calls and extracts structured information.
+    
+    Transcribe the attached call recording word for word, then analyze it and respond ONLY with a JSON object that follows this exact schema:
+{_json_schema({"transcript": "the full transcription text", **ANALYSIS_FIELDS})}
+    {ANALYSIS_GUIDELINES}"""
+
+def _upload_audio(file_path: str):
+    """Upload an audio file to the Gemini file store."""
+    get_client_manager().configure()
+    return get_resilience().call("upload", lambda: genai.upload_file(path=file_path))
+
+def _delete_file(name: str):
+    """Delete an uploaded file; a failure is logged, not raised."""
+    try:
+        get_resilience().call("delete", lambda: genai.delete_file(name))
+    except Exception as e:
+        # Uploaded files expire on their own after 48 hours
+        logger.warning("could not delete uploaded file %s: %s", name, e)
+
+# Uploads and deletes run here rather than in asyncio.to_thread(), so work
+# already started survives the event loop that asked for it. Deletes are
+# queued here instead of waited for, keeping them off the request path.
+_file_executor = ThreadPoolExecutor(thread_name_prefix="gemini-files")
+_pending_deletes: Set[Future] = set()
+_pending_deletes_lock = threading.Lock()
+
+def _forget_delete(future: Future):
+    with _pending_deletes_lock:
+        _pending_deletes.discard(future)
+
+def _schedule_delete(name: str):
+    """Delete an uploaded file in the background."""
+    future = _file_executor.submit(_delete_file, name)
+    with _pending_deletes_lock:
+        _pending_deletes.add(future)
+    future.add_done_callback(_forget_delete)
+
+def wait_for_file_cleanup(timeout: Optional[float] = None) -> bool:
+    """
+    Wait for queued deletes of uploaded files to finish.
+    
+    Pending deletes also finish at interpreter exit; this is for callers
+    that need them done sooner (tests, shutdown with a deadline).
+    
+    Args:
+        timeout (Optional[float]): Seconds to wait, None for no limit
+        
+    Returns:
+        bool: True if none are left pending
+    """
+    with _pending_deletes_lock:
+        pending = list(_pending_deletes)
+    return not wait(pending, timeout=timeout).not_done
+
+def _inline_audio(file_path: str) -> Dict[str, Any]:
+    """The audio file as an inline request part."""
+    with open(file_path, "rb") as f:
+        return {"mime_type": get_audio_mime_type(file_path), "data": f.read()}
+
+# Request bytes besides the audio: the longest prompt sent with it, plus JSON framing
+INLINE_REQUEST_OVERHEAD_BYTES = max(len(TRANSCRIPTION_PROMPT.encode()), len(COMBINED_PROMPT.encode())) + 4096
+
+def inline_request_bytes(audio_bytes: int) -> int:
+    """Size of a generate request carrying audio_bytes inline (base64 over REST)."""
+    return 4 * ((audio_bytes + 2) // 3) + INLINE_REQUEST_OVERHEAD_BYTES
+
+def _use_inline_audio(file_path: str) -> bool:
+    if INLINE_AUDIO_MAX_BYTES <= 0:
+        return False
+    size = os.path.getsize(file_path)
+    return size <= INLINE_AUDIO_MAX_BYTES and inline_request_bytes(size) <= GEMINI_REQUEST_MAX_BYTES
+
+def _audio_part(file_path: str) -> Tuple[Any, Optional[str]]:
+    """
+    The audio as a request part, inline when it is small enough.
+    
+    Inline audio travels inside the generate request, so there is no
+    upload before it and nothing to delete after it. Files above
+    INLINE_AUDIO_MAX_BYTES, or whose encoded request would exceed
+    GEMINI_REQUEST_MAX_BYTES, are uploaded to the file store instead.
+    
+    Returns:
+        Tuple[Any, Optional[str]]: The part, and the name of the uploaded
+            file to delete afterwards (None for inline audio)
+    """
+    if _use_inline_audio(file_path):
+        return _inline_audio(file_path), None
+    audio_file = _upload_audio(file_path)
+    return audio_file, audio_file.name
+
+def _transcribe_part(audio) -> str:
+    """Transcribe audio given as an inline or uploaded request part."""
+    # Reuse the configured client and cached model
+    model = get_client_manager().get_model(GEMINI_STT_MODEL)
+    response = _generate(model, [TRANSCRIPTION_PROMPT, audio], "transcribe")
+    return response.text
+
 def transcribe_audio(file_path: str) -> str:
     """
     Convert audio file to text using Google Gemini.
     
+    Recordings up to INLINE_AUDIO_MAX_BYTES are sent inline in a single
+    request; larger ones are uploaded first and deleted in the background.
+    Transient errors are retried (see get_resilience()); anything left
+    propagates to the caller.
+    
     Args:
         file_path (str): Path to the audio file
         
     Returns:
         str: Transcribed text
+        
+    Raises:
+        CircuitOpenError: If Gemini has been failing and calls are short-circuited
+        Exception: The last API error once retries are exhausted or it is not transient
+    """
+    audio, uploaded = _audio_part(file_path)
+    try:
+        return _transcribe_part(audio)
+    finally:
+        # Delete the uploaded file, if any, without waiting for it
+        if uploaded is not None:
+            _schedule_delete(uploaded)
+
+def _combined_result(response_text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     """
-    # Configure the Gemini client
-    genai.configure(api_key=GOOGLE_GEMINI_API_KEY)
+    Check a COMBINED_PROMPT reply.
     
-    # Upload the audio file
-    audio_file = genai.upload_file(path=file_path)
+    Returns:
+        Tuple[Optional[Dict[str, Any]], Optional[str]]: The result if it is
+            complete and valid, otherwise None; and the transcript if one
+            was returned
+    """
+    try:
+        result = json.loads(response_text)
+    except json.JSONDecodeError:
+        return None, None
+    if not isinstance(result, dict):
+        return None, None
     
-    # Use the correct model name for speech-to-text
-    model = genai.GenerativeModel(model_name=GEMINI_STT_MODEL)
+    transcript = result.get("transcript")
+    if not (isinstance(transcript, str) and transcript.strip()):
+        return None, None
+    # Off-list values are not defaulted here: analyze_call() gets a second try
+    result = normalize_analysis(result, use_defaults=False)
+    return (result if validate_analysis(result) else None), transcript
+
+def process_call_audio(file_path: str, raise_on_error: bool = False,
+                       before_fallback: Optional[Callable[[str], None]] = None,
+                       use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Transcribe and analyze a call recording in a single model request.
     
-    # Generate transcription
-    prompt = "Transcribe this audio file. Provide only the transcription text without any additional explanation."
-    response = model.generate_content([prompt, audio_file])
+    The audio is sent once and the model returns the transcript together
+    with every analysis field, which saves a round trip and avoids sending
+    the transcript back as input tokens. If the combined response does not
+    pass validate_analysis(), this falls back to the two-step path:
+    the returned transcript (or, failing that, a fresh transcription of the
+    same audio part) goes through analyze_call().
     
-    # Delete the uploaded file
-    genai.delete_file(audio_file.name)
+    Args:
+        file_path (str): Path to the audio file
+        raise_on_error (bool): Re-raise request errors instead of falling
+            back (see analyze_call())
+        before_fallback (Optional[Callable]): Called with "transcribe" or
+            "analyze" before each fallback request is sent, so a rate-limited
+            caller can reserve it
+        use_cache (bool): Let the fallback analysis be answered from the
+            analysis cache (see analyze_call())
+        
+    Returns:
+        Dict[str, Any]: "transcript" plus the analyze_call() fields
+    """
+    audio, uploaded = _audio_part(file_path)
+    try:
+        model = get_client_manager().get_model(GEMINI_MODEL, ANALYSIS_GENERATION_CONFIG)
+        try:
+            response = _generate(model, [COMBINED_PROMPT, audio], "combined")
+            result, transcript = _combined_result(response.text)
+        except Exception as e:
+            if raise_on_error or isinstance(e, CircuitOpenError):
+                raise
+            logger.warning("combined request failed, falling back to two requests: %s", e)
+            result, transcript = None, None
+        if result is not None:
+            return result
+        
+        # Two-step fallback, reusing the audio part and any transcript we got
+        if transcript is None:
+            if before_fallback is not None:
+                before_fallback("transcribe")
+            transcript = _transcribe_part(audio)
+    finally:
+        if uploaded is not None:
+            _schedule_delete(uploaded)
     
-    return response.text
+    if before_fallback is not None:
+        before_fallback("analyze")
+    return {"transcript": transcript, **analyze_call(transcript, raise_on_error, use_cache=use_cache)}
 
-def analyze_call(transcript: str) -> Dict[str, Any]:
+def _analysis_contents(transcript: str) -> list:
+    """Prompt parts sent by analyze_call() and analyze_call_async()."""
+    # System prompt to guide the AI's response format, then the transcript
+    return [ANALYSIS_PROMPT, f"Please analyze this call transcript:\n\n{transcript}"]
+
+class InvalidAnalysisError(ValueError):
+    """The model's reply is JSON but not a complete analysis."""
+
+def _checked_analysis(response_text: str) -> Dict[str, Any]:
+    """
+    Parse an analysis reply and normalize it with normalize_analysis().
+    
+    Raises:
+        json.JSONDecodeError: If the reply is not JSON
+        InvalidAnalysisError: If it does not pass validate_analysis() even
+            after normalizing
+    """
+    analysis = json.loads(response_text)
+    if not isinstance(analysis, dict):
+        raise InvalidAnalysisError("reply is not a JSON object")
+    analysis = normalize_analysis(analysis)
+    if not validate_analysis(analysis):
+        raise InvalidAnalysisError("reply is missing required fields")
+    return analysis
+
+def _parse_failure(error: Exception, raw_response: Optional[str]) -> Dict[str, Any]:
+    """Fallback ticket fields when the model's reply is not a usable analysis."""
+    logger.warning("call analysis reply is not a usable analysis: %s", error)
+    raw_response = raw_response if raw_response is not None else "No response received"
+    return {
+        "error": f"Failed to parse AI response as JSON: {str(error)}",
+        "raw_response": raw_response,
+        "caller_name": None,
+        "caller_contact": None,
+        "intent_category": "other",
+        "sentiment": "neutral",
+        "priority": "medium",
+        "department": "General",
+        "summary_short": "Analysis failed",
+        "summary_full": f"Failed to parse AI response: {raw_response}"
+    }
+
+def _analysis_failure(error: Exception) -> Dict[str, Any]:
+    """Fallback ticket fields when the analysis request itself failed."""
+    logger.warning("call analysis failed, using fallback fields: %s", error)
+    return {
+        "error": f"Failed to analyze call: {str(error)}",
+        "caller_name": None,
+        "caller_contact": None,
+        "intent_category": "other",
+        "sentiment": "neutral",
+        "priority": "medium",
+        "department": "General",
+        "summary_short": "Analysis failed",
+        "summary_full": f"Failed to analyze call: {str(error)}"
+    }
+
+def _cache_key(transcript: str) -> Optional[str]:
+    """Analysis cache key for a transcript, or None when the cache is off."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    return analysis_cache.make_key(transcript, GEMINI_MODEL, ANALYSIS_PROMPT_VERSION)
+
+def _store_analysis(cache_key: Optional[str], analysis: Dict[str, Any]):
+    """Cache an analysis if it is complete and valid."""
+    if cache_key is not None and isinstance(analysis, dict) and validate_analysis(analysis):
+        analysis_cache.get_analysis_cache().put(cache_key, analysis)
+
+def get_analysis_cache_stats() -> Dict[str, Any]:
+    """Analysis cache hits per tier, misses, evictions and hit rate."""
+    return analysis_cache.get_analysis_cache().stats()
+
+def analyze_call(transcript: str, raise_on_error: bool = False, use_cache: bool = True) -> Dict[str, Any]:
     """
     Analyze a call transcript using Google Gemini to extract structured information.
     
+    A transcript analyzed before (same normalized text, model and prompt
+    version) is answered from the analysis cache without a request.
+    
     Args:
         transcript (str): The transcribed text from the call
+        raise_on_error (bool): Re-raise request errors (e.g. quota) left after
+            retries instead of returning fallback fields; unparseable replies
+            still fall back
+        use_cache (bool): Look the transcript up in the analysis cache; if
+            False it is analyzed again and the fresh result replaces the
+            cached one
         
     Returns:
         Dict[str, Any]: Structured analysis of the call including intent, sentiment, etc.
     """
-    # Configure the Gemini client
-    genai.configure(api_key=GOOGLE_GEMINI_API_KEY)
+    cache_key = _cache_key(transcript)
+    if cache_key is not None and use_cache:
+        cached = analysis_cache.get_analysis_cache().get(cache_key)
+        if cached is not None:
+            return cached
     
-    # Use the correct model name for text analysis
-    model = genai.GenerativeModel(model_name=GEMINI_MODEL)
-    
-    # System prompt to guide the AI's response format
-    system_prompt = f"""
-    You are an AI assistant that analyzes customer service calls and extracts structured information.
-    
-    Please analyze the following call transcript and respond ONLY with a JSON object that follows this exact schema:
-    {{
-        "caller_name": "string or null",
-        "caller_contact": "string or null",
-        "intent_category": "one of: {', '.join(INTENT_CATEGORIES)}",
-        "sentiment": "one of: {', '.join(SENTIMENTS)}",
-        "priority": "one of: {', '.join(PRIORITIES)}",
-        "department": "one of: {', '.join(DEPARTMENTS)}",
-        "summary_short": "1-2 line summary",
-        "summary_full": "3-6 line detailed summary"
-    }}
-    
-    Guidelines:
-    - Extract caller information (name, contact) only if explicitly mentioned in the transcript
-    - For contact information, prioritize email over phone number if both are available
-    - Choose the most appropriate intent category from the provided list
-    - Assess sentiment based on the tone and content of the call
-    - Assign priority based on urgency and importance of the issue
-    - Route to the most appropriate department
-    - Provide a concise summary and a more detailed summary
-    - Respond ONLY with valid JSON, no additional text or markdown
-    """
-
-    # User prompt with the actual transcript
-    user_prompt = f"Please analyze this call transcript:\n\n{transcript}"
-
+    response = None
     # Make the API call
     try:
-        response = model.generate_content(
-            [system_prompt, user_prompt],
-            generation_config=genai.GenerationConfig(
-                temperature=0.3,
-                response_mime_type="application/json"
-            )
-        )
+        # Reuse the configured client and cached model
+        model = get_client_manager().get_model(GEMINI_MODEL, ANALYSIS_GENERATION_CONFIG)
+        response = _generate(model, _analysis_contents(transcript), "analyze")
         
         # Parse the JSON response
-        analysis_result = json.loads(response.text)
+        analysis_result = _checked_analysis(response.text)
+        _store_analysis(cache_key, analysis_result)
         return analysis_result
-    except json.JSONDecodeError as e:
+    except (json.JSONDecodeError, InvalidAnalysisError) as e:
         # If JSON parsing fails, return a default structure with error info
-        return {
-            "error": f"Failed to parse AI response as JSON: {str(e)}",
-            "raw_response": response.text if 'response' in locals() else "No response received",
-            "caller_name": None,
-            "caller_contact": None,
-            "intent_category": "other",
-            "sentiment": "neutral",
-            "priority": "medium",
-            "department": "General",
-            "summary_short": "Analysis failed",
-            "summary_full": f"Failed to parse AI response: {response.text if 'response' in locals() else 'No response received'}"
-        }
+        return _parse_failure(e, response.text if response is not None else None)
     except Exception as e:
+        if raise_on_error:
+            raise
         # Handle any other exceptions
-        return {
-            "error": f"Failed to analyze call: {str(e)}",
-            "caller_name": None,
-            "caller_contact": None,
-            "intent_category": "other",
-            "sentiment": "neutral",
-            "priority": "medium",
-            "department": "General",
-            "summary_short": "Analysis failed",
-            "summary_full": f"Failed to analyze call: {str(e)}"
-        }
+        return _analysis_failure(e)
+
+def normalize_analysis(analysis: Dict[str, Any], use_defaults: bool = True) -> Dict[str, Any]:
+    """
+    Map the categorical fields of an analysis onto the config.py lists.
+    
+    The model sometimes answers "High" or "Billing Issue"; such values are
+    matched ignoring case and separators (db.match_enum()). Caller fields
+    the model left out become None.
+    
+    Args:
+        analysis (Dict[str, Any]): The analysis as returned by the model
+        use_defaults (bool): Replace values outside the lists with the
+            config.py defaults ("other", "General", "medium", "neutral");
+            if False they are kept, so validate_analysis() rejects them
+            
+    Returns:
+        Dict[str, Any]: A normalized copy of the analysis
+    """
+    analysis = dict(analysis)
+    for field in ("intent_category", "department", "priority", "sentiment"):
+        if use_defaults:
+            analysis[field] = db.normalize_enum(field, analysis.get(field))
+        elif field in analysis:
+            analysis[field] = db.match_enum(field, analysis[field]) or analysis[field]
+    analysis.setdefault("caller_name", None)
+    analysis.setdefault("caller_contact", None)
+    return analysis
 
 def validate_analysis(analysis: Dict[str, Any]) -> bool:
     """
@@ -164,4 +715,135 @@ def validate_analysis(analysis: Dict[str, Any]) -> bool:
     if analysis["department"] not in DEPARTMENTS:
         return False
     
-    return True
\ No newline at end of file
+    return True
+
+# Async API: the same calls as awaitables, so one event loop can keep many
+# calls in flight. Generation uses the SDK's async methods. The file API is
+# synchronous only, so uploads and deletes run on _file_executor.
+
+def _delete_when_uploaded(upload: Future):
+    """Done-callback for an upload whose caller was cancelled: remove the file."""
+    if upload.cancelled() or upload.exception() is not None:
+        return
+    _schedule_delete(upload.result().name)
+
+async def _upload_audio_async(file_path: str):
+    """Awaitable _upload_audio(); cancelling it still deletes the file once uploaded."""
+    upload = _file_executor.submit(_upload_audio, file_path)
+    try:
+        return await asyncio.wrap_future(upload)
+    except asyncio.CancelledError:
+        # A running upload cannot be interrupted; clean up after it
+        upload.add_done_callback(_delete_when_uploaded)
+        raise
+
+async def _audio_part_async(file_path: str) -> Tuple[Any, Optional[str]]:
+    """Awaitable _audio_part()."""
+    if _use_inline_audio(file_path):
+        return await asyncio.to_thread(_inline_audio, file_path), None
+    audio_file = await _upload_audio_async(file_path)
+    return audio_file, audio_file.name
+
+async def _transcribe_part_async(audio) -> str:
+    model = get_client_manager().get_async_model(GEMINI_STT_MODEL)
+    response = await _generate_async(model, [TRANSCRIPTION_PROMPT, audio], "transcribe")
+    return response.text
+
+async def transcribe_audio_async(file_path: str) -> str:
+    """
+    Awaitable transcribe_audio().
+    
+    Args:
+        file_path (str): Path to the audio file
+        
+    Returns:
+        str: Transcribed text
+    """
+    audio, uploaded = await _audio_part_async(file_path)
+    try:
+        return await _transcribe_part_async(audio)
+    finally:
+        # Queued synchronously, so a cancellation here cannot skip it
+        if uploaded is not None:
+            _schedule_delete(uploaded)
+
+async def analyze_call_async(transcript: str) -> Dict[str, Any]:
+    """
+    Awaitable analyze_call(), with the same fallback fields on failure.
+    
+    Cancellation is not turned into a fallback ticket; it propagates. The
+    analysis cache's SQLite reads and writes run in a worker thread, off
+    the event loop.
+    
+    Args:
+        transcript (str): The transcribed text from the call
+        
+    Returns:
+        Dict[str, Any]: Structured analysis of the call
+    """
+    cache_key = _cache_key(transcript)
+    if cache_key is not None:
+        cached = await asyncio.to_thread(analysis_cache.get_analysis_cache().get, cache_key)
+        if cached is not None:
+            return cached
+    
+    response = None
+    try:
+        model = get_client_manager().get_async_model(GEMINI_MODEL, ANALYSIS_GENERATION_CONFIG)
+        response = await _generate_async(model, _analysis_contents(transcript), "analyze")
+        analysis_result = _checked_analysis(response.text)
+        if cache_key is not None:
+            await asyncio.to_thread(_store_analysis, cache_key, analysis_result)
+        return analysis_result
+    except (json.JSONDecodeError, InvalidAnalysisError) as e:
+        return _parse_failure(e, response.text if response is not None else None)
+    except Exception as e:
+        return _analysis_failure(e)
+
+async def process_call_audio_async(file_path: str) -> Dict[str, Any]:
+    """
+    Awaitable process_call_audio(), including its two-step fallback.
+    
+    Args:
+        file_path (str): Path to the audio file
+        
+    Returns:
+        Dict[str, Any]: "transcript" plus the analyze_call() fields
+    """
+    audio, uploaded = await _audio_part_async(file_path)
+    try:
+        model = get_client_manager().get_async_model(GEMINI_MODEL, ANALYSIS_GENERATION_CONFIG)
+        try:
+            response = await _generate_async(model, [COMBINED_PROMPT, audio], "combined")
+            result, transcript = _combined_result(response.text)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.warning("combined request failed, falling back to two requests: %s", e)
+            result, transcript = None, None
+        if result is not None:
+            return result
+        
+        if transcript is None:
+            transcript = await _transcribe_part_async(audio)
+    finally:
+        if uploaded is not None:
+            _schedule_delete(uploaded)
+    
+    return {"transcript": transcript, **await analyze_call_async(transcript)}
+
+async def run_call_pipeline_async(file_path: str, combined: bool = COMBINED_AUDIO_ANALYSIS) -> Dict[str, Any]:
+    """
+    Turn a call recording into ticket fields without blocking the event loop.
+    
+    Args:
+        file_path (str): Path to the audio file
+        combined (bool): Use the single-request path (process_call_audio_async)
+        
+    Returns:
+        Dict[str, Any]: "transcript" plus the analysis fields, ready for insert_ticket()
+    """
+    if combined:
+        return await process_call_audio_async(file_path)
+    transcript = await transcribe_audio_async(file_path)
+    return {"transcript": transcript, **await analyze_call_async(transcript)}
@@ -0,0 +1,239 @@
+"""
+Two-tier cache of call analyses, so the same transcript is analyzed once.
+
+Entries are keyed by a SHA-256 of the normalized transcript, the model
+name and a prompt version supplied by the caller (ai_core fingerprints
+the analysis prompt, generation settings and config.py enums), so any
+change to those starts from a fresh key space; old rows age out.
+
+The first tier is an in-process LRU; the second is the analysis_cache
+table in the ticket database (created by db.init_db()), shared across
+restarts and processes. Entries expire ANALYSIS_CACHE_TTL_SECONDS after
+they were stored, and the table keeps at most ANALYSIS_CACHE_MAX_ROWS,
+evicting the least recently used. Lookups only read the table: their
+last-used times are collected in memory and written in batches, so a hit
+never waits for the database writer. A database error never fails an
+analysis: it counts as a miss.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import db
+from config import (
+    ANALYSIS_CACHE_TTL_SECONDS, ANALYSIS_CACHE_MAX_ROWS, ANALYSIS_CACHE_MEMORY_ENTRIES, ANALYSIS_CACHE_TOUCH_BATCH
+)
+
+logger = logging.getLogger(__name__)
+
+def normalize_transcript(transcript: str) -> str:
+    """Canonical form for keying: NFKC, case-folded, whitespace collapsed."""
+    text = unicodedata.normalize("NFKC", transcript).casefold()
+    return re.sub(r"\s+", " ", text).strip()
+
+def make_key(transcript: str, model: str, prompt_version: str) -> str:
+    """
+    Cache key for one analysis request.
+    
+    Args:
+        transcript (str): The call transcript
+        model (str): Model that analyzes it
+        prompt_version (str): Fingerprint of everything else that shapes the reply
+    
+    Returns:
+        str: Hex SHA-256
+    """
+    payload = json.dumps([model, prompt_version, normalize_transcript(transcript)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    """
+    In-memory LRU in front of the analysis_cache table.
+    
+    Args:
+        ttl_seconds (float): Age after which an entry is ignored and removed
+        max_rows (int): Rows kept in the table
+        memory_entries (int): Entries kept in memory
+        touch_batch (int): Hits collected before their last-used times are written
+    """
+    
+    def __init__(self, ttl_seconds: float = ANALYSIS_CACHE_TTL_SECONDS,
+                 max_rows: int = ANALYSIS_CACHE_MAX_ROWS,
+                 memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES,
+                 touch_batch: int = ANALYSIS_CACHE_TOUCH_BATCH):
+        self.ttl_seconds = ttl_seconds
+        self.max_rows = max_rows
+        self.memory_entries = memory_entries
+        self.touch_batch = touch_batch
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> last hit time, not yet written to the table
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0,
+            "expired": 0, "evicted": 0, "errors": 0,
+        }
+    
+    def _bump(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+    
+    def _touch(self, key: str, now: float):
+        """Note a hit; write the batch once touch_batch hits are pending."""
+        with self._lock:
+            self._touched[key] = now
+            full = len(self._touched) >= self.touch_batch
+        if full:
+            self.flush_touches()
+    
+    def _take_touches(self) -> list:
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        return [(used_at, key) for key, used_at in touched.items()]
+    
+    def flush_touches(self):
+        """Write the pending last-used times in one transaction."""
+        touched = self._take_touches()
+        if not touched:
+            return
+        try:
+            with db.get_connection_manager().writer() as conn:
+                conn.executemany("UPDATE analysis_cache SET last_used_at = ? WHERE key = ?", touched)
+        except sqlite3.Error as e:
+            # Only the eviction order suffers
+            logger.warning("analysis cache touch failed: %s", e)
+            self._bump("errors")
+    
+    def _remember(self, key: str, analysis: Dict[str, Any], created_at: float):
+        with self._lock:
+            self._memory[key] = (analysis, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up an analysis.
+        
+        Args:
+            key (str): From make_key()
+        
+        Returns:
+            Optional[Dict[str, Any]]: A copy of the cached analysis, or None
+        """
+        now = time.time()
+        hit = None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                hit = dict(entry[0])
+            elif entry is not None:
+                del self._memory[key]
+        if hit is not None:
+            self._touch(key, now)
+            return hit
+        
+        try:
+            # The replica does not follow this table, so read the file
+            with db.get_connection_manager().reader(primary=True) as conn:
+                row = conn.execute(
+                    "SELECT analysis, created_at FROM analysis_cache WHERE key = ?", (key,)
+                ).fetchone()
+            # Expired rows are left for the next put() to delete
+            if row is not None and now - row["created_at"] >= self.ttl_seconds:
+                row = None
+        except sqlite3.Error as e:
+            logger.warning("analysis cache lookup failed: %s", e)
+            self._bump("errors")
+            row = None
+        
+        if row is None:
+            self._bump("misses")
+            return None
+        analysis = json.loads(row["analysis"])
+        self._remember(key, analysis, row["created_at"])
+        self._bump("db_hits")
+        self._touch(key, now)
+        return dict(analysis)
+    
+    def put(self, key: str, analysis: Dict[str, Any]):
+        """
+        Store an analysis, write pending last-used times, then drop expired
+        rows and trim the table to max_rows, all in one transaction.
+        
+        Args:
+            key (str): From make_key()
+            analysis (Dict[str, Any]): A validated analysis
+        """
+        now = time.time()
+        analysis = dict(analysis)
+        self._remember(key, analysis, now)
+        touched = self._take_touches()
+        try:
+            with db.get_connection_manager().writer() as conn:
+                conn.executemany("UPDATE analysis_cache SET last_used_at = ? WHERE key = ?", touched)
+                conn.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, analysis, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(analysis, ensure_ascii=False), now, now)
+                )
+                expired = conn.execute(
+                    "DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+                ).rowcount
+                evicted = conn.execute('''
+                    DELETE FROM analysis_cache WHERE key IN (
+                        SELECT key FROM analysis_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_rows,)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("analysis cache store failed: %s", e)
+            self._bump("errors")
+            return
+        
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["expired"] += expired
+            self._stats["evicted"] += evicted
+    
+    def clear(self):
+        """Drop every entry, in memory and in the table."""
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        with db.get_connection_manager().writer() as conn:
+            conn.execute("DELETE FROM analysis_cache")
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters.
+        
+        Returns:
+            Dict[str, Any]: Hits per tier, misses, stores, expired and evicted
+                rows, errors, hit_rate and memory_entries
+        """
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["memory_entries"] = len(self._memory)
+        lookups = snapshot["memory_hits"] + snapshot["db_hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = (snapshot["memory_hits"] + snapshot["db_hits"]) / lookups if lookups else 0.0
+        return snapshot
+
+_cache: Optional[AnalysisCache] = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> AnalysisCache:
+    """Return the process-wide analysis cache, creating it on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnalysisCache()
+        return _cache
@@ -1,11 +1,15 @@
 import streamlit as st
+from streamlit import runtime
 import os
+import html
 import json
-from datetime import datetime
+import tempfile
+from datetime import datetime, timedelta, timezone
 import config
-from db import init_db, insert_ticket, fetch_recent_tickets, fetch_all_tickets, get_ticket_count
-from ai_core import transcribe_audio, analyze_call, validate_analysis
-from utils.audio import save_uploaded_file, cleanup_temp_file
+from db import init_db, submit_ticket, get_ticket_count, get_ticket, get_stats, get_facets, search_tickets, query_tickets, query_history, export_tickets, start_archive_worker, sync_read_replica, find_ticket_by_audio_hash
+from maintenance import start_maintenance_worker
+from ai_core import transcribe_audio, analyze_call, process_call_audio, validate_analysis, ANALYSIS_FIELDS
+from utils.audio import save_uploaded_file, cleanup_temp_file, hash_uploaded_file
 
 # Add this import to reliably render raw HTML
 import streamlit.components.v1 as components
@@ -20,6 +24,18 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def start_background_workers():
+    """Start the background workers once per server process."""
+    # Move old tickets into monthly archive partitions in the background
+    start_archive_worker()
+    # Periodic WAL checkpoint, optimize, incremental vacuum and online backup
+    start_maintenance_worker()
+
+# Only a running app gets the workers; importing this module (as the tests do) must not touch the database files
+if runtime.exists():
+    start_background_workers()
+
 # Custom CSS for glassmorphic design with neon effects
 st.markdown("""
 <style>
@@ -878,8 +894,24 @@ with col1:
         </div>
         """, unsafe_allow_html=True)
         
+        force_reprocess = st.checkbox(
+            "Force reprocess", key="ra_force_reprocess",
+            help="Analyze again, without reusing the ticket of this exact recording or a cached analysis of its transcript"
+        )
+        
         # Process button
-        if st.button("🔊 Process Audio", type="primary", use_container_width=True):
+        process_clicked = st.button("🔊 Process Audio", type="primary", use_container_width=True)
+        
+        # The same recording (telephony retry, re-upload) reuses its ticket without any API call
+        audio_hash = hash_uploaded_file(uploaded_file) if process_clicked else None
+        duplicate = find_ticket_by_audio_hash(audio_hash) if process_clicked and not force_reprocess else None
+        if duplicate is not None:
+            st.info(f"ℹ️ This recording was already processed as Ticket #{duplicate['id']}. "
+                    "Showing that ticket; tick \"Force reprocess\" to analyze it again.")
+            st.session_state.transcript = duplicate["transcript"]
+            st.session_state.analysis = {field: duplicate.get(field) for field in ANALYSIS_FIELDS}
+            st.session_state.ticket_id = duplicate["id"]
+        elif process_clicked:
             # Initialize temp_file_path
             temp_file_path = None
             
@@ -932,33 +964,38 @@ with col1:
                 </div>
                 """, unsafe_allow_html=True)
                 
-                # Step 2: Transcribe audio
-                transcript = transcribe_audio(temp_file_path)
-                
-                # Update progress
-                progress_steps.markdown("""
-                <div class="progress-container">
-                    <div class="progress-step">
-                        <div class="step-icon completed">✔</div>
-                        <div class="step-label active">Upload</div>
-                    </div>
-                    <div class="progress-step">
-                        <div class="step-icon completed">✔</div>
-                        <div class="step-label active">Transcribe</div>
-                    </div>
-                    <div class="progress-step">
-                        <div class="step-icon completed">3</div>
-                        <div class="step-label active">Analyze</div>
-                    </div>
-                    <div class="progress-step">
-                        <div class="step-icon">4</div>
-                        <div class="step-label">Ticket</div>
+                if config.COMBINED_AUDIO_ANALYSIS:
+                    # Steps 2-3: one request returns the transcript and the analysis
+                    analysis = process_call_audio(temp_file_path, use_cache=not force_reprocess)
+                    transcript = analysis.pop("transcript")
+                else:
+                    # Step 2: Transcribe audio
+                    transcript = transcribe_audio(temp_file_path)
+                    
+                    # Update progress
+                    progress_steps.markdown("""
+                    <div class="progress-container">
+                        <div class="progress-step">
+                            <div class="step-icon completed">✔</div>
+                            <div class="step-label active">Upload</div>
+                        </div>
+                        <div class="progress-step">
+                            <div class="step-icon completed">✔</div>
+                            <div class="step-label active">Transcribe</div>
+                        </div>
+                        <div class="progress-step">
+                            <div class="step-icon completed">3</div>
+                            <div class="step-label active">Analyze</div>
+                        </div>
+                        <div class="progress-step">
+                            <div class="step-icon">4</div>
+                            <div class="step-label">Ticket</div>
+                        </div>
                     </div>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Step 3: Analyze call
-                analysis = analyze_call(transcript)
+                    """, unsafe_allow_html=True)
+                    
+                    # Step 3: Analyze call
+                    analysis = analyze_call(transcript, use_cache=not force_reprocess)
                 
                 # Update progress
                 progress_steps.markdown("""
@@ -985,10 +1022,15 @@ with col1:
                 # Step 4: Store in database
                 ticket_data = {
                     "transcript": transcript,
-                    **analysis
+                    **analysis,
+                    # A fallback analysis is not worth reusing for the next upload
+                    "audio_hash": None if "error" in analysis else audio_hash
                 }
                 
-                ticket_id = insert_ticket(ticket_data)
+                # Queued on the background writer; resolves once committed
+                ticket_id = submit_ticket(ticket_data).result()
+                # Make the new ticket visible to the read replica, if enabled
+                sync_read_replica()
                 
                 # Clean up temporary file
                 if temp_file_path:
@@ -1052,7 +1094,7 @@ with col1:
         
         # Transcript Card
         st.markdown('<div class="card-title">📝 Transcription</div>', unsafe_allow_html=True)
-        st.markdown(f'<div class="transcript-area">{st.session_state.transcript}</div>', unsafe_allow_html=True)
+        st.markdown(f'<div class="transcript-area">{html.escape(st.session_state.transcript or "")}</div>', unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
         
         # Ticket Insights Card
@@ -1129,13 +1171,13 @@ with col1:
         
         st.markdown(f"""
         <div class="short-summary">
-            {st.session_state.analysis.get('summary_short', 'N/A')}
+            {html.escape(str(st.session_state.analysis.get('summary_short', 'N/A')))}
         </div>
         """, unsafe_allow_html=True)
         
         st.markdown(f"""
         <div class="detailed-summary">
-            {st.session_state.analysis.get('summary_full', 'N/A')}
+            {html.escape(str(st.session_state.analysis.get('summary_full', 'N/A')))}
         </div>
         """, unsafe_allow_html=True)
         
@@ -1147,10 +1189,20 @@ with col2:
     st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
     st.markdown('<h3 class="dashboard-title">🕒 Recent Tickets</h3>', unsafe_allow_html=True)
 
+    # Dashboard counters come from the rollup table, not a scan of tickets
+    # Rollup days are UTC calendar days
+    today = datetime.now(timezone.utc).date()
+    mcol1, mcol2 = st.columns(2)
+    with mcol1:
+        st.metric("Total Tickets", get_ticket_count())
+    with mcol2:
+        st.metric("Today", get_stats((today, today + timedelta(days=1)))[0]["count"],
+                  help="Tickets created since midnight UTC")
+
     # Replace static toolbar HTML with actual Streamlit controls
     # Build filters from ticket data
-    all_tickets_for_filters = fetch_all_tickets()
-    departments = sorted({t.get("department") for t in all_tickets_for_filters if t.get("department")})
+    # Facets are cached in-process and only reloaded after the database changes
+    departments = [d for d in get_facets()["department"] if d]
     dept_options = ["All"] + departments
     priority_options = ["All", "critical", "high", "medium", "low"]
 
@@ -1164,28 +1216,13 @@ with col2:
     with fcol3:
         search_query = st.text_input("Search tickets...", key="ra_search_query", placeholder="Search caller/intent/department")
 
-    recent_tickets = fetch_recent_tickets(50)  # fetch more then limit client-side
-
-    # simple filter helper
-    def apply_filters(tickets, dept, priority, query):
-        out = []
-        q = (query or "").strip().lower()
-        for t in tickets:
-            if dept and dept != "All" and (t.get("department") or "") != dept:
-                continue
-            if priority and priority != "All" and (t.get("priority") or "").lower() != priority.lower():
-                continue
-            if q:
-                combined = " ".join([str(t.get(k,"")) for k in ("caller_name","intent_category","department","transcript")]).lower()
-                if q not in combined:
-                    continue
-            out.append(t)
-        return out
-
-    filtered_recent = apply_filters(recent_tickets, dept_filter, priority_filter, search_query)
-    # keep original display limit
+    # keep original display limit; filters and search run in SQL
     display_limit = 5
-    display_list = filtered_recent[:display_limit]
+    if search_query.strip():
+        # best full-text matches first
+        display_list = search_tickets(search_query, limit=display_limit, department=dept_filter, priority=priority_filter)
+    else:
+        display_list, _ = query_tickets(department=dept_filter, priority=priority_filter, limit=display_limit)
 
     if display_list:
         # Build the entire recent tickets table as one HTML block
@@ -1205,27 +1242,27 @@ with col2:
         """
         
         for ticket in display_list:
-            timestamp = ticket.get('created_at', '')
-            if timestamp:
-                try:
-                    dt = datetime.fromisoformat(timestamp)
-                    formatted_datetime = dt.strftime('%Y-%m-%d %H:%M')
-                except:
-                    formatted_datetime = timestamp[:16] if len(timestamp) > 16 else timestamp
+            timestamp = ticket.created_at or ''
+            if ticket.created_at_ms is not None:
+                formatted_datetime = datetime.fromtimestamp(ticket.created_at_ms / 1000).strftime('%Y-%m-%d %H:%M')
+            elif timestamp:
+                formatted_datetime = timestamp[:16].replace('T', ' ')
             else:
                 formatted_datetime = 'N/A'
             
             # nicer priority class (removed avatar/initials)
-            priority = (ticket.get('priority') or 'N/A').lower()
+            priority = (ticket.priority or 'N/A').lower()
             pr_class = "high" if priority == "high" else ("medium" if priority == "medium" else ("critical" if priority == "critical" else "low"))
-            caller = ticket.get('caller_name') or "Unknown"
-            intent = ticket.get('intent_category') or "N/A"
+            caller = html.escape(ticket.caller_name or "Unknown")
+            intent = ticket.intent_category or "N/A"
+            # The snippet comes HTML-escaped from the database, with <mark> around matches
+            snippet_html = f"<div class='sr-snippet'>{ticket.snippet}</div>" if ticket.snippet else ""
             # caller cell now only shows name (no avatar)
             table_html += f"""
                 <tr class="sr-row">
-                    <td class="sr-cell sr-id"><div class="sr-ticket-id">#{ticket.get('id', 'N/A')}</div></td>
+                    <td class="sr-cell sr-id"><div class="sr-ticket-id">#{ticket.id}</div></td>
                     <td class="sr-cell sr-time">{formatted_datetime}</td>
-                    <td class="sr-cell sr-caller"><div class="sr-caller-name">{caller}</div></td>
+                    <td class="sr-cell sr-caller"><div class="sr-caller-name">{caller}</div>{snippet_html}</td>
                     <td class="sr-cell sr-intent">{intent}</td>
                     <td class="sr-cell sr-priority"><span class="sr-priority {pr_class}">{priority.capitalize()}</span></td>
                 </tr>
@@ -1251,6 +1288,8 @@ with col2:
          .sr-time{width:160px;color:#64748b;font-size:0.9rem;}
          .sr-caller{display:block;font-weight:600;color:#0f172a;}
          .sr-caller-name{font-weight:600;color:#0f172a;}
+         .sr-snippet{font-weight:400;color:#64748b;font-size:0.8rem;margin-top:4px;}
+         .sr-snippet mark{background:#fef3c7;color:#0f172a;border-radius:3px;padding:0 2px;}
          .sr-intent{color:#334155;font-weight:600;}
          .sr-priority{width:120px;text-align:center;}
          .sr-priority .sr-priority{display:inline-block;padding:6px 10px;border-radius:999px;font-weight:700;font-size:0.85rem;white-space:nowrap;}
@@ -1286,35 +1325,75 @@ if 'view_all_tickets' in st.session_state and st.session_state.view_all_tickets:
     st.markdown('<p class="hero-subtitle">Complete history of all processed tickets</p>', unsafe_allow_html=True)
     st.markdown('</div>', unsafe_allow_html=True)
     
-    # Pagination controls
+    # Pagination controls: page_cursors[i] is the keyset cursor that starts page i + 1
     if 'page' not in st.session_state:
         st.session_state.page = 1
+    if 'page_cursors' not in st.session_state:
+        st.session_state.page_cursors = [None]
     
     # Add filters for All Tickets page (use same keys so state persists)
     dept_filter_all = st.selectbox("Department", dept_options, key="ra_dept_filter_all")
     priority_filter_all = st.selectbox("Priority", priority_options, key="ra_priority_filter_all")
     search_query_all = st.text_input("Search tickets...", value=st.session_state.get("ra_search_query",""), key="ra_search_query_all")
-
-    # Fetch and filter
-    all_tickets = fetch_all_tickets()
-    filtered_all = apply_filters(all_tickets, dept_filter_all, priority_filter_all, search_query_all)
+    include_archive = st.checkbox("Include archived tickets", key="ra_include_archive", help="Also search older tickets moved to the monthly archives")
 
     # reset page on filter change
     if 'last_filters' not in st.session_state:
-        st.session_state.last_filters = (None, None, None)
-    current_filters = (dept_filter_all, priority_filter_all, search_query_all)
+        st.session_state.last_filters = (None, None, None, None)
+    current_filters = (dept_filter_all, priority_filter_all, search_query_all, include_archive)
     if st.session_state.last_filters != current_filters:
         st.session_state.page = 1
+        st.session_state.page_cursors = [None]
         st.session_state.last_filters = current_filters
 
-    total_tickets = len(filtered_all)
-    tickets_per_page = 10
-    total_pages = (total_tickets + tickets_per_page - 1) // tickets_per_page if total_tickets > 0 else 1;
+    # Export the filtered tickets: rows are streamed from the database in
+    # batches into a temporary file, built only when requested. The file is
+    # handed to the download button once, in the run that built it, and
+    # deleted straight away, so nothing is re-read on later reruns and no
+    # export outlives its run on disk
+    export_formats = {"CSV": ("csv", "text/csv"), "JSONL": ("jsonl", "application/x-ndjson")}
+    export_fmt_col, export_btn_col = st.columns([1, 1])
+    with export_fmt_col:
+        export_format = st.selectbox("Export format", list(export_formats), key="ra_export_format")
+    export_ext, export_mime = export_formats[export_format]
+    with export_btn_col:
+        prepare_export = st.button("Prepare export", key="ra_prepare_export")
+    if prepare_export:
+        export_path = None
+        try:
+            with tempfile.NamedTemporaryFile("w", delete=False, suffix=f".{export_ext}", encoding="utf-8", newline="") as export_file:
+                export_path = export_file.name
+                for chunk in export_tickets(
+                    fmt=export_ext,
+                    department=dept_filter_all,
+                    priority=priority_filter_all,
+                    text=search_query_all,
+                    include_archive=include_archive
+                ):
+                    export_file.write(chunk)
+            with open(export_path, "rb") as export_data:
+                st.download_button(
+                    f"Download {export_format}",
+                    data=export_data,
+                    file_name=f"tickets.{export_ext}",
+                    mime=export_mime,
+                    key="ra_download_export"
+                )
+        finally:
+            if export_path:
+                cleanup_temp_file(export_path)
+        st.caption("The download is offered until the page next updates; prepare the export again for another copy.")
 
-    # paginate filtered list
-    start_idx = (st.session_state.page - 1) * tickets_per_page
-    end_idx = start_idx + tickets_per_page
-    page_tickets = filtered_all[start_idx:end_idx]
+    # Fetch only the current page, starting from its cursor
+    tickets_per_page = 10
+    fetch_page = query_history if include_archive else query_tickets
+    page_tickets, next_cursor = fetch_page(
+        department=dept_filter_all,
+        priority=priority_filter_all,
+        text=search_query_all,
+        before=st.session_state.page_cursors[st.session_state.page - 1],
+        limit=tickets_per_page
+    )
 
     if page_tickets:
         # Build full table HTML for all tickets page
@@ -1334,26 +1413,26 @@ if 'view_all_tickets' in st.session_state and st.session_state.view_all_tickets:
         """
         
         for ticket in page_tickets:
-            timestamp = ticket.get('created_at', '')
-            if timestamp:
-                try:
-                    dt = datetime.fromisoformat(timestamp)
-                    formatted_datetime = dt.strftime('%Y-%m-%d %H:%M')
-                except:
-                    formatted_datetime = timestamp[:16] if len(timestamp) > 16 else timestamp
+            timestamp = ticket.created_at or ''
+            if ticket.created_at_ms is not None:
+                formatted_datetime = datetime.fromtimestamp(ticket.created_at_ms / 1000).strftime('%Y-%m-%d %H:%M')
+            elif timestamp:
+                formatted_datetime = timestamp[:16].replace('T', ' ')
             else:
                 formatted_datetime = 'N/A'
             
-            priority = (ticket.get('priority') or 'N/A').lower()
+            priority = (ticket.priority or 'N/A').lower()
             pr_class = "high" if priority == "high" else ("medium" if priority == "medium" else ("critical" if priority == "critical" else "low"))
-            caller = ticket.get('caller_name') or "Unknown"
-            intent = ticket.get('intent_category') or "N/A"
+            caller = html.escape(ticket.caller_name or "Unknown")
+            intent = ticket.intent_category or "N/A"
+            # The snippet comes HTML-escaped from the database, with <mark> around matches
+            snippet_html = f"<div class='sr-snippet'>{ticket.snippet}</div>" if ticket.snippet else ""
             # caller cell without avatar for all-tickets page
             table_html += f"""
                 <tr class="sr-row">
-                    <td class="sr-cell sr-id"><div class="sr-ticket-id">#{ticket.get('id', 'N/A')}</div></td>
+                    <td class="sr-cell sr-id"><div class="sr-ticket-id">#{ticket.id}</div></td>
                     <td class="sr-cell sr-time">{formatted_datetime}</td>
-                    <td class="sr-cell sr-caller"><div class="sr-caller-name">{caller}</div></td>
+                    <td class="sr-cell sr-caller"><div class="sr-caller-name">{caller}</div>{snippet_html}</td>
                     <td class="sr-cell sr-intent">{intent}</td>
                     <td class="sr-cell sr-priority"><span class="sr-priority {pr_class}">{priority.capitalize()}</span></td>
                 </tr>
@@ -1376,6 +1455,8 @@ if 'view_all_tickets' in st.session_state and st.session_state.view_all_tickets:
           .sr-time{width:160px;color:#64748b;font-size:0.9rem;}
           .sr-caller{display:block;font-weight:600;color:#0f172a;}
           .sr-caller-name{font-weight:600;color:#0f172a;}
+          .sr-snippet{font-weight:400;color:#64748b;font-size:0.8rem;margin-top:4px;}
+          .sr-snippet mark{background:#fef3c7;color:#0f172a;border-radius:3px;padding:0 2px;}
           .sr-intent{color:#334155;font-weight:600;}
           .sr-priority{width:120px;text-align:center;}
           .sr-priority .sr-priority{display:inline-block;padding:6px 10px;border-radius:999px;font-weight:700;font-size:0.85rem;white-space:nowrap;}
@@ -1390,6 +1471,20 @@ if 'view_all_tickets' in st.session_state and st.session_state.view_all_tickets:
         # Render with tighter bottom spacing so controls sit closer
         components.html(full_table_html, height=820, scrolling=True)
         
+        # Ticket details: the full transcript is only loaded for the selected ticket
+        detail_options = ["Select a ticket..."] + [f"#{t.id}" for t in page_tickets]
+        selected_ticket = st.selectbox("Ticket details", detail_options, key="ra_ticket_detail")
+        if selected_ticket != detail_options[0]:
+            detail = get_ticket(int(selected_ticket.lstrip("#")))
+            if detail:
+                # Ticket text is model output: escape it before rendering as HTML
+                st.markdown(f'<div class="transcript-area">{html.escape(detail["transcript"] or "")}</div>', unsafe_allow_html=True)
+                st.markdown(f"""
+                <div class="detailed-summary">
+                    {html.escape(detail["summary_full"] or "")}
+                </div>
+                """, unsafe_allow_html=True)
+        
         # Compact pagination: place Previous and Next side-by-side (no large gap)
         p_prev, p_next = st.columns([1,1])
         with p_prev:
@@ -1397,7 +1492,9 @@ if 'view_all_tickets' in st.session_state and st.session_state.view_all_tickets:
                 st.session_state.page -= 1
                 safe_rerun()
         with p_next:
-            if st.button("Next →", key="ra_next") and st.session_state.page < total_pages:
+            if st.button("Next →", key="ra_next") and next_cursor is not None:
+                del st.session_state.page_cursors[st.session_state.page:]
+                st.session_state.page_cursors.append(next_cursor)
                 st.session_state.page += 1
                 safe_rerun()
 
@@ -1405,10 +1502,12 @@ if 'view_all_tickets' in st.session_state and st.session_state.view_all_tickets:
         if st.button("Back to Main Page"):
             st.session_state.view_all_tickets = False
             st.session_state.page = 1
+            st.session_state.page_cursors = [None]
             safe_rerun()
     else:
         st.info("No tickets found in the database.")
         if st.button("Back to Main Page"):
             st.session_state.view_all_tickets = False
             st.session_state.page = 1
+            st.session_state.page_cursors = [None]
             safe_rerun()
@@ -0,0 +1,381 @@
+"""
+Process a burst of call recordings into tickets, as fast as the Gemini quota allows.
+
+Files run on a bounded worker pool. Every model request first takes one
+request and its estimated tokens from per-minute token buckets, so the
+batch stays inside the quota configured in config.py. If the API still
+answers 429 (quota shared with the app, or a lower real limit), the
+number of files in flight is halved, the buckets pause for
+BATCH_QUOTA_BACKOFF_SECONDS and the file is retried; concurrency grows
+back by one after each run of successes.
+
+When results are stored, a recording whose exact bytes were processed
+before is matched to its existing ticket by content hash and skipped
+without any request; --force processes it again, also bypassing the
+analysis cache.
+
+Usage:
+    python batch_processor.py <audio file or directory>... [--no-store] [--force]
+"""
+
+import sys
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+import ai_core
+import db
+from config import (
+    BATCH_MAX_WORKERS, BATCH_REQUESTS_PER_MINUTE, BATCH_TOKENS_PER_MINUTE, BATCH_MAX_ATTEMPTS,
+    BATCH_QUOTA_BACKOFF_SECONDS, AUDIO_TOKENS_PER_SECOND, COMBINED_AUDIO_ANALYSIS, SUPPORTED_AUDIO_FORMATS
+)
+from utils.audio import estimate_audio_seconds, hash_audio_file
+
+# Rough sizes used to reserve tokens before a request is sent
+CHARS_PER_TOKEN = 4
+SPOKEN_TOKENS_PER_SECOND = 4    # Transcript length per second of speech
+ANALYSIS_OUTPUT_TOKENS = 400    # JSON analysis reply
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at a per-minute rate.
+    
+    A request larger than the bucket is let through once the bucket is
+    full and leaves it in debt, so oversized requests delay the ones after
+    them instead of blocking forever.
+    """
+    
+    def __init__(self, per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 wait: Optional[Callable[[float], None]] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.clock = clock
+        # Replaceable in tests; called with the bucket's lock held
+        self.wait = wait
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._cond = threading.Condition()
+    
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Take amount tokens, waiting until they are available.
+        
+        Returns:
+            float: Seconds spent waiting
+        """
+        started = self.clock()
+        needed = min(amount, self.capacity)
+        with self._cond:
+            while True:
+                self._refill()
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return self.clock() - started
+                delay = (needed - self._tokens) / self.rate
+                if self.wait is None:
+                    self._cond.wait(delay)
+                else:
+                    self.wait(delay)
+    
+    def pause(self, seconds: float):
+        """Empty the bucket so nothing is granted for roughly the next seconds."""
+        with self._cond:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+class AdaptiveConcurrency:
+    """
+    Limit on files in flight that backs off on throttling (AIMD).
+    
+    on_throttle() halves the limit; every increase_after consecutive
+    successes raise it by one, up to max_limit.
+    """
+    
+    def __init__(self, max_limit: int, min_limit: int = 1, increase_after: int = 5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase_after = increase_after
+        self.limit = max_limit
+        self.lowest = max_limit
+        self._active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+    
+    def acquire(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+    
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+    
+    def on_success(self):
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+    
+    def on_throttle(self):
+        with self._cond:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self.lowest = min(self.lowest, self.limit)
+            self._successes = 0
+
+@dataclass
+class FileResult:
+    """Outcome of one file in a batch."""
+    path: str
+    status: str                 # "done" or "failed"
+    attempts: int = 0
+    seconds: float = 0.0
+    ticket_id: Optional[int] = None
+    analysis: Optional[Dict] = None
+    error: Optional[str] = None
+    duplicate: bool = False     # Matched an existing ticket, no request sent
+
+def estimate_tokens(file_path: str, combined: bool) -> List[int]:
+    """
+    Estimate the tokens of each model request one file needs.
+    
+    Args:
+        file_path (str): Path to the audio file
+        combined (bool): Whether the single-request path is used
+    
+    Returns:
+        List[int]: Estimated tokens per request, in order
+    """
+    seconds = estimate_audio_seconds(file_path)
+    audio = int(seconds * AUDIO_TOKENS_PER_SECOND)
+    transcript = int(seconds * SPOKEN_TOKENS_PER_SECOND)
+    if combined:
+        prompt = len(ai_core.COMBINED_PROMPT) // CHARS_PER_TOKEN
+        return [audio + prompt + transcript + ANALYSIS_OUTPUT_TOKENS]
+    prompt = len(ai_core.ANALYSIS_PROMPT) // CHARS_PER_TOKEN
+    return [audio + transcript, prompt + transcript + ANALYSIS_OUTPUT_TOKENS]
+
+class BatchProcessor:
+    """
+    Run the transcribe-and-analyze pipeline over many files within the quota.
+    
+    Args:
+        max_workers (int): Upper bound on files in flight
+        requests_per_minute (float): Request quota
+        tokens_per_minute (float): Token quota
+        combined (bool): Use process_call_audio() instead of two requests
+        store (bool): Save each result as a ticket
+        force (bool): Process recordings that already have a ticket again,
+            without answering from the analysis cache
+        on_progress (Optional[Callable]): Called as on_progress(path, status, detail)
+            with status "started", "retrying", "done" or "failed"
+    """
+    
+    def __init__(self, max_workers: int = BATCH_MAX_WORKERS,
+                 requests_per_minute: float = BATCH_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = BATCH_TOKENS_PER_MINUTE,
+                 combined: bool = COMBINED_AUDIO_ANALYSIS, store: bool = True, force: bool = False,
+                 max_attempts: int = BATCH_MAX_ATTEMPTS,
+                 backoff_seconds: float = BATCH_QUOTA_BACKOFF_SECONDS,
+                 on_progress: Optional[Callable[[str, str, str], None]] = None):
+        self.max_workers = max_workers
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max_workers)
+        self.combined = combined
+        self.store = store
+        self.force = force
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.on_progress = on_progress
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0, "estimated_tokens": 0, "quota_errors": 0, "rate_wait_seconds": 0.0, "duplicates": 0
+        }
+    
+    def _progress(self, path: str, status: str, detail: str = ""):
+        if self.on_progress:
+            self.on_progress(path, status, detail)
+    
+    def _request(self, tokens: int):
+        """Reserve one request and its tokens from the quota buckets."""
+        waited = self.requests.acquire(1) + self.tokens.acquire(tokens)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["estimated_tokens"] += tokens
+            self._stats["rate_wait_seconds"] += waited
+    
+    def _run_pipeline(self, path: str) -> Dict:
+        estimates = estimate_tokens(path, self.combined)
+        # A 429 comes straight back to _process_file(), which backs off the whole batch
+        with ai_core.no_quota_retries():
+            if self.combined:
+                self._request(estimates[0])
+                # An invalid combined reply falls back to two more requests; reserve them too
+                fallback = dict(zip(("transcribe", "analyze"), estimate_tokens(path, combined=False)))
+                return ai_core.process_call_audio(
+                    path, raise_on_error=True, before_fallback=lambda step: self._request(fallback[step]),
+                    use_cache=not self.force
+                )
+            
+            self._request(estimates[0])
+            transcript = ai_core.transcribe_audio(path)
+            self._request(estimates[1])
+            return {"transcript": transcript,
+                    **ai_core.analyze_call(transcript, raise_on_error=True, use_cache=not self.force)}
+    
+    def _find_duplicate(self, audio_hash: str, result: FileResult) -> bool:
+        """Fill result from the ticket of an identical recording, if there is one."""
+        ticket = db.find_ticket_by_audio_hash(audio_hash)
+        if ticket is None:
+            return False
+        result.status = "done"
+        result.duplicate = True
+        result.ticket_id = ticket["id"]
+        result.analysis = {"transcript": ticket["transcript"],
+                           **{field: ticket.get(field) for field in ai_core.ANALYSIS_FIELDS}}
+        with self._lock:
+            self._stats["duplicates"] += 1
+        return True
+    
+    def _process_file(self, path: str) -> FileResult:
+        result = FileResult(path=path, status="failed")
+        started = time.perf_counter()
+        audio_hash = hash_audio_file(path) if self.store else None
+        if audio_hash is not None and not self.force and self._find_duplicate(audio_hash, result):
+            result.seconds = time.perf_counter() - started
+            self._progress(path, "done", f"duplicate of ticket #{result.ticket_id}")
+            return result
+        
+        for attempt in range(1, self.max_attempts + 1):
+            result.attempts = attempt
+            self.concurrency.acquire()
+            try:
+                self._progress(path, "started", f"attempt {attempt}")
+                analysis = self._run_pipeline(path)
+            except Exception as e:
+                if ai_core.is_quota_error(e) and attempt < self.max_attempts:
+                    with self._lock:
+                        self._stats["quota_errors"] += 1
+                    self.concurrency.on_throttle()
+                    self.requests.pause(self.backoff_seconds)
+                    self._progress(path, "retrying", f"quota exceeded, {self.concurrency.limit} in flight")
+                    continue
+                result.error = str(e)
+                break
+            finally:
+                self.concurrency.release()
+            
+            self.concurrency.on_success()
+            result.analysis = analysis
+            if self.store:
+                # Fallback analyses stay unmapped so the recording is retried next time
+                ticket = {**analysis, "audio_hash": None if "error" in analysis else audio_hash}
+                try:
+                    result.ticket_id = db.submit_ticket(ticket).result()
+                except Exception as e:
+                    # A rejected row (e.g. a locked or full database) fails this file, not the batch
+                    result.error = f"storing the ticket failed: {e}"
+                    break
+            result.status = "done"
+            break
+        
+        result.seconds = time.perf_counter() - started
+        detail = f"ticket #{result.ticket_id}" if result.ticket_id else (result.error or "")
+        self._progress(path, result.status, detail)
+        return result
+    
+    def run(self, paths: Iterable[str]) -> Dict:
+        """
+        Process every file and report throughput.
+        
+        Args:
+            paths (Iterable[str]): Audio files
+        
+        Returns:
+            Dict: Per-file results, counts, files per minute, requests,
+                estimated tokens, quota errors, duplicates skipped and the
+                concurrency reached
+        """
+        paths = list(paths)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as pool:
+            results = list(pool.map(self._process_file, paths))
+        elapsed = time.perf_counter() - started
+        
+        latencies = sorted(r.seconds for r in results if r.status == "done")
+        done = len(latencies)
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            "results": results,
+            "files": len(paths),
+            "succeeded": done,
+            "failed": len(paths) - done,
+            "seconds": elapsed,
+            "files_per_minute": done / elapsed * 60 if elapsed else 0.0,
+            "tokens_per_minute": stats["estimated_tokens"] / elapsed * 60 if elapsed else 0.0,
+            "p50_seconds": latencies[done // 2] if done else None,
+            "p95_seconds": latencies[min(done - 1, int(done * 0.95))] if done else None,
+            "final_concurrency": self.concurrency.limit,
+            "lowest_concurrency": self.concurrency.lowest,
+            **stats,
+        }
+
+def collect_audio_files(targets: Iterable[str]) -> List[str]:
+    """Expand directories into the supported audio files they contain."""
+    extensions = tuple(f".{ext}" for ext in SUPPORTED_AUDIO_FORMATS)
+    paths = []
+    for target in targets:
+        if os.path.isdir(target):
+            paths.extend(
+                os.path.join(target, name) for name in sorted(os.listdir(target))
+                if name.lower().endswith(extensions)
+            )
+        else:
+            paths.append(target)
+    return paths
+
+def main():
+    targets = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    paths = collect_audio_files(targets)
+    if not paths:
+        print(__doc__)
+        sys.exit(2)
+    
+    store = "--no-store" not in sys.argv[1:]
+    force = "--force" in sys.argv[1:]
+    # The analysis cache lives in the ticket database, even with --no-store
+    db.init_db()
+    
+    finished = [0]
+    def show(path, status, detail):
+        if status in ("done", "failed"):
+            finished[0] += 1
+        print(f"[{finished[0]}/{len(paths)}] {status:<8} {os.path.basename(path)}  {detail}")
+    
+    report = BatchProcessor(store=store, force=force, on_progress=show).run(paths)
+    print(
+        f"\n{report['succeeded']}/{report['files']} files in {report['seconds']:.1f}s "
+        f"({report['files_per_minute']:.1f} files/min, ~{report['tokens_per_minute']:,.0f} tokens/min), "
+        f"{report['requests']} requests, {report['quota_errors']} quota errors, {report['duplicates']} duplicates, "
+        f"concurrency {report['final_concurrency']} (lowest {report['lowest_concurrency']})"
+    )
+    if store:
+        db.shutdown_ticket_writer()
+    db.close_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Simulate BatchProcessor against a quota-enforcing stand-in for the model.
+
+The stand-in enforces QUOTA_PER_MINUTE scaled down to a one-second
+window, so a run takes seconds, and raises a 429 beyond it. Runs
+once with the limiter set to the real quota and once configured at twice
+the quota, where only the adaptive back-off keeps the batch going.
+
+Usage:
+    python benchmarks/bench_batch.py [file_count]
+"""
+
+import sys
+import os
+import collections
+import tempfile
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.api_core import exceptions as google_exceptions
+import ai_core
+import batch_processor
+
+QUOTA_PER_MINUTE = 1200         # 20 requests per second
+CALL_SECONDS = 0.2
+
+class QuotaStandIn:
+    """A quota of per_minute / 60 requests in any one-second window, then 429s."""
+    
+    def __init__(self, per_minute: int):
+        self.per_second = per_minute / 60
+        self.window = collections.deque()
+        self.lock = threading.Lock()
+    
+    def __call__(self, path, raise_on_error=False, before_fallback=None, use_cache=True):
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0] > 1.0:
+                self.window.popleft()
+            if len(self.window) >= self.per_second:
+                raise google_exceptions.ResourceExhausted("Quota exceeded")
+            self.window.append(now)
+        time.sleep(CALL_SECONDS)
+        return {"transcript": "Simulated.", "department": "General"}
+
+def run(label: str, paths, configured_per_minute: float):
+    original = ai_core.process_call_audio
+    ai_core.process_call_audio = QuotaStandIn(QUOTA_PER_MINUTE)
+    try:
+        processor = batch_processor.BatchProcessor(
+            max_workers=16, requests_per_minute=configured_per_minute, combined=True,
+            store=False, backoff_seconds=0.5
+        )
+        # No burst allowance and an empty start, so the run measures the steady rate
+        processor.requests = batch_processor.TokenBucket(configured_per_minute, capacity=1)
+        processor.requests.pause(0)
+        report = processor.run(paths)
+    finally:
+        ai_core.process_call_audio = original
+    
+    print(f"{label:<26} {report['succeeded']}/{report['files']} files  {report['seconds']:6.2f}s  "
+          f"{report['succeeded'] / report['seconds']:5.1f} files/s  {report['quota_errors']:>3} quota errors  "
+          f"concurrency {report['final_concurrency']} (lowest {report['lowest_concurrency']})")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(count):
+            path = os.path.join(tmp_dir, f"voicemail{i}.mp3")
+            with open(path, "wb") as f:
+                f.write(b"\0" * 16000)
+            paths.append(path)
+        
+        print(f"Stand-in quota: {QUOTA_PER_MINUTE / 60:.0f} requests/s, {CALL_SECONDS * 1000:.0f} ms per call")
+        run("limiter at quota", paths, QUOTA_PER_MINUTE)
+        run("limiter at 2x quota", paths, QUOTA_PER_MINUTE * 2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark per-call Gemini client overhead: configure-per-call against the
+cached GeminiClientManager, both talking to a local stand-in endpoint.
+
+The stand-in answers instantly over plain HTTP, so the numbers are pure
+client-side overhead (configure, model construction, connection setup);
+against the real API each new connection also pays a TLS handshake.
+
+Usage:
+    python benchmarks/bench_gemini_client.py [call_count]
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai
+import ai_core
+from gemini_standin import StandInServer
+
+MODEL = "models/gemini-2.0-flash"
+
+def per_call_configure(server: StandInServer):
+    """The old path: configure and build a model on every call."""
+    genai.configure(api_key="bench", transport="rest", client_options={"api_endpoint": server.endpoint})
+    model = genai.GenerativeModel(model_name=MODEL)
+    return model.generate_content("Hello").text
+
+def run(label: str, count: int, call):
+    server = StandInServer()
+    try:
+        call(server)  # warm-up: imports, first connection
+        started = time.perf_counter()
+        for _ in range(count):
+            call(server)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.close()
+    
+    print(f"{label:<28} {count:>5} calls  {elapsed / count * 1000:7.2f} ms/call  "
+          f"{server.connections:>5} connections")
+    return elapsed
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    
+    managers = {}
+    def cached(server: StandInServer):
+        manager = managers.get(server.endpoint)
+        if manager is None:
+            manager = managers[server.endpoint] = ai_core.GeminiClientManager(
+                api_key="bench", transport="rest", api_endpoint=server.endpoint
+            )
+        return manager.get_model(MODEL).generate_content("Hello").text
+    
+    fresh = run("configure per call", count, per_call_configure)
+    reused = run("GeminiClientManager", count, cached)
+    print(f"Overhead saved: {(fresh - reused) / count * 1000:.2f} ms/call ({fresh / reused:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
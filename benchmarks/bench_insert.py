@@ -0,0 +1,53 @@
+"""
+Benchmark per-row ticket inserts against the batched insert_tickets() path.
+
+Usage:
+    python benchmarks/bench_insert.py [row_count]
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+def make_tickets(count: int):
+    """Yield synthetic tickets with realistically sized text fields."""
+    for i in range(count):
+        yield {
+            "caller_name": f"Caller {i}",
+            "caller_contact": f"caller{i}@example.com",
+            "intent_category": "support_request",
+            "department": "Support",
+            "priority": "medium",
+            "sentiment": "neutral",
+            "transcript": "Hello, I am calling about my account. " * 40,
+            "summary_short": "Account question",
+            "summary_full": "The caller has a question about their account. " * 5
+        }
+
+def run(label: str, count: int, insert):
+    """Insert count tickets into a fresh database and report rows/sec."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_NAME = os.path.join(tmp_dir, "bench.db")
+        db.init_db()
+        started = time.perf_counter()
+        insert(make_tickets(count))
+        elapsed = time.perf_counter() - started
+        assert db.get_ticket_count() == count
+        db.close_connections()
+    
+    print(f"{label:<28} {count:>7} rows  {elapsed:8.3f}s  {count / elapsed:>10,.0f} rows/sec")
+    return elapsed
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    
+    per_row = run("insert_ticket (per row)", count, lambda tickets: [db.insert_ticket(t) for t in tickets])
+    batched = run("insert_tickets (batched)", count, db.insert_tickets)
+    print(f"Speedup: {per_row / batched:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark full-row list queries against the projected TicketSummary queries.
+
+Fills a scratch database with tickets, then compares memory and time of the
+list views: SELECT * into dicts versus column-projected TicketSummary records.
+
+Usage:
+    python benchmarks/bench_list_queries.py [ticket_count]
+"""
+
+import sys
+import os
+import time
+import tempfile
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+from bench_insert import make_tickets
+
+def measure(label: str, fetch, repeat: int = 5):
+    """Report the best-of-N time and peak Python memory of one fetch."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fetch()
+        best = min(best, time.perf_counter() - started)
+    
+    tracemalloc.start()
+    result = fetch()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    count = len(result[0]) if isinstance(result, tuple) else len(result)
+    print(f"{label:<40} {count:>7} rows  {best * 1000:9.2f} ms  {peak / 1024 / 1024:9.2f} MB peak")
+    return best, peak
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_NAME = os.path.join(tmp_dir, "bench.db")
+        db.init_db()
+        print(f"Inserting {count:,} tickets...")
+        db.insert_tickets(make_tickets(count), batch_size=5000)
+        
+        print("\nRecent Tickets panel")
+        full_t, full_m = measure("fetch_recent_tickets(50) (SELECT *)", lambda: db.fetch_recent_tickets(50))
+        proj_t, proj_m = measure("query_tickets(limit=50) (TicketSummary)", lambda: db.query_tickets(limit=50))
+        print(f"  {full_t / proj_t:.1f}x faster, {full_m / max(proj_m, 1):.1f}x less memory")
+        
+        print("\nWhole table (what the All Tickets page used to load)")
+        full_t, full_m = measure("fetch_all_tickets() (SELECT *)", db.fetch_all_tickets, repeat=1)
+        proj_t, proj_m = measure("query_tickets(limit=all) (TicketSummary)", lambda: db.query_tickets(limit=count), repeat=1)
+        print(f"  {full_t / proj_t:.1f}x faster, {full_m / max(proj_m, 1):.1f}x less memory")
+        
+        db.close_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Simulate the Gemini resilience layer against a stand-in with a slow tail and an outage.
+
+Tail: most calls take FAST_SECONDS, SLOW_FRACTION of them SLOW_SECONDS.
+Hedging sends a duplicate once a call runs past the recent p95, so a
+slow call costs roughly p95 plus one fast call instead of SLOW_SECONDS.
+
+Outage: every call fails with a 503 after OUTAGE_SECONDS. Without the
+breaker each call spends all its attempts (and their backoff) failing;
+with it, calls fail fast once the circuit opens.
+
+Usage:
+    python benchmarks/bench_resilience.py [call_count]
+"""
+
+import sys
+import os
+import random
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.api_core import exceptions as google_exceptions
+import ai_core
+from utils.resilience import Resilience, CircuitBreaker, CircuitOpenError
+
+FAST_SECONDS = 0.01
+SLOW_SECONDS = 0.3
+SLOW_FRACTION = 0.03
+OUTAGE_SECONDS = 0.05
+
+def tail_call():
+    time.sleep(SLOW_SECONDS if random.random() < SLOW_FRACTION else FAST_SECONDS)
+    return "ok"
+
+def outage_call():
+    time.sleep(OUTAGE_SECONDS)
+    raise google_exceptions.ServiceUnavailable("down")
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+def run_tail(label: str, count: int, hedge: bool):
+    random.seed(7)
+    resilience = Resilience(ai_core.is_retryable_error, hedge_min_samples=20)
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        resilience.call("generate", tail_call, hedge=hedge)
+        latencies.append(time.perf_counter() - started)
+    stats = resilience.stats()
+    print(f"{label:<22} p50 {percentile(latencies, 0.5) * 1000:6.1f} ms  p95 {percentile(latencies, 0.95) * 1000:6.1f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  total {sum(latencies):5.2f}s  "
+          f"{stats['hedges']} hedges ({stats['hedge_wins']} won)")
+
+def run_outage(label: str, count: int, breaker: bool):
+    resilience = Resilience(
+        ai_core.is_retryable_error, max_attempts=3, backoff_base=0.02, backoff_max=0.1,
+        breaker=CircuitBreaker(failure_threshold=5, cooldown_seconds=60) if breaker else None,
+    )
+    started = time.perf_counter()
+    for _ in range(count):
+        try:
+            resilience.call("generate", outage_call)
+        except (google_exceptions.ServiceUnavailable, CircuitOpenError):
+            pass
+    elapsed = time.perf_counter() - started
+    stats = resilience.stats()
+    print(f"{label:<22} {count} failed calls in {elapsed:5.2f}s  {stats['retries']:>3} retries  "
+          f"{stats['circuit_rejections']:>3} failed fast")
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    print(f"Tail: {FAST_SECONDS * 1000:.0f} ms calls, {SLOW_FRACTION:.0%} take {SLOW_SECONDS * 1000:.0f} ms")
+    run_tail("no hedging", count, hedge=False)
+    run_tail("hedging at p95", count, hedge=True)
+    print(f"Outage: every call fails with 503 after {OUTAGE_SECONDS * 1000:.0f} ms")
+    run_outage("retries only", 40, breaker=False)
+    run_outage("retries + breaker", 40, breaker=True)
+
+if __name__ == "__main__":
+    main()
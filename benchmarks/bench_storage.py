@@ -0,0 +1,141 @@
+"""
+Report database size and scan time before and after the hot/cold split.
+
+Builds a database in the pre-split layout (transcript and summary_full
+stored inline in tickets, full-text index reading from tickets), measures
+it, runs the init_db() migration that moves the text into compressed
+ticket_bodies, and measures again.
+
+Usage:
+    python benchmarks/bench_storage.py [ticket_count]
+"""
+
+import sys
+import os
+import time
+import random
+import sqlite3
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+NAMES = ["Ramesh", "Priya", "John Smith", "Maria Garcia", "Wei Chen", "Fatima", "Tom", "Aisha Khan"]
+SENTENCES = [
+    "Hi, this is {name} calling about my account.",
+    "I have been a customer for {n} years and this has never happened before.",
+    "My internet connection has been dropping every few minutes since yesterday.",
+    "I was charged twice on my last invoice, the amount was {n} dollars.",
+    "Could someone please call me back as soon as possible?",
+    "You can reach me at {n}{n}{n} {n}{n}{n}{n} or by email.",
+    "I would like to book an appointment for next {day}.",
+    "The technician was supposed to come on {day} but nobody showed up.",
+    "I need a copy of my payslip for the last {n} months for a loan application.",
+    "Thank you, and I hope to hear from you soon.",
+    "This is really frustrating and I expect a resolution today.",
+    "I tried restarting the router as suggested but it did not help.",
+]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+
+def make_text(rng: random.Random, sentences: int) -> str:
+    name = rng.choice(NAMES)
+    return " ".join(
+        rng.choice(SENTENCES).format(name=name, n=rng.randint(1, 9), day=rng.choice(DAYS))
+        for _ in range(sentences)
+    )
+
+def build_legacy_db(path: str, count: int):
+    """Create the pre-split schema and fill it with synthetic calls."""
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute('''
+        CREATE TABLE tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL,
+            caller_name TEXT, caller_contact TEXT, intent_category TEXT NOT NULL,
+            department TEXT NOT NULL, priority TEXT NOT NULL, sentiment TEXT NOT NULL,
+            transcript TEXT NOT NULL, summary_short TEXT NOT NULL, summary_full TEXT NOT NULL,
+            created_at_ms INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE VIRTUAL TABLE tickets_fts USING fts5(
+            caller_name, caller_contact, transcript, summary_short, summary_full,
+            content='tickets', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    conn.executemany(
+        "INSERT INTO tickets VALUES (NULL, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            (
+                f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00",
+                rng.choice(NAMES),
+                rng.choice(["complaint", "support_request", "billing_issue", "appointment"]),
+                rng.choice(["Support", "Billing", "HR", "Sales"]),
+                rng.choice(["low", "medium", "high", "critical"]),
+                rng.choice(["positive", "neutral", "negative"]),
+                make_text(rng, rng.randint(6, 30)),
+                "Caller needs help with their account",
+                make_text(rng, rng.randint(3, 6)),
+                None,
+            )
+            for i in range(count)
+        )
+    )
+    conn.execute("INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+
+def measure(label: str, path: str):
+    """Print file size and the time of a full scan over the hot columns."""
+    conn = sqlite3.connect(path)
+    sizes = dict(conn.execute(
+        "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+    ).fetchall()) if _has_dbstat(conn) else {}
+    
+    started = time.perf_counter()
+    for _ in range(5):
+        conn.execute(
+            "SELECT sentiment, COUNT(*) FROM tickets NOT INDEXED WHERE caller_name LIKE '%a%' GROUP BY 1"
+        ).fetchall()
+    scan = (time.perf_counter() - started) / 5
+    conn.close()
+    
+    print(f"{label}")
+    print(f"  file size:           {os.path.getsize(path) / 1024 / 1024:8.2f} MB")
+    if sizes:
+        print(f"  tickets table:       {sizes.get('tickets', 0) / 1024 / 1024:8.2f} MB")
+        print(f"  ticket_bodies table: {sizes.get('ticket_bodies', 0) / 1024 / 1024:8.2f} MB")
+    print(f"  hot-column scan:     {scan * 1000:8.2f} ms")
+
+def _has_dbstat(conn) -> bool:
+    try:
+        conn.execute("SELECT 1 FROM dbstat LIMIT 1")
+        return True
+    except sqlite3.Error:
+        return False
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.db")
+        print(f"Building {count:,} tickets in the inline-text layout...")
+        build_legacy_db(path, count)
+        measure("Before (text inline in tickets)", path)
+        
+        db.DB_NAME = path
+        started = time.perf_counter()
+        db.init_db()
+        db.migrate_created_at_ms(batch_size=5000, pause_seconds=0)
+        print(f"\nMigration took {time.perf_counter() - started:.1f}s")
+        db.close_connections()
+        
+        conn = sqlite3.connect(path)
+        conn.execute("VACUUM")
+        conn.close()
+        measure("After (compressed ticket_bodies)", path)
+
+if __name__ == "__main__":
+    main()
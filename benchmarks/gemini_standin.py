@@ -0,0 +1,66 @@
+"""
+Local stand-in for the Gemini REST API, for benchmarks that must not hit the network.
+
+Answers generateContent with a fixed response after an optional delay and
+counts the requests and TCP connections it sees. Point the SDK at it with
+transport="rest" and client_options={"api_endpoint": server.endpoint}.
+"""
+
+import json
+import socket
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class StandInServer:
+    """A threaded HTTP/1.1 server that mimics generateContent."""
+    
+    def __init__(self, response_text: str = "ok", delay_seconds: float = 0.0):
+        self.response_text = response_text
+        self.delay_seconds = delay_seconds
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+            
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes; without this,
+                # Nagle plus delayed ACKs add ~40 ms to every reused connection
+                self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with server._lock:
+                    server.connections += 1
+            
+            def log_message(self, *args):
+                pass
+            
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server._lock:
+                    server.requests += 1
+                if server.delay_seconds:
+                    time.sleep(server.delay_seconds)
+                body = json.dumps({
+                    "candidates": [{
+                        "content": {"parts": [{"text": server.response_text}], "role": "model"},
+                        "finishReason": "STOP",
+                        "index": 0,
+                    }]
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self.endpoint = f"http://127.0.0.1:{self._httpd.server_port}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -8,9 +8,70 @@ load_dotenv()
 GOOGLE_GEMINI_API_KEY = os.getenv("GOOGLE_GEMINI_API_KEY")
 GEMINI_MODEL = "models/gemini-2.0-flash"
 GEMINI_STT_MODEL = "models/gemini-2.0-flash"
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT")        # "grpc" (SDK default) or "rest"
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # Override the API host, e.g. a proxy or local stand-in
+COMBINED_AUDIO_ANALYSIS = True  # Transcribe and analyze in one request (process_call_audio)
+INLINE_AUDIO_MAX_BYTES = 14 * 1024 * 1024  # Smaller recordings go inside the request, skipping upload and delete; 0 always uploads
+GEMINI_REQUEST_MAX_BYTES = 20 * 1000 * 1000  # Gemini's cap on one request; inline audio counts base64-encoded, plus the prompt
+
+# Resilience Configuration (every Gemini request; see ai_core.get_resilience)
+GEMINI_TIMEOUT_SECONDS = 120    # Deadline for each generation request
+GEMINI_MAX_ATTEMPTS = 4         # Tries per request on transient errors (429, 5xx, timeouts, dropped connections)
+GEMINI_BACKOFF_BASE_SECONDS = 1.0  # First retry waits up to this long, doubling per attempt (full jitter)
+GEMINI_BACKOFF_MAX_SECONDS = 30.0  # Cap on a single retry wait
+GEMINI_BREAKER_FAILURES = 5     # Consecutive outage errors that open the circuit
+GEMINI_BREAKER_COOLDOWN_SECONDS = 30.0  # Requests fail fast this long before one trial request
+GEMINI_HEDGE_REQUESTS = False   # Duplicate a generation request still running past the recent p95 (extra tokens)
+GEMINI_HEDGE_MIN_SAMPLES = 20   # Latencies recorded per request type before hedging starts
+
+# Analysis Cache Configuration (see analysis_cache.py)
+ANALYSIS_CACHE_ENABLED = True   # Reuse the analysis of a transcript seen before
+ANALYSIS_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # Entries older than this are analyzed again
+ANALYSIS_CACHE_MAX_ROWS = 10000 # Rows kept in the analysis_cache table (least recently used evicted)
+ANALYSIS_CACHE_MEMORY_ENTRIES = 256  # Entries kept in memory per process
+ANALYSIS_CACHE_TOUCH_BATCH = 64 # Cache hits whose last-used time is written in one transaction
 
 # Database Configuration
 DB_NAME = "reception_agent.db"
+DB_READ_POOL_SIZE = 8           # Max idle read connections kept open for reuse
+DB_BUSY_TIMEOUT_MS = 5000       # How long SQLite waits on a locked database
+DB_CACHE_SIZE_KB = 16384        # Page cache per connection (16 MB)
+DB_MMAP_SIZE = 128 * 1024 * 1024  # Memory-mapped I/O window (128 MB)
+DB_INSERT_BATCH_SIZE = 500      # Rows per transaction for bulk inserts
+DB_WRITE_QUEUE_SIZE = 1000      # Max tickets waiting on the background writer
+DB_READ_REPLICA = False         # Serve reads from an in-memory copy of the database
+DB_REPLICA_REFRESH_SECONDS = 1.0  # How often the replica polls for changes from other processes
+
+# Archive Configuration
+ARCHIVE_DIR = "archive"         # Monthly partition files, relative to the database file
+ARCHIVE_AFTER_MONTHS = 6        # Whole months kept in the live database
+ARCHIVE_RETENTION_MONTHS = None # Months of history kept in full; None keeps everything
+ARCHIVE_RETENTION_ACTION = "purge_transcripts"  # Beyond retention: "purge_transcripts" keeps metadata, "delete" drops the partition
+ARCHIVE_BATCH_SIZE = 500        # Tickets moved per transaction
+ARCHIVE_INTERVAL_SECONDS = 6 * 60 * 60  # How often the background archiver runs
+
+# Maintenance Configuration
+MAINT_BACKUP_DIR = "backups"    # Online backups, relative to the database file
+MAINT_BACKUP_KEEP = 7           # Most recent backups kept
+MAINT_BACKUP_PAGES_PER_STEP = 256  # Pages copied per backup step
+MAINT_BACKUP_STEP_SLEEP = 0.005 # Pause between backup steps so writers get the lock
+MAINT_VACUUM_PAGES_PER_STEP = 256  # Free pages released per incremental vacuum transaction
+MAINT_CHECKPOINT_MODE = "PASSIVE"  # PASSIVE never waits on readers or writers
+MAINT_ANALYSIS_LIMIT = 1000     # Rows sampled per index by ANALYZE / PRAGMA optimize
+MAINT_INTERVAL_SECONDS = 24 * 60 * 60  # How often the background maintenance runs
+
+# Export Configuration
+EXPORT_DIR = "exports/parquet"  # Parquet dataset, relative to the database file
+EXPORT_BATCH_SIZE = 5000        # Tickets read per query and written per row group
+EXPORT_STREAM_BATCH_SIZE = 500  # Tickets per chunk of a CSV/JSONL download
+
+# Batch Processing Configuration
+BATCH_MAX_WORKERS = 8           # Upper bound on files processed concurrently
+BATCH_REQUESTS_PER_MINUTE = 15  # Gemini quota: requests per minute
+BATCH_TOKENS_PER_MINUTE = 1_000_000  # Gemini quota: input + output tokens per minute
+BATCH_MAX_ATTEMPTS = 4          # Tries per file when the quota is exceeded
+BATCH_QUOTA_BACKOFF_SECONDS = 15.0  # Pause for everyone after a quota (429) error
+AUDIO_TOKENS_PER_SECOND = 32    # Gemini bills audio input at 32 tokens per second
 
 # Audio Configuration
 SUPPORTED_AUDIO_FORMATS = ["wav", "mp3", "m4a", "ogg"]
@@ -30,5 +91,11 @@ PRIORITIES = ["low", "medium", "high", "critical"]
 SENTIMENTS = ["positive", "neutral", "negative"]
 DEPARTMENTS = ["Support", "Billing", "HR", "Sales", "Administration", "General"]
 
+# Stored in place of a model answer that is not in the lists above
+DEFAULT_INTENT_CATEGORY = "other"
+DEFAULT_DEPARTMENT = "General"
+DEFAULT_PRIORITY = "medium"
+DEFAULT_SENTIMENT = "neutral"
+
 # UI Configuration
 RECENT_TICKETS_LIMIT = 20
\ No newline at end of file
@@ -1,74 +1,1682 @@
 import sqlite3
 import os
-from typing import List, Dict
-from config import DB_NAME
-from datetime import datetime
+import atexit
+import threading
+import time
+import queue
+import hashlib
+import html
+import json
+import logging
+import re
+import csv
+import io
+from concurrent.futures import Future
+from contextlib import contextmanager
+from itertools import islice
+from typing import List, Dict, Optional, Iterator, Iterable, Tuple, NamedTuple
+from config import (
+    DB_NAME, DB_READ_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_CACHE_SIZE_KB, DB_MMAP_SIZE,
+    DB_INSERT_BATCH_SIZE, DB_WRITE_QUEUE_SIZE, DB_READ_REPLICA, DB_REPLICA_REFRESH_SECONDS, ARCHIVE_DIR, ARCHIVE_AFTER_MONTHS,
+    ARCHIVE_RETENTION_MONTHS, ARCHIVE_RETENTION_ACTION, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL_SECONDS,
+    EXPORT_STREAM_BATCH_SIZE,
+    INTENT_CATEGORIES, DEPARTMENTS, PRIORITIES, SENTIMENTS,
+    DEFAULT_INTENT_CATEGORY, DEFAULT_DEPARTMENT, DEFAULT_PRIORITY, DEFAULT_SENTIMENT
+)
+from datetime import datetime, timezone
+from utils.compression import train_dictionary, compress_text, decompress_text
+
+logger = logging.getLogger(__name__)
+
+def open_connection(database: str, uri: bool = False) -> sqlite3.Connection:
+    """
+    Open a connection with the SQL functions the schema relies on.
+    
+    Every connection to a reception database goes through here, so views
+    such as tickets_full and the FTS index work on any of them.
+    """
+    conn = sqlite3.connect(database, uri=uri, check_same_thread=False, isolation_level=None)
+    register_functions(conn)
+    return conn
+
+def register_functions(conn: sqlite3.Connection):
+    """Register the SQL functions the schema relies on with a connection."""
+    # Decompresses ticket_bodies text inside SQL (tickets_full view, FTS);
+    # dictionaries are read through the same connection, so attached archive
+    # partitions and in-memory copies resolve their own
+    conn.create_function(
+        "ticket_text", 2,
+        lambda data, dict_id: _ticket_text(conn, data, dict_id),
+        deterministic=True
+    )
+
+class ConnectionManager:
+    """
+    Process-wide owner of the SQLite connections for one database file.
+    
+    Reads are served from a small pool of long-lived connections that are
+    checked out per operation (Streamlit runs every rerun on a fresh thread,
+    so a pool reuses connections where thread-locals would not). All writes
+    go through a single dedicated write connection guarded by a lock, which
+    keeps SQLite's one-writer rule inside the process instead of surfacing
+    as "database is locked" errors.
+    
+    With read_replica enabled, reader() serves every read from an in-memory
+    ReadReplica instead of the file.
+    """
+    
+    def __init__(self, db_name: str, read_pool_size: int = DB_READ_POOL_SIZE,
+                 read_replica: bool = False):
+        self.db_name = db_name
+        self.read_pool_size = read_pool_size
+        self.replica: Optional["ReadReplica"] = ReadReplica(self) if read_replica else None
+        self._pool: List[sqlite3.Connection] = []
+        self._dedicated: List[sqlite3.Connection] = []
+        self._pool_lock = threading.Lock()
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "read_checkouts": 0,
+            "read_reuses": 0,
+            "write_transactions": 0,
+            "write_reuses": 0,
+            "lock_waits": 0,
+            "lock_wait_seconds": 0.0,
+            "max_lock_wait_seconds": 0.0,
+        }
+    
+    def _bump(self, key: str, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+    
+    def _open(self) -> sqlite3.Connection:
+        """Open a connection and apply the tuning pragmas once."""
+        conn = open_connection(self.db_name)
+        conn.row_factory = sqlite3.Row  # This allows us to access columns by name
+        conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+        # Only takes effect before the first table exists, i.e. for new files;
+        # lets maintenance.incremental_vacuum() return free pages in small steps
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = {-int(DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        self._bump("connections_opened")
+        return conn
+    
+    def open_dedicated(self) -> sqlite3.Connection:
+        """
+        Open a tuned connection outside the pool for a long-lived single owner.
+        
+        It is closed together with the manager.
+        """
+        conn = self._open()
+        with self._pool_lock:
+            self._dedicated.append(conn)
+        return conn
+    
+    @contextmanager
+    def reader(self, primary: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        Check out a pooled read connection for the duration of the block.
+        
+        Args:
+            primary (bool): Read the database file even in replica mode, for
+                tables whose updates the replica does not follow
+        """
+        if self.replica is not None and not primary:
+            self._bump("read_checkouts")
+            with self.replica.reader() as conn:
+                yield conn
+            return
+        
+        conn = None
+        with self._pool_lock:
+            if self._pool:
+                conn = self._pool.pop()
+        if conn is None:
+            conn = self._open()
+        else:
+            self._bump("read_reuses")
+        self._bump("read_checkouts")
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._pool_lock:
+                if len(self._pool) < self.read_pool_size:
+                    self._pool.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+                self._bump("connections_closed")
+    
+    @contextmanager
+    def writer(self, attach: Optional[Dict[str, str]] = None) -> Iterator[sqlite3.Connection]:
+        """
+        Run the block inside a write transaction on the dedicated write connection.
+        
+        Commits on success and rolls back on error. Time spent waiting for the
+        in-process lock and for SQLite's write lock is recorded in the stats.
+        
+        Args:
+            attach (Optional[Dict[str, str]]): Schema alias -> database file to
+                ATTACH for the duration of the block. ATTACH is not allowed
+                inside a transaction, so it happens here, under the write lock
+        """
+        started = time.perf_counter()
+        with self._write_lock:
+            if self._write_conn is None:
+                self._write_conn = self._open()
+            else:
+                self._bump("write_reuses")
+            conn = self._write_conn
+            
+            with attached(conn, attach):
+                conn.execute("BEGIN IMMEDIATE")
+                
+                waited = time.perf_counter() - started
+                with self._stats_lock:
+                    self._stats["write_transactions"] += 1
+                    self._stats["lock_wait_seconds"] += waited
+                    if waited > 0.001:
+                        self._stats["lock_waits"] += 1
+                    if waited > self._stats["max_lock_wait_seconds"]:
+                        self._stats["max_lock_wait_seconds"] = waited
+                
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                else:
+                    conn.execute("COMMIT")
+            
+            if self.replica is not None:
+                self.replica.notify_commit()
+    
+    def invalidate_replica(self):
+        """
+        Tell the read replica that existing rows changed.
+        
+        New tickets are picked up incrementally; writes that update rows or
+        touch derived tables directly must call this so the copy is rebuilt.
+        """
+        if self.replica is not None:
+            self.replica.invalidate()
+    
+    def stats(self) -> Dict:
+        """Return a snapshot of connection and lock statistics."""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        with self._pool_lock:
+            snapshot["idle_read_connections"] = len(self._pool)
+        snapshot["write_connection_open"] = self._write_conn is not None
+        if self.replica is not None:
+            snapshot["replica"] = self.replica.stats()
+        return snapshot
+    
+    def health(self) -> Dict:
+        """Run a trivial query and report the effective journal mode and stats."""
+        try:
+            with self.reader() as conn:
+                conn.execute("SELECT 1").fetchone()
+                journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            return {"ok": True, "journal_mode": journal_mode, **self.stats()}
+        except sqlite3.Error as e:
+            return {"ok": False, "error": str(e), **self.stats()}
+    
+    def close(self):
+        """Close every connection owned by this manager."""
+        if self.replica is not None:
+            self.replica.close()
+        with self._pool_lock:
+            pool, self._pool = self._pool, []
+            pool.extend(self._dedicated)
+            self._dedicated = []
+        for conn in pool:
+            conn.close()
+            self._bump("connections_closed")
+        with self._write_lock:
+            if self._write_conn is not None:
+                self._write_conn.close()
+                self._write_conn = None
+                self._bump("connections_closed")
+
+class ReadReplica:
+    """
+    In-memory copy of the database that serves all reads in replica mode.
+    
+    The copy is a shared-cache memory database built with the sqlite3 backup
+    API, so reads never touch the file or its locks. A background thread
+    keeps it current: tickets with new ids (and their bodies) are copied over
+    incrementally, which also fires the copy's own FTS and rollup triggers;
+    any other change (deletes, archiving, migrations) rebuilds a fresh copy
+    and swaps it in while readers of the old one finish undisturbed.
+    
+    Readers use read_uncommitted, so an incremental refresh never blocks
+    them; a reader may briefly see a ticket whose body is still arriving.
+    """
+    
+    def __init__(self, manager: "ConnectionManager", refresh_seconds: float = DB_REPLICA_REFRESH_SECONDS):
+        self.manager = manager
+        self.refresh_seconds = refresh_seconds
+        self.version = 0
+        self._source: Optional[sqlite3.Connection] = None
+        self._anchor: Optional[sqlite3.Connection] = None
+        self._uri: Optional[str] = None
+        self._pool: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self._invalid = True
+        self._source_version = None
+        self._max_id = 0
+        self._count = 0
+        self._pending_since: Optional[float] = None
+        self._stats = {
+            "rebuilds": 0,
+            "incremental_refreshes": 0,
+            "rows_replicated": 0,
+            "last_refresh_seconds": 0.0,
+            "last_lag_seconds": 0.0,
+            "max_lag_seconds": 0.0,
+        }
+    
+    def _connect(self, uri: str) -> sqlite3.Connection:
+        conn = open_connection(uri, uri=True)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA read_uncommitted = 1")
+        return conn
+    
+    def _ensure_started(self):
+        if self._anchor is None:
+            self.refresh()
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="read-replica", daemon=True)
+                self._thread.start()
+    
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Check out a connection to the current in-memory copy."""
+        self._ensure_started()
+        with self._lock:
+            uri = self._uri
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._connect(uri)
+        
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                # Connections to a replaced copy are dropped, which frees it
+                if uri == self._uri and len(self._pool) < self.manager.read_pool_size:
+                    self._pool.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+    
+    def notify_commit(self):
+        """Record that the file changed and wake the refresh thread."""
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+        self._wakeup.set()
+    
+    def invalidate(self):
+        """Force the next refresh to rebuild the copy from scratch."""
+        self._invalid = True
+        self.notify_commit()
+    
+    def refresh(self) -> int:
+        """
+        Bring the copy up to date with the file.
+        
+        Returns:
+            int: Number of tickets copied (all of them on a rebuild)
+        """
+        with self._refresh_lock:
+            with self._lock:
+                pending_since, self._pending_since = self._pending_since, None
+            started = time.perf_counter()
+            try:
+                if self._source is None:
+                    self._source = self.manager.open_dedicated()
+                self._source_version = self._source.execute("PRAGMA data_version").fetchone()[0]
+                
+                copied = None if self._invalid or self._anchor is None else self._apply_new_tickets()
+                if copied is None:
+                    copied = self._rebuild()
+            except BaseException:
+                with self._lock:
+                    if self._pending_since is None:
+                        self._pending_since = pending_since
+                raise
+            
+            lag = time.monotonic() - pending_since if pending_since is not None else 0.0
+            self.version += 1
+            self._stats["rows_replicated"] += copied
+            self._stats["last_refresh_seconds"] = time.perf_counter() - started
+            self._stats["last_lag_seconds"] = lag
+            self._stats["max_lag_seconds"] = max(self._stats["max_lag_seconds"], lag)
+            return copied
+    
+    def _rebuild(self) -> int:
+        uri = f"file:replica_{id(self)}_{self._stats['rebuilds']}?mode=memory&cache=shared"
+        anchor = self._connect(uri)
+        self._source.backup(anchor)
+        self._max_id, self._count = anchor.execute(
+            "SELECT COALESCE(MAX(id), 0), COUNT(*) FROM tickets"
+        ).fetchone()
+        
+        with self._lock:
+            old_anchor, old_pool = self._anchor, self._pool
+            self._anchor, self._uri, self._pool = anchor, uri, []
+        for conn in old_pool + ([old_anchor] if old_anchor else []):
+            conn.close()
+        
+        self._invalid = False
+        self._stats["rebuilds"] += 1
+        return self._count
+    
+    def _apply_new_tickets(self) -> Optional[int]:
+        """Copy tickets with ids above the copy's newest; None if a rebuild is needed."""
+        source = self._source
+        source.execute("BEGIN")
+        try:
+            max_id, count = source.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM tickets").fetchone()
+            if (max_id, count) == (self._max_id, self._count):
+                return 0
+            tickets = source.execute(
+                f"SELECT {TICKET_COLUMNS} FROM tickets WHERE id > ? ORDER BY id", (self._max_id,)
+            ).fetchall()
+            if count != self._count + len(tickets):
+                # Rows were deleted as well; only a new copy can reflect that
+                return None
+            bodies = source.execute(
+                "SELECT ticket_id, dict_id, transcript, summary_full FROM ticket_bodies WHERE ticket_id > ?",
+                (self._max_id,)
+            ).fetchall()
+            dicts = source.execute("SELECT id, created_at, data FROM compression_dicts").fetchall()
+        finally:
+            source.execute("COMMIT")
+        
+        placeholders = ", ".join("?" * len(TICKET_COLUMNS.split(",")))
+        anchor = self._anchor
+        anchor.execute("BEGIN IMMEDIATE")
+        try:
+            anchor.executemany("INSERT OR IGNORE INTO compression_dicts VALUES (?, ?, ?)", dicts)
+            anchor.executemany(f"INSERT INTO tickets ({TICKET_COLUMNS}) VALUES ({placeholders})", tickets)
+            anchor.executemany(INSERT_BODY_SQL, bodies)
+        except BaseException:
+            anchor.execute("ROLLBACK")
+            raise
+        anchor.execute("COMMIT")
+        
+        self._max_id, self._count = max_id, count
+        self._stats["incremental_refreshes"] += 1
+        return len(tickets)
+    
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.refresh_seconds)
+            self._wakeup.clear()
+            if self._closed:
+                return
+            try:
+                # Commits made by other processes only show up here
+                changed = self._source.execute("PRAGMA data_version").fetchone()[0] != self._source_version
+                if changed or self._pending_since is not None:
+                    self.refresh()
+            except sqlite3.Error:
+                # The next wakeup retries; the copy keeps serving meanwhile
+                continue
+    
+    def lag_seconds(self) -> float:
+        """Age of the oldest commit not yet applied to the copy (0 when current)."""
+        pending_since = self._pending_since
+        return time.monotonic() - pending_since if pending_since is not None else 0.0
+    
+    def stats(self) -> Dict:
+        """Return refresh counts and replication lag metrics."""
+        return {
+            **self._stats,
+            "version": self.version,
+            "max_ticket_id": self._max_id,
+            "lag_seconds": self.lag_seconds(),
+        }
+    
+    def close(self):
+        """Stop the refresh thread and free the in-memory copy."""
+        self._closed = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(5)
+        with self._refresh_lock, self._lock:
+            conns = self._pool + ([self._anchor] if self._anchor else [])
+            self._pool, self._anchor, self._uri = [], None, None
+        for conn in conns:
+            conn.close()
+
+@contextmanager
+def attached(conn: sqlite3.Connection, databases: Optional[Dict[str, str]]) -> Iterator[sqlite3.Connection]:
+    """
+    ATTACH database files to a connection for the duration of the block.
+    
+    Args:
+        conn (sqlite3.Connection): Connection outside any transaction
+        databases (Optional[Dict[str, str]]): Schema alias -> database file
+    """
+    aliases = []
+    try:
+        for alias, path in (databases or {}).items():
+            conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+            aliases.append(alias)
+        yield conn
+    finally:
+        for alias in reversed(aliases):
+            conn.execute("DETACH DATABASE " + alias)
+
+_manager: Optional[ConnectionManager] = None
+_manager_lock = threading.Lock()
+
+def get_connection_manager() -> ConnectionManager:
+    """
+    Return the process-wide connection manager, creating it on first use.
+    
+    The manager is rebuilt if DB_NAME has been pointed at a different file.
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None or _manager.db_name != DB_NAME:
+            if _manager is not None:
+                _manager.close()
+            _manager = ConnectionManager(DB_NAME, read_replica=DB_READ_REPLICA)
+        return _manager
+
+def close_connections():
+    """Close all pooled connections (called automatically at exit)."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+
+atexit.register(close_connections)
+
+def get_db_stats() -> Dict:
+    """
+    Get connection statistics for the current database.
+    
+    Returns:
+        Dict: Connections opened/closed, reuse counts and lock wait times
+    """
+    return get_connection_manager().stats()
+
+def sync_read_replica() -> int:
+    """
+    Bring the in-memory read replica up to date now, for read-your-writes.
+    
+    Returns:
+        int: Number of tickets copied; 0 when replica mode is off
+    """
+    replica = get_connection_manager().replica
+    return replica.refresh() if replica is not None else 0
+
+def check_db_health() -> Dict:
+    """
+    Check that the database is reachable and report its statistics.
+    
+    Returns:
+        Dict: Health flag, journal mode and connection statistics
+    """
+    return get_connection_manager().health()
+
+# Index name -> indexed columns, created idempotently by init_db()
+TICKET_INDEXES = {
+    "idx_tickets_created_at": "created_at",
+    "idx_tickets_department_created_at": "department, created_at",
+    "idx_tickets_priority_created_at": "priority, created_at",
+    "idx_tickets_created_at_ms": "created_at_ms",
+}
+
+# Categorical ticket columns, stored as small integer codes. A value's code
+# is its position in the config.py list, so PRIORITIES (listed low to
+# critical) sorts by urgency with a plain ORDER BY priority DESC.
+ENUM_COLUMNS = {
+    "intent_category": INTENT_CATEGORIES,
+    "department": DEPARTMENTS,
+    "priority": PRIORITIES,
+    "sentiment": SENTIMENTS,
+}
+
+# Stored in place of a value that is not in the column's list
+ENUM_DEFAULTS = {
+    "intent_category": DEFAULT_INTENT_CATEGORY,
+    "department": DEFAULT_DEPARTMENT,
+    "priority": DEFAULT_PRIORITY,
+    "sentiment": DEFAULT_SENTIMENT,
+}
+
+_ENUM_CODES = {
+    column: {name: code for code, name in enumerate(values)}
+    for column, values in ENUM_COLUMNS.items()
+}
+
+def _fold(value) -> str:
+    """Comparison key for enum names: casefolded, with spaces and hyphens as underscores."""
+    return re.sub(r"[\s-]+", "_", str(value).strip()).casefold()
+
+_ENUM_FOLDED = {
+    column: {_fold(name): name for name in values}
+    for column, values in ENUM_COLUMNS.items()
+}
+
+def match_enum(column: str, value) -> Optional[str]:
+    """
+    The config.py name a categorical value stands for, or None.
+    
+    Case, surrounding whitespace and spaces or hyphens in place of
+    underscores are ignored, so "High" and "Billing Issue" match.
+    """
+    if value is None:
+        return None
+    return _ENUM_FOLDED[column].get(_fold(value))
+
+def normalize_enum(column: str, value) -> str:
+    """match_enum(), with values outside the list replaced by ENUM_DEFAULTS[column]."""
+    name = match_enum(column, value)
+    if name is None:
+        name = ENUM_DEFAULTS[column]
+        logger.warning("Unknown %s %r stored as %r", column, value, name)
+    return name
+
+def _encode(column: str, value: str) -> int:
+    """Code for an enum value being stored; unknown values get the column's default."""
+    return _ENUM_CODES[column][normalize_enum(column, value)]
+
+def _filter_code(column: str, value: str) -> int:
+    """Code for an enum value used as a filter; unknown values match nothing."""
+    return _ENUM_CODES[column].get(match_enum(column, value), -1)
+
+def _decode(column: str, code: Optional[int]) -> Optional[str]:
+    """Name of a stored enum code."""
+    return ENUM_COLUMNS[column][code] if code is not None else None
+
+# Every tickets column, for copying rows between databases with ids kept
+TICKET_COLUMNS = (
+    "id, created_at, caller_name, caller_contact, intent_category, department, "
+    "priority, sentiment, summary_short, created_at_ms"
+)
+
+# Column list matching the TicketSummary fields (snippet is added per query)
+SUMMARY_COLUMNS = "t.id, t.created_at, t.created_at_ms, t.caller_name, t.intent_category, t.department, t.priority"
+
+# Hot read queries and the index each one must be served by.
+# check_query_plans() verifies these so a schema change cannot silently
+# turn them back into full scans plus a sort.
+HOT_QUERIES = {
+    "recent_tickets": (
+        "SELECT * FROM tickets_full ORDER BY created_at DESC LIMIT ?",
+        (5,),
+        "idx_tickets_created_at",
+    ),
+    "tickets_by_department": (
+        "SELECT * FROM tickets WHERE department = ? ORDER BY created_at DESC LIMIT ?",
+        (_filter_code("department", "General"), 10),
+        "idx_tickets_department_created_at",
+    ),
+    "tickets_by_priority": (
+        "SELECT * FROM tickets WHERE priority = ? ORDER BY created_at DESC LIMIT ?",
+        (_filter_code("priority", "high"), 10),
+        "idx_tickets_priority_created_at",
+    ),
+    "urgent_tickets": (
+        f"SELECT {SUMMARY_COLUMNS} FROM tickets t ORDER BY t.priority DESC, t.created_at DESC LIMIT ?",
+        (10,),
+        "idx_tickets_priority_created_at",
+    ),
+    "tickets_page_after_cursor": (
+        f"SELECT {SUMMARY_COLUMNS} FROM tickets t WHERE 1 = 1 AND (t.created_at, t.id) < (?, ?) "
+        "ORDER BY t.created_at DESC, t.id DESC LIMIT ?",
+        ("2100-01-01", 1, 11),
+        "idx_tickets_created_at",
+    ),
+    "department_page_after_cursor": (
+        f"SELECT {SUMMARY_COLUMNS} FROM tickets t WHERE 1 = 1 AND t.department = ? AND (t.created_at, t.id) < (?, ?) "
+        "ORDER BY t.created_at DESC, t.id DESC LIMIT ?",
+        (_filter_code("department", "General"), "2100-01-01", 1, 11),
+        "idx_tickets_department_created_at",
+    ),
+    "tickets_between": (
+        f"SELECT {SUMMARY_COLUMNS} FROM tickets t WHERE t.created_at_ms >= ? AND t.created_at_ms < ? "
+        "ORDER BY t.created_at_ms DESC, t.id DESC LIMIT ?",
+        (0, 1, -1),
+        "idx_tickets_created_at_ms",
+    ),
+}
+
+def _create_tickets_table(cursor: sqlite3.Cursor, schema: str = "main", name: str = "tickets"):
+    """Create the tickets table in the given (possibly attached) schema."""
+    enums = {
+        column: f"INTEGER NOT NULL CHECK ({column} IN ({', '.join(str(code) for code in range(len(values)))}))"
+        for column, values in ENUM_COLUMNS.items()
+    }
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.{name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            caller_name TEXT,
+            caller_contact TEXT,
+            intent_category {enums["intent_category"]},
+            department {enums["department"]},
+            priority {enums["priority"]},
+            sentiment {enums["sentiment"]},
+            summary_short TEXT NOT NULL,
+            created_at_ms INTEGER
+        )
+    ''')
+
+def _init_enum_tables(cursor: sqlite3.Cursor, schema: str = "main") -> bool:
+    """
+    Generate the enum lookup tables from config.py and encode tickets to match.
+    
+    The enum_<column> tables (code -> name) let SQL, e.g. the tickets_full
+    view, decode the integer columns. When tickets still has TEXT columns,
+    or a config list changed since the codes were assigned, the table is
+    rebuilt with every value re-encoded and CHECK constraints matching the
+    new lists.
+    
+    Returns:
+        bool: True if tickets was rebuilt
+    
+    Raises:
+        ValueError: If a stored value is missing from config.py
+    """
+    column_types = {row["name"]: row["type"] for row in cursor.execute(f"PRAGMA {schema}.table_info(tickets)")}
+    # SQL giving the name of each stored value, whatever the current encoding
+    stored_names = {}
+    rebuild = False
+    for column, values in ENUM_COLUMNS.items():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {schema}.enum_{column} (
+                code INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        if column_types[column] != "INTEGER":
+            stored_names[column] = f"t.{column}"
+            rebuild = True
+        else:
+            stored_names[column] = f"(SELECT name FROM {schema}.enum_{column} WHERE code = t.{column})"
+            current = [row["name"] for row in cursor.execute(f"SELECT name FROM {schema}.enum_{column} ORDER BY code")]
+            if current and current != list(values):
+                rebuild = True
+    
+    if rebuild:
+        _rebuild_enum_columns(cursor, schema, stored_names)
+    
+    for column, values in ENUM_COLUMNS.items():
+        cursor.execute(f"DELETE FROM {schema}.enum_{column}")
+        cursor.executemany(f"INSERT INTO {schema}.enum_{column} (code, name) VALUES (?, ?)", enumerate(values))
+    return rebuild
+
+def _rebuild_enum_columns(cursor: sqlite3.Cursor, schema: str, stored_names: Dict[str, str]):
+    """Copy tickets into a table with freshly encoded enum columns, keeping ids."""
+    encoded = {}
+    for column, values in ENUM_COLUMNS.items():
+        cases = " ".join(f"WHEN ? THEN {code}" for code in range(len(values)))
+        encoded[column] = (f"CASE {stored_names[column]} {cases} END", list(values))
+        unknown = [row[0] for row in cursor.execute(
+            f"SELECT DISTINCT {stored_names[column]} FROM {schema}.tickets t WHERE {encoded[column][0]} IS NULL",
+            values
+        )]
+        if unknown:
+            raise ValueError(f"Cannot encode {column} values {unknown}: add them to config.py")
+    
+    select, params = [], []
+    for column in TICKET_COLUMNS.split(", "):
+        if column in encoded:
+            select.append(encoded[column][0])
+            params.extend(encoded[column][1])
+        else:
+            select.append(f"t.{column}")
+    
+    sequence = cursor.execute(
+        f"SELECT seq FROM {schema}.sqlite_sequence WHERE name = 'tickets'"
+    ).fetchone()
+    
+    # The view is recreated by init; triggers on tickets go with the table
+    # and are recreated too. Triggers on other tables that name tickets are
+    # kept as they are, so the rename must not try to rewrite them.
+    cursor.execute(f"DROP VIEW IF EXISTS {schema}.tickets_full")
+    _create_tickets_table(cursor, schema, "tickets_encoded")
+    cursor.execute(f'''
+        INSERT INTO {schema}.tickets_encoded ({TICKET_COLUMNS})
+        SELECT {", ".join(select)} FROM {schema}.tickets t
+    ''', params)
+    cursor.execute(f"DROP TABLE {schema}.tickets")
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        cursor.execute(f"ALTER TABLE {schema}.tickets_encoded RENAME TO tickets")
+    finally:
+        cursor.execute("PRAGMA legacy_alter_table = OFF")
+    if sequence is not None:
+        cursor.execute(f"UPDATE {schema}.sqlite_sequence SET seq = ? WHERE name = 'tickets'", (sequence[0],))
+
+def _create_ticket_indexes(cursor: sqlite3.Cursor, schema: str = "main"):
+    """
+    Create the secondary indexes for the list views: newest first, optionally
+    narrowed to one department or priority.
+    """
+    for name, columns in TICKET_INDEXES.items():
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.{name} ON tickets ({columns})')
 
 def init_db():
     """Initialize the SQLite database with the tickets table."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    with get_connection_manager().writer() as conn:
+        cursor = conn.cursor()
+        
+        # Create tickets table
+        _create_tickets_table(cursor)
+        
+        # Databases created before created_at_ms existed get the column added;
+        # their rows are backfilled in the background by migrate_created_at_ms()
+        existing_columns = {row["name"] for row in cursor.execute("PRAGMA table_info(tickets)")}
+        if "created_at_ms" not in existing_columns:
+            cursor.execute("ALTER TABLE tickets ADD COLUMN created_at_ms INTEGER")
+        
+        _init_ticket_bodies(cursor, get_connection_manager().db_name)
+        if _init_enum_tables(cursor):
+            # Rollups keyed by the old encoding are rebuilt from the new one
+            cursor.execute("DROP TABLE IF EXISTS ticket_rollups")
+            reencoded = True
+        else:
+            reencoded = False
+        _create_tickets_full_view(cursor)
+        _create_ticket_indexes(cursor)
+        reindexed = _init_search_index(cursor)
+        _init_rollups(cursor)
+        _init_audio_hashes(cursor)
+        _init_analysis_cache(cursor)
+        needs_backfill = cursor.execute(
+            "SELECT 1 FROM tickets WHERE created_at_ms IS NULL LIMIT 1"
+        ).fetchone() is not None
+    
+    # The schema may have changed under an existing replica
+    get_connection_manager().invalidate_replica()
+    if reencoded:
+        _upgrade_archive_partitions()
+    elif reindexed:
+        _reindex_archive_partitions()
+    if needs_backfill:
+        start_created_at_backfill(DB_NAME)
+
+# Preset compression dictionaries by id. Dictionaries are immutable and their
+# id is derived from their content, so one cache serves every database.
+_zdicts: Dict[int, bytes] = {}
+# Database file -> id of the dictionary new tickets are compressed with
+_active_zdict_ids: Dict[str, Optional[int]] = {}
+_zdict_lock = threading.Lock()
+
+# Minimum number of texts needed before a dictionary is worth training
+MIN_DICTIONARY_SAMPLES = 50
+
+def _get_zdict(conn: sqlite3.Connection, dict_id: Optional[int]) -> Optional[bytes]:
+    """
+    Return a compression dictionary by id, loading it once per process.
+    
+    The dictionary is read through conn, from whichever of its main or
+    attached databases has it; ids are derived from the content, so one
+    process-wide cache serves every file.
+    """
+    if dict_id is None:
+        return None
+    zdict = _zdicts.get(dict_id)
+    if zdict is None:
+        row = None
+        for schema in [r[1] for r in conn.execute("PRAGMA database_list").fetchall()]:
+            try:
+                row = conn.execute(
+                    f"SELECT data FROM {schema}.compression_dicts WHERE id = ?", (dict_id,)
+                ).fetchone()
+            except sqlite3.OperationalError:
+                continue  # No compression_dicts in this schema
+            if row is not None:
+                break
+        if row is None:
+            raise LookupError(f"Compression dictionary {dict_id} not found")
+        with _zdict_lock:
+            zdict = _zdicts.setdefault(dict_id, row[0])
+    return zdict
+
+def _ticket_text(conn: sqlite3.Connection, data: Optional[bytes], dict_id: Optional[int]) -> Optional[str]:
+    """SQL function ticket_text(): decompress one ticket_bodies column."""
+    if data is None:
+        return None
+    return decompress_text(data, _get_zdict(conn, dict_id))
+
+def _active_zdict(db_name: str) -> Tuple[Optional[int], Optional[bytes]]:
+    """Return the (id, dictionary) new ticket bodies are compressed with."""
+    with get_connection_manager().reader() as conn:
+        if db_name not in _active_zdict_ids:
+            row = conn.execute(
+                "SELECT id FROM compression_dicts ORDER BY created_at DESC LIMIT 1"
+            ).fetchone()
+            with _zdict_lock:
+                _active_zdict_ids.setdefault(db_name, row["id"] if row else None)
+        dict_id = _active_zdict_ids[db_name]
+        return dict_id, _get_zdict(conn, dict_id)
+
+def _store_zdict(cursor: sqlite3.Cursor, zdict: bytes, db_name: str) -> int:
+    """Save a dictionary and make it the active one for new tickets."""
+    dict_id = int.from_bytes(hashlib.sha256(zdict).digest()[:7], "big")
+    cursor.execute(
+        "INSERT OR IGNORE INTO compression_dicts (id, created_at, data) VALUES (?, ?, ?)",
+        (dict_id, datetime.now().isoformat(), zdict)
+    )
+    with _zdict_lock:
+        _zdicts[dict_id] = zdict
+        _active_zdict_ids[db_name] = dict_id
+    return dict_id
+
+def _init_ticket_bodies(cursor: sqlite3.Cursor, db_name: str, schema: str = "main"):
+    """
+    Create the cold-storage side of tickets.
+    
+    transcript and summary_full are large, rarely read and highly repetitive,
+    so they live compressed in ticket_bodies rather than in tickets, keeping
+    the rows scanned by list views and filters small. tickets_full joins the
+    two back together with the text decompressed (see
+    _create_tickets_full_view()). schema selects an attached database, e.g.
+    an archive partition.
+    """
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.compression_dicts (
+            id INTEGER PRIMARY KEY,
+            created_at TEXT NOT NULL,
+            data BLOB NOT NULL
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.ticket_bodies (
+            ticket_id INTEGER PRIMARY KEY,
+            dict_id INTEGER,
+            transcript BLOB NOT NULL,
+            summary_full BLOB NOT NULL
+        )
+    ''')
+    
+    existing_columns = {row["name"] for row in cursor.execute(f"PRAGMA {schema}.table_info(tickets)")}
+    if "transcript" in existing_columns:
+        _migrate_ticket_bodies(cursor, db_name)
+
+def _create_tickets_full_view(cursor: sqlite3.Cursor, schema: str = "main"):
+    """
+    Create tickets_full: tickets with decompressed bodies and enum names.
+    
+    The enum names come from correlated lookups rather than joins, so the
+    view keeps tickets as the outer loop and its created_at index ordering.
+    """
+    def enum_name(column):
+        return f"(SELECT name FROM enum_{column} WHERE code = t.{column}) AS {column}"
+    
+    cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS {schema}.tickets_full AS
+        SELECT t.id, t.created_at, t.caller_name, t.caller_contact,
+               {enum_name("intent_category")},
+               {enum_name("department")},
+               {enum_name("priority")},
+               {enum_name("sentiment")},
+               ticket_text(b.transcript, b.dict_id) AS transcript,
+               t.summary_short,
+               ticket_text(b.summary_full, b.dict_id) AS summary_full,
+               t.created_at_ms
+        FROM tickets t
+        LEFT JOIN ticket_bodies b ON b.ticket_id = t.id
+    ''')
+
+def _migrate_ticket_bodies(cursor: sqlite3.Cursor, db_name: str, batch_size: int = 1000):
+    """
+    Move transcript and summary_full out of tickets into ticket_bodies.
+    
+    Trains a dictionary on the most recent tickets, compresses every body in
+    id-ordered batches, then drops the two columns from tickets. The old
+    full-text index read its text from tickets, so it is dropped here and
+    rebuilt from tickets_full by _init_search_index().
+    """
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS tickets_fts")
+    
+    samples = cursor.execute(
+        "SELECT transcript, summary_full FROM tickets ORDER BY id DESC LIMIT 1000"
+    ).fetchall()
+    dict_id, zdict = None, None
+    if len(samples) >= MIN_DICTIONARY_SAMPLES:
+        zdict = train_dictionary(text for row in samples for text in row)
+        dict_id = _store_zdict(cursor, zdict, db_name)
+    
+    last_id = 0
+    while True:
+        rows = cursor.execute(
+            "SELECT id, transcript, summary_full FROM tickets WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        cursor.executemany(
+            "INSERT OR REPLACE INTO ticket_bodies (ticket_id, dict_id, transcript, summary_full) VALUES (?, ?, ?, ?)",
+            [
+                (row["id"], dict_id, compress_text(row["transcript"], zdict), compress_text(row["summary_full"], zdict))
+                for row in rows
+            ]
+        )
+        last_id = rows[-1]["id"]
+    
+    cursor.execute("ALTER TABLE tickets DROP COLUMN transcript")
+    cursor.execute("ALTER TABLE tickets DROP COLUMN summary_full")
+
+def train_compression_dict(sample_size: int = 1000) -> Optional[int]:
+    """
+    Train a new compression dictionary from the most recent tickets.
+    
+    Tickets written afterwards are compressed with it; older tickets keep
+    the dictionary they were written with.
+    
+    Args:
+        sample_size (int): Number of recent tickets to learn from
+        
+    Returns:
+        Optional[int]: The new dictionary id, or None if there are too few tickets
+    """
+    manager = get_connection_manager()
+    with manager.reader() as conn:
+        samples = conn.execute(
+            "SELECT transcript, summary_full FROM tickets_full ORDER BY id DESC LIMIT ?",
+            (sample_size,)
+        ).fetchall()
+    if len(samples) < MIN_DICTIONARY_SAMPLES:
+        return None
+    
+    zdict = train_dictionary(text for row in samples for text in row)
+    with manager.writer() as conn:
+        return _store_zdict(conn.cursor(), zdict, manager.db_name)
+
+# Columns covered by the full-text index, in tickets_fts column order
+FTS_COLUMNS = [
+    "caller_name", "caller_contact", "transcript", "summary_short", "summary_full",
+    "intent_category", "department"
+]
+
+# bm25 weight per FTS column: caller details and the short summary are
+# stronger signals than a passing mention in a long transcript
+FTS_WEIGHTS = [5.0, 5.0, 1.0, 2.0, 1.0, 3.0, 3.0]
+
+# Search index triggers, dropped with the index when its columns change
+FTS_TRIGGERS = ["tickets_fts_ai", "tickets_fts_ad", "tickets_fts_au", "ticket_bodies_fts_au"]
+
+def _init_search_index(cursor: sqlite3.Cursor, schema: str = "main") -> bool:
+    """
+    Create the FTS5 index over tickets and the triggers that keep it in sync.
+    
+    The index uses the tickets_full view as external content, so the text is
+    stored once (compressed, in ticket_bodies). Intent and department are
+    indexed by name, decoded from their enum codes. An existing database is
+    backfilled the first time the index is created, and an index built with
+    other columns is dropped and rebuilt.
+    
+    Returns:
+        bool: True if the index was (re)built from existing tickets
+    """
+    indexed = [row["name"] for row in cursor.execute(f"PRAGMA {schema}.table_info(tickets_fts)")]
+    if indexed and indexed != FTS_COLUMNS:
+        for trigger in FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {schema}.{trigger}")
+        cursor.execute(f"DROP TABLE {schema}.tickets_fts")
+        indexed = []
+    
+    columns = ", ".join(FTS_COLUMNS)
+    
+    def indexed_values(ticket, body):
+        return (
+            f"{ticket}.caller_name, {ticket}.caller_contact, "
+            f"ticket_text({body}.transcript, {body}.dict_id), {ticket}.summary_short, "
+            f"ticket_text({body}.summary_full, {body}.dict_id), "
+            f"(SELECT name FROM enum_intent_category WHERE code = {ticket}.intent_category), "
+            f"(SELECT name FROM enum_department WHERE code = {ticket}.department)"
+        )
+    
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.tickets_fts USING fts5(
+            {columns},
+            content='tickets_full',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    
+    # A ticket is indexed once its body row exists (it is written second)
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}.tickets_fts_ai AFTER INSERT ON ticket_bodies BEGIN
+            INSERT INTO tickets_fts (rowid, {columns})
+            SELECT t.id, {indexed_values("t", "new")} FROM tickets t WHERE t.id = new.ticket_id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}.tickets_fts_ad AFTER DELETE ON tickets BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, {columns})
+            SELECT 'delete', old.id, {indexed_values("old", "b")} FROM ticket_bodies b WHERE b.ticket_id = old.id;
+            DELETE FROM ticket_bodies WHERE ticket_id = old.id;
+        END
+    ''')
+    # Only re-index when an indexed column changes, so metadata backfills
+    # and migrations do not rewrite the full-text index row by row
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}.tickets_fts_au
+        AFTER UPDATE OF caller_name, caller_contact, summary_short, intent_category, department ON tickets BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, {columns})
+            SELECT 'delete', old.id, {indexed_values("old", "b")} FROM ticket_bodies b WHERE b.ticket_id = old.id;
+            INSERT INTO tickets_fts (rowid, {columns})
+            SELECT new.id, {indexed_values("new", "b")} FROM ticket_bodies b WHERE b.ticket_id = new.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {schema}.ticket_bodies_fts_au
+        AFTER UPDATE OF transcript, summary_full, dict_id ON ticket_bodies BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, {columns})
+            SELECT 'delete', t.id, {indexed_values("t", "old")} FROM tickets t WHERE t.id = old.ticket_id;
+            INSERT INTO tickets_fts (rowid, {columns})
+            SELECT t.id, {indexed_values("t", "new")} FROM tickets t WHERE t.id = new.ticket_id;
+        END
+    ''')
+    
+    if not indexed:
+        cursor.execute(f"INSERT INTO {schema}.tickets_fts (tickets_fts) VALUES ('rebuild')")
+    return not indexed
+
+def _fts_match_expression(query: str) -> str:
+    """
+    Turn free text typed into a search box into a safe FTS5 MATCH expression.
+    
+    Every word becomes a quoted prefix term, so "jo smi" matches "John Smith"
+    and FTS5 operators or stray quotes in the input cannot cause syntax errors.
+    """
+    terms = []
+    for word in (query or "").split():
+        word = word.replace('"', '')
+        if word:
+            terms.append(f'"{word}"*')
+    return " ".join(terms)
+
+# Dimensions of the ticket_rollups table, in primary key order
+ROLLUP_DIMENSIONS = ["day", "department", "priority", "sentiment", "intent_category"]
+
+def _rollup_day_sql(ref: str = "") -> str:
+    """
+    SQL for the rollup day of a tickets row: its UTC calendar date.
+    
+    Taken from created_at_ms, so it agrees with range queries; rows the
+    backfill has not reached yet convert their local created_at instead,
+    and an unparseable created_at keeps its first ten characters.
+    """
+    return (f"COALESCE(date({ref}created_at_ms / 1000, 'unixepoch'), "
+            f"date({ref}created_at, 'utc'), substr({ref}created_at, 1, 10))")
+
+def _init_audio_hashes(cursor: sqlite3.Cursor):
+    """
+    Create the audio_hashes table: SHA-256 of a recording -> its ticket.
+    
+    A side table rather than a tickets column, so archive partitions and
+    the read replica's incremental copy are unaffected. Rows whose ticket
+    has been deleted are simply misses (see find_ticket_by_audio_hash()).
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audio_hashes (
+            audio_hash TEXT PRIMARY KEY,
+            ticket_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+def _init_analysis_cache(cursor: sqlite3.Cursor):
+    """
+    Create the analysis_cache table used by analysis_cache.AnalysisCache.
+    
+    Keyed by the hash of a transcript, model and prompt version; created_at
+    drives TTL expiry and last_used_at the least-recently-used trimming.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key TEXT PRIMARY KEY,
+            analysis TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_created_at ON analysis_cache (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_used ON analysis_cache (last_used_at)")
+
+def _init_rollups(cursor: sqlite3.Cursor):
+    """
+    Create the ticket_rollups table and the triggers that maintain it.
+    
+    Each row counts tickets for one day x department x priority x sentiment
+    x intent, so dashboard counts cost O(groups) instead of O(tickets). The
+    triggers keep it exact on insert, delete and re-categorisation; an
+    existing database is backfilled once when the table is first created.
+    Rollups from before days were UTC (keyed by the local created_at date)
+    are rebuilt.
+    """
+    trigger = cursor.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'ticket_rollups_ai'"
+    ).fetchone()
+    if trigger is not None and "created_at_ms" not in trigger[0]:
+        for name in ["ticket_rollups_ai", "ticket_rollups_ad", "ticket_rollups_au"]:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute("DROP TABLE ticket_rollups")
+    
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ticket_rollups'"
+    ).fetchone()
+    
+    dimensions = ", ".join(ROLLUP_DIMENSIONS)
+    cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS ticket_rollups (
+            day TEXT NOT NULL,
+            department INTEGER NOT NULL,
+            priority INTEGER NOT NULL,
+            sentiment INTEGER NOT NULL,
+            intent_category INTEGER NOT NULL,
+            ticket_count INTEGER NOT NULL,
+            PRIMARY KEY ({dimensions})
+        ) WITHOUT ROWID
+    ''')
+    
+    def increment(ref):
+        return f'''
+            INSERT INTO ticket_rollups ({dimensions}, ticket_count)
+            VALUES ({_rollup_day_sql(ref + ".")}, {ref}.department, {ref}.priority,
+                    {ref}.sentiment, {ref}.intent_category, 1)
+            ON CONFLICT ({dimensions}) DO UPDATE SET ticket_count = ticket_count + 1;
+        '''
+    
+    def decrement(ref):
+        match = f'''
+            day = {_rollup_day_sql(ref + ".")} AND department = {ref}.department
+            AND priority = {ref}.priority AND sentiment = {ref}.sentiment
+            AND intent_category = {ref}.intent_category
+        '''
+        return f'''
+            UPDATE ticket_rollups SET ticket_count = ticket_count - 1 WHERE {match};
+            DELETE FROM ticket_rollups WHERE ticket_count <= 0 AND {match};
+        '''
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ticket_rollups_ai AFTER INSERT ON tickets BEGIN
+            {increment("new")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ticket_rollups_ad AFTER DELETE ON tickets BEGIN
+            {decrement("old")}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS ticket_rollups_au
+        AFTER UPDATE OF created_at, created_at_ms, department, priority, sentiment, intent_category ON tickets BEGIN
+            {decrement("old")}
+            {increment("new")}
+        END
+    ''')
+    
+    if not exists:
+        cursor.execute(f'''
+            INSERT INTO ticket_rollups ({dimensions}, ticket_count)
+            SELECT {_rollup_day_sql()}, department, priority, sentiment, intent_category, COUNT(*)
+            FROM tickets
+            GROUP BY 1, 2, 3, 4, 5
+        ''')
+
+INSERT_TICKET_SQL = '''
+    INSERT INTO tickets (
+        created_at, caller_name, caller_contact, intent_category,
+        department, priority, sentiment, summary_short, created_at_ms
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+INSERT_BODY_SQL = '''
+    INSERT INTO ticket_bodies (ticket_id, dict_id, transcript, summary_full)
+    VALUES (?, ?, ?, ?)
+'''
+
+# A recording processed again (force reprocess) points at its newest ticket
+INSERT_AUDIO_HASH_SQL = '''
+    INSERT OR REPLACE INTO audio_hashes (audio_hash, ticket_id) VALUES (?, ?)
+'''
+
+def to_epoch_ms(value) -> Optional[int]:
+    """
+    Convert a timestamp to integer milliseconds since the epoch (UTC).
+    
+    Naive datetimes and ISO strings are taken as local time, matching how
+    created_at has always been written by datetime.now().isoformat().
+    
+    Args:
+        value: datetime, ISO 8601 string or epoch milliseconds
+        
+    Returns:
+        Optional[int]: Epoch milliseconds, or None if the value cannot be parsed
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return int(value.timestamp() * 1000)
+
+def _ticket_row(ticket_data: Dict) -> Tuple[tuple, tuple, Optional[str]]:
+    """
+    Build the parameters for one ticket.
+    
+    Returns:
+        Tuple[tuple, tuple, Optional[str]]: INSERT_TICKET_SQL parameters, the
+            compressed body (dict_id, transcript, summary_full) for
+            INSERT_BODY_SQL, and the recording's audio_hash if one was given
+    """
+    # Add timestamp if not present
+    if 'created_at' not in ticket_data:
+        ticket_data['created_at'] = datetime.now().isoformat()
+    
+    dict_id, zdict = _active_zdict(get_connection_manager().db_name)
+    
+    return (
+        ticket_data['created_at'],
+        ticket_data.get('caller_name'),
+        ticket_data.get('caller_contact'),
+        _encode('intent_category', ticket_data['intent_category']),
+        _encode('department', ticket_data['department']),
+        _encode('priority', ticket_data['priority']),
+        _encode('sentiment', ticket_data['sentiment']),
+        ticket_data['summary_short'],
+        to_epoch_ms(ticket_data['created_at'])
+    ), (
+        dict_id,
+        compress_text(ticket_data['transcript'], zdict),
+        compress_text(ticket_data['summary_full'], zdict)
+    ), ticket_data.get('audio_hash')
+
+def _write_ticket(conn: sqlite3.Connection, row: Tuple[tuple, tuple, Optional[str]]) -> int:
+    """Insert one ticket row built by _ticket_row() and return its id."""
+    ticket, body, audio_hash = row
+    ticket_id = conn.execute(INSERT_TICKET_SQL, ticket).lastrowid
+    conn.execute(INSERT_BODY_SQL, (ticket_id, *body))
+    if audio_hash is not None:
+        conn.execute(INSERT_AUDIO_HASH_SQL, (audio_hash, ticket_id))
+    return ticket_id
+
+def insert_ticket(ticket_data: Dict) -> int:
+    """
+    Insert a new ticket into the database.
+    
+    Args:
+        ticket_data (Dict): Dictionary containing ticket information
+        
+    Returns:
+        int: The ID of the inserted ticket
+    """
+    row = _ticket_row(ticket_data)
+    
+    with get_connection_manager().writer() as conn:
+        ticket_id = _write_ticket(conn, row)
+    
+    return ticket_id
+
+def insert_tickets(tickets: Iterable[Dict], batch_size: int = DB_INSERT_BATCH_SIZE) -> List[int]:
+    """
+    Insert many tickets, committing once per batch instead of once per row.
+    
+    The input is consumed lazily, so a generator can stream an import of any
+    size while only one batch is held in memory. The write lock is released
+    between batches so interactive inserts are not starved by a long import.
+    
+    Args:
+        tickets (Iterable[Dict]): Ticket dictionaries, e.g. a list or generator
+        batch_size (int): Number of rows written per transaction
+        
+    Returns:
+        List[int]: The IDs assigned to the tickets, in input order
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    
+    ticket_ids = []
+    iterator = iter(tickets)
+    
+    while True:
+        rows = [_ticket_row(t) for t in islice(iterator, batch_size)]
+        if not rows:
+            break
+        
+        with get_connection_manager().writer() as conn:
+            conn.executemany(INSERT_TICKET_SQL, [ticket for ticket, _, _ in rows])
+            # AUTOINCREMENT ids inside one write transaction are consecutive,
+            # ending at the sequence value recorded for the table
+            last_id = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'tickets'"
+            ).fetchone()[0]
+            batch_ids = range(last_id - len(rows) + 1, last_id + 1)
+            conn.executemany(
+                INSERT_BODY_SQL,
+                [(ticket_id, *body) for ticket_id, (_, body, _) in zip(batch_ids, rows)]
+            )
+            conn.executemany(
+                INSERT_AUDIO_HASH_SQL,
+                [(audio_hash, ticket_id) for ticket_id, (_, _, audio_hash) in zip(batch_ids, rows) if audio_hash]
+            )
+        
+        ticket_ids.extend(batch_ids)
+    
+    return ticket_ids
+
+_backfill_thread: Optional[threading.Thread] = None
+_backfill_lock = threading.Lock()
+
+def migrate_created_at_ms(batch_size: int = 1000, pause_seconds: float = 0.01,
+                          db_name: Optional[str] = None) -> int:
+    """
+    Backfill created_at_ms for rows written before the column existed.
+    
+    Works through the table in id order, one short write transaction per
+    batch, pausing between batches so interactive writes are never held up
+    for long. Rows whose created_at cannot be parsed are left NULL.
+    
+    If DB_NAME stops pointing at db_name, the run stops at the next batch;
+    the next init_db() on that file finds the remaining rows and resumes.
+    
+    Args:
+        batch_size (int): Rows updated per transaction
+        pause_seconds (float): Sleep between batches
+        db_name (str): Database file to backfill (default: DB_NAME)
+        
+    Returns:
+        int: Number of rows backfilled
+    """
+    db_name = db_name or DB_NAME
+    updated = 0
+    last_id = 0
+    
+    while True:
+        manager = get_connection_manager()
+        if manager.db_name != db_name:
+            break
+        with manager.writer() as conn:
+            rows = conn.execute('''
+                SELECT id, created_at FROM tickets
+                WHERE id > ? AND created_at_ms IS NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+            
+            values = [(to_epoch_ms(row["created_at"]), row["id"]) for row in rows]
+            conn.executemany(
+                "UPDATE tickets SET created_at_ms = ? WHERE id = ?",
+                [v for v in values if v[0] is not None]
+            )
+        
+        updated += sum(1 for v in values if v[0] is not None)
+        last_id = rows[-1]["id"]
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    
+    if updated:
+        manager.invalidate_replica()
+    return updated
+
+def start_created_at_backfill(db_name: str):
+    """Run migrate_created_at_ms() for db_name on a background thread, once per process."""
+    global _backfill_thread
+    with _backfill_lock:
+        if _backfill_thread is not None and _backfill_thread.is_alive():
+            return
+        _backfill_thread = threading.Thread(
+            target=migrate_created_at_ms, kwargs={"db_name": db_name},
+            name="created-at-backfill", daemon=True
+        )
+        _backfill_thread.start()
+
+class TicketWriter:
+    """
+    Write-behind queue for ticket inserts.
+    
+    Callers enqueue tickets and get a Future back; one background thread
+    drains the bounded queue and commits whatever has piled up as a single
+    group commit on the write connection. Concurrent sessions therefore never
+    contend for SQLite's write lock themselves.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, max_queue: int = DB_WRITE_QUEUE_SIZE, max_batch: int = DB_INSERT_BATCH_SIZE):
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "committed": 0,
+            "failed": 0,
+            "group_commits": 0,
+            "max_queue_depth": 0,
+            "last_commit_seconds": 0.0,
+            "max_commit_seconds": 0.0,
+            "total_commit_seconds": 0.0,
+        }
+    
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError("Ticket writer has been shut down")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ticket-writer", daemon=True)
+                self._thread.start()
+    
+    def submit(self, ticket_data: Dict) -> Future:
+        """
+        Queue a ticket for insertion.
+        
+        Blocks only if the queue is full. Missing required fields raise here,
+        in the caller, rather than failing later on the writer thread.
+        
+        Args:
+            ticket_data (Dict): Dictionary containing ticket information
+            
+        Returns:
+            Future: Resolves to the ID of the inserted ticket
+        """
+        row = _ticket_row(ticket_data)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((row, future))
+        
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return future
     
-    # Create tickets table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS tickets (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            created_at TEXT NOT NULL,
-            caller_name TEXT,
-            caller_contact TEXT,
-            intent_category TEXT NOT NULL,
-            department TEXT NOT NULL,
-            priority TEXT NOT NULL,
-            sentiment TEXT NOT NULL,
-            transcript TEXT NOT NULL,
-            summary_short TEXT NOT NULL,
-            summary_full TEXT NOT NULL
-        )
-    ''')
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = []
+            stop = item is self._STOP
+            if not stop:
+                batch.append(item)
+            
+            # Coalesce everything already waiting into the same commit
+            while not stop and len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+            
+            if batch:
+                self._commit(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
     
-    conn.commit()
-    conn.close()
+    def _commit(self, batch: List[Tuple[Tuple[tuple, tuple, Optional[str]], Future]]):
+        started = time.perf_counter()
+        results = []
+        try:
+            with get_connection_manager().writer() as conn:
+                for row, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        conn.execute("SAVEPOINT ticket")
+                        ticket_id = _write_ticket(conn, row)
+                        conn.execute("RELEASE ticket")
+                        results.append((future, ticket_id, None))
+                    except sqlite3.Error as e:
+                        # A bad ticket only fails its own future, not the group
+                        conn.execute("ROLLBACK TO ticket")
+                        conn.execute("RELEASE ticket")
+                        results.append((future, None, e))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._stats_lock:
+                self._stats["failed"] += len(batch)
+            return
+        
+        elapsed = time.perf_counter() - started
+        with self._stats_lock:
+            self._stats["group_commits"] += 1
+            self._stats["last_commit_seconds"] = elapsed
+            self._stats["total_commit_seconds"] += elapsed
+            if elapsed > self._stats["max_commit_seconds"]:
+                self._stats["max_commit_seconds"] = elapsed
+            for _, ticket_id, error in results:
+                self._stats["failed" if error else "committed"] += 1
+        
+        # Resolve only after COMMIT so a returned id is always durable
+        for future, ticket_id, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(ticket_id)
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued ticket has been committed.
+        
+        Args:
+            timeout (Optional[float]): Seconds to wait, None to wait forever
+            
+        Returns:
+            bool: True if the queue drained within the timeout
+        """
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+    
+    def close(self, timeout: Optional[float] = None):
+        """Commit everything still queued, then stop the writer thread."""
+        with self._start_lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+    
+    def stats(self) -> Dict:
+        """Return queue depth and commit latency metrics."""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot["queue_depth"] = self._queue.qsize()
+        commits = snapshot["group_commits"]
+        snapshot["avg_commit_seconds"] = snapshot["total_commit_seconds"] / commits if commits else 0.0
+        snapshot["avg_batch_size"] = snapshot["committed"] / commits if commits else 0.0
+        return snapshot
 
-def insert_ticket(ticket_data: Dict) -> int:
+_writer: Optional[TicketWriter] = None
+_writer_lock = threading.Lock()
+
+def get_ticket_writer() -> TicketWriter:
+    """Return the process-wide ticket writer, creating it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = TicketWriter()
+        return _writer
+
+def submit_ticket(ticket_data: Dict) -> Future:
     """
-    Insert a new ticket into the database.
+    Queue a ticket on the background writer.
     
     Args:
         ticket_data (Dict): Dictionary containing ticket information
         
     Returns:
-        int: The ID of the inserted ticket
+        Future: Resolves to the ID of the inserted ticket
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    # Add timestamp if not present
-    if 'created_at' not in ticket_data:
-        ticket_data['created_at'] = datetime.now().isoformat()
-    
-    cursor.execute('''
-        INSERT INTO tickets (
-            created_at, caller_name, caller_contact, intent_category,
-            department, priority, sentiment, transcript, summary_short, summary_full
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        ticket_data['created_at'],
-        ticket_data.get('caller_name'),
-        ticket_data.get('caller_contact'),
-        ticket_data['intent_category'],
-        ticket_data['department'],
-        ticket_data['priority'],
-        ticket_data['sentiment'],
-        ticket_data['transcript'],
-        ticket_data['summary_short'],
-        ticket_data['summary_full']
-    ))
-    
-    ticket_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    return get_ticket_writer().submit(ticket_data)
+
+def shutdown_ticket_writer(timeout: Optional[float] = 10.0):
+    """Flush pending tickets and stop the writer (called automatically at exit)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close(timeout)
+
+# Registered after close_connections, so it runs first at exit
+atexit.register(shutdown_ticket_writer)
+
+def get_writer_stats() -> Dict:
+    """
+    Get metrics for the background ticket writer.
     
-    return ticket_id
+    Returns:
+        Dict: Queue depth, tickets committed/failed and commit latencies
+    """
+    return get_ticket_writer().stats()
 
 def fetch_recent_tickets(limit: int = 5) -> List[Dict]:
     """
@@ -80,18 +1688,12 @@ def fetch_recent_tickets(limit: int = 5) -> List[Dict]:
     Returns:
         List[Dict]: List of ticket dictionaries
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # This allows us to access columns by name
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM tickets 
-        ORDER BY created_at DESC 
-        LIMIT ?
-    ''', (limit,))
-    
-    rows = cursor.fetchall()
-    conn.close()
+    with get_connection_manager().reader() as conn:
+        rows = conn.execute('''
+            SELECT * FROM tickets_full 
+            ORDER BY created_at DESC 
+            LIMIT ?
+        ''', (limit,)).fetchall()
     
     # Convert rows to dictionaries
     tickets = [dict(row) for row in rows]
@@ -104,17 +1706,11 @@ def fetch_all_tickets() -> List[Dict]:
     Returns:
         List[Dict]: List of all ticket dictionaries
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # This allows us to access columns by name
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM tickets 
-        ORDER BY created_at DESC
-    ''')
-    
-    rows = cursor.fetchall()
-    conn.close()
+    with get_connection_manager().reader() as conn:
+        rows = conn.execute('''
+            SELECT * FROM tickets_full 
+            ORDER BY created_at DESC
+        ''').fetchall()
     
     # Convert rows to dictionaries
     tickets = [dict(row) for row in rows]
@@ -127,11 +1723,967 @@ def get_ticket_count() -> int:
     Returns:
         int: Total number of tickets
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    # Summed from the rollup table: O(groups) rather than a full table scan
+    with get_connection_manager().reader() as conn:
+        count = conn.execute('SELECT COALESCE(SUM(ticket_count), 0) FROM ticket_rollups').fetchone()[0]
+    
+    return count
+
+class TicketSummary(NamedTuple):
+    """
+    Compact record for list views.
+    
+    Holds only the columns the ticket tables render, so listing tickets never
+    reads the transcript or full summary. Use get_ticket() for the full body.
+    """
+    id: int
+    created_at: str
+    created_at_ms: Optional[int]
+    caller_name: Optional[str]
+    intent_category: str
+    department: str
+    priority: str
+    snippet: Optional[str] = None
+
+# Search snippets mark matches with control characters, which
+# _snippet_html() turns into <mark> tags once the text is escaped
+SNIPPET_SQL = "snippet(tickets_fts, -1, char(2), char(3), '…', 12)"
+
+def _snippet_html(snippet: Optional[str]) -> Optional[str]:
+    """HTML-escape a snippet's ticket text, then wrap its matches in <mark> tags."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+def _summary_factory(cursor: sqlite3.Cursor, row: tuple) -> TicketSummary:
+    """Cursor row factory building TicketSummary records straight from tuples."""
+    ticket_id, created_at, created_at_ms, caller_name, intent, department, priority, *snippet = row
+    return TicketSummary(
+        ticket_id, created_at, created_at_ms, caller_name,
+        INTENT_CATEGORIES[intent], DEPARTMENTS[department], PRIORITIES[priority],
+        *(_snippet_html(text) for text in snippet)
+    )
+
+def get_ticket(ticket_id: int) -> Optional[Dict]:
+    """
+    Fetch one full ticket, including transcript and full summary.
+    
+    Tickets that have moved to an archive partition are found there.
+    
+    Args:
+        ticket_id (int): ID of the ticket
+        
+    Returns:
+        Optional[Dict]: The ticket dictionary, or None if it does not exist
+    """
+    with get_connection_manager().reader() as conn:
+        # tickets_full decompresses the transcript and full summary
+        row = conn.execute('SELECT * FROM tickets_full WHERE id = ?', (ticket_id,)).fetchone()
+    
+    if row is None:
+        return _get_archived_ticket(ticket_id)
+    return dict(row)
+
+def find_ticket_by_audio_hash(audio_hash: str) -> Optional[Dict]:
+    """
+    Find the ticket created from a recording with this content hash.
+    
+    Reads the database file even in replica mode, so a recording processed
+    a moment ago is found before the replica catches up.
+    
+    Args:
+        audio_hash (str): Hex SHA-256 of the audio (utils.audio.hash_audio_file)
+        
+    Returns:
+        Optional[Dict]: The full ticket (see get_ticket()), or None
+    """
+    with get_connection_manager().reader(primary=True) as conn:
+        row = conn.execute('''
+            SELECT t.* FROM audio_hashes h JOIN tickets_full t ON t.id = h.ticket_id
+            WHERE h.audio_hash = ?
+        ''', (audio_hash,)).fetchone()
+        if row is not None:
+            return dict(row)
+        mapped = conn.execute(
+            "SELECT ticket_id FROM audio_hashes WHERE audio_hash = ?", (audio_hash,)
+        ).fetchone()
+    
+    # Not in the live tables: archived, or deleted
+    return _get_archived_ticket(mapped["ticket_id"]) if mapped is not None else None
+
+def search_tickets(query: str, limit: Optional[int] = 20, offset: int = 0,
+                   department: Optional[str] = None, priority: Optional[str] = None) -> List[TicketSummary]:
+    """
+    Full-text search over caller details, transcripts, summaries, intent and department.
+    
+    Args:
+        query (str): Free text as typed by the user
+        limit (Optional[int]): Maximum number of results, None for no limit
+        offset (int): Number of results to skip
+        department (Optional[str]): Only return tickets for this department
+        priority (Optional[str]): Only return tickets with this priority
+        
+    Returns:
+        List[TicketSummary]: Matching tickets, best bm25 match first, each with
+            an HTML-escaped snippet with the matched text wrapped in <mark> tags
+    """
+    match = _fts_match_expression(query)
+    if not match:
+        return []
+    
+    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+    sql = f'''
+        SELECT {SUMMARY_COLUMNS},
+               {SNIPPET_SQL} AS snippet
+        FROM tickets_fts
+        JOIN tickets t ON t.id = tickets_fts.rowid
+        WHERE tickets_fts MATCH ?
+    '''
+    params = [match]
+    
+    if department and department != "All":
+        sql += " AND t.department = ?"
+        params.append(_filter_code("department", department))
+    if priority and priority != "All":
+        sql += " AND t.priority = ?"
+        params.append(_filter_code("priority", priority))
+    
+    sql += f" ORDER BY bm25(tickets_fts, {weights}) LIMIT ? OFFSET ?"
+    params.extend([-1 if limit is None else limit, offset])
+    
+    with get_connection_manager().reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = _summary_factory
+        return cursor.execute(sql, params).fetchall()
+
+def query_tickets(department: Optional[str] = None, priority: Optional[str] = None,
+                  text: Optional[str] = None, before: Optional[Tuple[str, int]] = None,
+                  limit: int = 10) -> Tuple[List[TicketSummary], Optional[Tuple[str, int]]]:
+    """
+    Fetch one page of tickets, newest first, with filtering done in SQL.
+    
+    Pages are addressed with a keyset cursor instead of OFFSET, so fetching
+    page N costs the same as fetching page 1.
+    
+    Args:
+        department (Optional[str]): Only return tickets for this department
+        priority (Optional[str]): Only return tickets with this priority
+        text (Optional[str]): Free-text search over the full-text index
+        before (Optional[Tuple[str, int]]): Cursor (created_at, id) returned
+            for the previous page; None for the first page
+        limit (int): Page size
+        
+    Returns:
+        Tuple[List[TicketSummary], Optional[Tuple[str, int]]]: The page of
+            tickets and the cursor for the next page (None on the last page)
+    """
+    match = _fts_match_expression(text)
+    if match:
+        sql = f'''
+            SELECT {SUMMARY_COLUMNS}, {SNIPPET_SQL} AS snippet
+            FROM tickets_fts
+            JOIN tickets t ON t.id = tickets_fts.rowid
+            WHERE tickets_fts MATCH ?
+        '''
+        params = [match]
+    else:
+        sql = f"SELECT {SUMMARY_COLUMNS} FROM tickets t WHERE 1 = 1"
+        params = []
+    
+    if department and department != "All":
+        sql += " AND t.department = ?"
+        params.append(_filter_code("department", department))
+    if priority and priority != "All":
+        sql += " AND t.priority = ?"
+        params.append(_filter_code("priority", priority))
+    if before is not None:
+        sql += " AND (t.created_at, t.id) < (?, ?)"
+        params.extend(before)
+    
+    # Fetch one extra row to learn whether another page follows
+    sql += " ORDER BY t.created_at DESC, t.id DESC LIMIT ?"
+    params.append(limit + 1)
+    
+    with get_connection_manager().reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = _summary_factory
+        rows = cursor.execute(sql, params).fetchall()
+    
+    tickets = rows[:limit]
+    next_before = None
+    if len(rows) > limit:
+        last = tickets[-1]
+        next_before = (last.created_at, last.id)
+    
+    return tickets, next_before
+
+def fetch_tickets_between(start, end, department: Optional[str] = None,
+                          priority: Optional[str] = None,
+                          limit: Optional[int] = None) -> List[TicketSummary]:
+    """
+    Fetch tickets created in the half-open range [start, end), newest first.
+    
+    Served by a range scan on the created_at_ms index, so "today's calls"
+    reads only today's rows.
+    
+    Args:
+        start: Range start as datetime, ISO string or epoch milliseconds
+        end: Range end (exclusive), same types as start
+        department (Optional[str]): Only return tickets for this department
+        priority (Optional[str]): Only return tickets with this priority
+        limit (Optional[int]): Maximum number of tickets, None for no limit
+        
+    Returns:
+        List[TicketSummary]: Tickets in the range
+    """
+    sql = f"SELECT {SUMMARY_COLUMNS} FROM tickets t WHERE t.created_at_ms >= ? AND t.created_at_ms < ?"
+    params = [to_epoch_ms(start), to_epoch_ms(end)]
+    
+    if department and department != "All":
+        sql += " AND t.department = ?"
+        params.append(_filter_code("department", department))
+    if priority and priority != "All":
+        sql += " AND t.priority = ?"
+        params.append(_filter_code("priority", priority))
+    
+    sql += " ORDER BY t.created_at_ms DESC, t.id DESC LIMIT ?"
+    params.append(-1 if limit is None else limit)
+    
+    with get_connection_manager().reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = _summary_factory
+        return cursor.execute(sql, params).fetchall()
+
+def fetch_urgent_tickets(limit: int = 10) -> List[TicketSummary]:
+    """
+    Fetch the most urgent tickets: critical first, then high, medium and low,
+    newest first within each priority.
+    
+    Priority codes follow the order of PRIORITIES, so this is a backwards
+    scan of the (priority, created_at) index with no sorting.
+    
+    Args:
+        limit (int): Maximum number of tickets
+    
+    Returns:
+        List[TicketSummary]: Tickets in urgency order
+    """
+    with get_connection_manager().reader() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = _summary_factory
+        return cursor.execute(
+            f"SELECT {SUMMARY_COLUMNS} FROM tickets t ORDER BY t.priority DESC, t.created_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+
+def _day_key(value) -> str:
+    """Normalise a date, datetime or ISO string to YYYY-MM-DD."""
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    return str(value)[:10]
+
+def _utc_day_key(value) -> str:
+    """
+    Normalise a stats bound to the YYYY-MM-DD rollup key, a UTC day.
+    
+    Datetimes and ISO strings with a time are converted to UTC the way
+    to_epoch_ms() does; a date or bare YYYY-MM-DD is already a UTC day.
+    """
+    if isinstance(value, datetime) or (isinstance(value, str) and len(value) > 10):
+        epoch_ms = to_epoch_ms(value)
+        if epoch_ms is not None:
+            value = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+    return _day_key(value)
+
+def get_stats(date_range: Optional[Tuple] = None, group_by: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Ticket counts from the rollup table, optionally grouped and date-bounded.
+    
+    Args:
+        date_range (Optional[Tuple]): (start, end) UTC days as date, datetime
+            or ISO string; start is inclusive, end exclusive. Datetimes are
+            converted to their UTC day. None for all time
+        group_by (Optional[List[str]]): Any of ROLLUP_DIMENSIONS; None or []
+            for a single total
+            
+    Returns:
+        List[Dict]: One dictionary per group with the group columns and 'count',
+            largest groups first
+            
+    Raises:
+        ValueError: If group_by names an unknown dimension
+    """
+    group_by = list(group_by or [])
+    unknown = [g for g in group_by if g not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown stats dimension(s): {', '.join(unknown)}. Choose from: {', '.join(ROLLUP_DIMENSIONS)}")
+    
+    select = ", ".join(group_by + ["SUM(ticket_count) AS count"])
+    sql = f"SELECT {select} FROM ticket_rollups"
+    params = []
+    
+    if date_range is not None:
+        start, end = date_range
+        sql += " WHERE day >= ? AND day < ?"
+        params.extend([_utc_day_key(start), _utc_day_key(end)])
+    
+    if group_by:
+        sql += f" GROUP BY {', '.join(group_by)} ORDER BY count DESC"
+    
+    with get_connection_manager().reader() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    
+    stats = [dict(row) for row in rows]
+    for stat in stats:
+        for column in group_by:
+            if column in ENUM_COLUMNS:
+                stat[column] = _decode(column, stat[column])
+    if not group_by:
+        stats[0]["count"] = stats[0]["count"] or 0
+    return stats
+
+# Categorical columns exposed as filter facets
+FACET_COLUMNS = ["department", "priority", "intent_category"]
+
+class FacetCache:
+    """
+    In-process cache of the distinct filter values and their ticket counts.
+    
+    Validity is checked with PRAGMA data_version on a dedicated connection:
+    the value changes whenever any other connection (including this
+    process's write connection) commits, so an unchanged database costs one
+    tiny query per rerun and no table reads. In read-replica mode the
+    replica's refresh counter plays that role and facets are read from it.
+    """
+    
+    def __init__(self, manager: ConnectionManager):
+        self.manager = manager
+        self._conn = manager.open_dedicated() if manager.replica is None else None
+        self._lock = threading.Lock()
+        self._version = None
+        self._facets: Optional[Dict[str, Dict[str, int]]] = None
+        self.hits = 0
+        self.misses = 0
+    
+    @contextmanager
+    def _connection(self) -> Iterator[sqlite3.Connection]:
+        if self._conn is None:
+            with self.manager.reader() as conn:
+                yield conn
+        else:
+            yield self._conn
+    
+    def get(self) -> Dict[str, Dict[str, int]]:
+        """Return the cached facets, reloading them if the database changed."""
+        with self._lock, self._connection() as conn:
+            # Read the version before loading, so a commit racing with the
+            # load is picked up on the next call rather than lost
+            if self._conn is None:
+                version = self.manager.replica.version
+            else:
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._facets is not None and version == self._version:
+                self.hits += 1
+                return self._facets
+            
+            facets = {}
+            for column in FACET_COLUMNS:
+                rows = conn.execute(f'''
+                    SELECT {column} AS value, SUM(ticket_count) AS count
+                    FROM ticket_rollups
+                    GROUP BY {column}
+                    ORDER BY {column}
+                ''').fetchall()
+                facets[column] = {_decode(column, row["value"]): row["count"] for row in rows}
+            
+            self._facets = facets
+            self._version = version
+            self.misses += 1
+            return facets
+    
+    def stats(self) -> Dict:
+        """Return cache hit and miss counts."""
+        return {"hits": self.hits, "misses": self.misses, "data_version": self._version}
+
+_facet_cache: Optional[FacetCache] = None
+_facet_cache_lock = threading.Lock()
+
+def get_facets() -> Dict[str, Dict[str, int]]:
+    """
+    Get the distinct departments, priorities and intents with ticket counts.
+    
+    Returns:
+        Dict[str, Dict[str, int]]: Facet column mapped to {value: ticket count},
+            values in sorted order
+    """
+    global _facet_cache
+    manager = get_connection_manager()
+    with _facet_cache_lock:
+        if _facet_cache is None or _facet_cache.manager is not manager:
+            _facet_cache = FacetCache(manager)
+        cache = _facet_cache
+    return cache.get()
+
+# Schema alias an archive partition is attached under while tickets move
+ARCHIVE_SCHEMA = "archive"
+
+# SQLite attaches at most 10 databases by default, so history queries
+# UNION the partitions in groups of this size
+MAX_ATTACHED_ARCHIVES = 9
+
+RETENTION_ACTIONS = ["purge_transcripts", "delete"]
+
+def _shift_month(month: str, months: int) -> str:
+    """Add a (possibly negative) number of months to a YYYY-MM key."""
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def _month_key(value) -> str:
+    """Normalise a datetime, ISO string or epoch milliseconds to YYYY-MM."""
+    if isinstance(value, (int, float)):
+        value = datetime.fromtimestamp(value / 1000)
+    return _day_key(value)[:7]
+
+def get_archive_dir() -> str:
+    """Directory holding the archive partitions, next to the database file."""
+    db_name = get_connection_manager().db_name
+    return os.path.join(os.path.dirname(os.path.abspath(db_name)), ARCHIVE_DIR)
+
+def _archive_path(month: str) -> str:
+    stem = os.path.splitext(os.path.basename(get_connection_manager().db_name))[0]
+    return os.path.join(get_archive_dir(), f"{stem}_{month.replace('-', '_')}.db")
+
+def list_archive_partitions() -> List[Tuple[str, str]]:
+    """
+    List the monthly archive partitions of the current database.
+    
+    Returns:
+        List[Tuple[str, str]]: (YYYY-MM month, file path), newest month first
+    """
+    directory = get_archive_dir()
+    if not os.path.isdir(directory):
+        return []
+    
+    stem = os.path.splitext(os.path.basename(get_connection_manager().db_name))[0]
+    pattern = re.compile(re.escape(stem) + r"_(\d{4})_(\d{2})\.db")
+    partitions = []
+    for name in os.listdir(directory):
+        match = pattern.fullmatch(name)
+        if match:
+            partitions.append((f"{match.group(1)}-{match.group(2)}", os.path.join(directory, name)))
+    return sorted(partitions, reverse=True)
+
+def _init_archive_schema(cursor: sqlite3.Cursor, db_name: str):
+    """
+    Create the partition schema in the attached archive database.
+    
+    A partition is a self-contained copy of the live layout: hot tickets
+    rows, compressed bodies with the dictionaries they need, the
+    tickets_full view and its own full-text index. There are no rollups;
+    those stay in the live database and keep counting archived tickets.
+    """
+    _create_tickets_table(cursor, ARCHIVE_SCHEMA)
+    _init_ticket_bodies(cursor, db_name, ARCHIVE_SCHEMA)
+    _init_enum_tables(cursor, ARCHIVE_SCHEMA)
+    _create_tickets_full_view(cursor, ARCHIVE_SCHEMA)
+    _create_ticket_indexes(cursor, ARCHIVE_SCHEMA)
+    _init_search_index(cursor, ARCHIVE_SCHEMA)
+
+def _upgrade_archive_partitions():
+    """
+    Bring existing partitions to the live schema after it was re-encoded.
+    
+    The live rollups were rebuilt from live tickets only at that point, so
+    each partition's tickets are counted back in.
+    """
+    manager = get_connection_manager()
+    for _, path in list_archive_partitions():
+        with manager.writer(attach={ARCHIVE_SCHEMA: path}) as conn:
+            _init_archive_schema(conn.cursor(), manager.db_name)
+            _adjust_rollups(conn, _rollup_counts(conn, f"{ARCHIVE_SCHEMA}.tickets"), 1)
+
+def _reindex_archive_partitions():
+    """Give existing partitions the live full-text index columns."""
+    manager = get_connection_manager()
+    for _, path in list_archive_partitions():
+        with manager.writer(attach={ARCHIVE_SCHEMA: path}) as conn:
+            _init_search_index(conn.cursor(), ARCHIVE_SCHEMA)
+
+def _rollup_counts(conn: sqlite3.Connection, source: str, where: str = "1 = 1", params: tuple = ()) -> List[tuple]:
+    """Count tickets of source grouped by the rollup dimensions."""
+    return conn.execute(f'''
+        SELECT {_rollup_day_sql()}, department, priority, sentiment, intent_category, COUNT(*)
+        FROM {source}
+        WHERE {where}
+        GROUP BY 1, 2, 3, 4, 5
+    ''', params).fetchall()
+
+def _adjust_rollups(conn: sqlite3.Connection, counts: List[tuple], sign: int):
+    """Add (sign=1) or subtract (sign=-1) grouped counts from ticket_rollups."""
+    dimensions = ", ".join(ROLLUP_DIMENSIONS)
+    conn.executemany(f'''
+        INSERT INTO main.ticket_rollups ({dimensions}, ticket_count)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT ({dimensions}) DO UPDATE SET ticket_count = ticket_count + excluded.ticket_count
+    ''', [(*row[:5], sign * row[5]) for row in counts])
+    conn.execute("DELETE FROM main.ticket_rollups WHERE ticket_count <= 0")
+
+def _archive_batch(conn: sqlite3.Connection, month: str, batch_size: int) -> int:
+    """Move up to batch_size tickets of one month into the attached partition."""
+    ids = [row["id"] for row in conn.execute('''
+        SELECT id FROM main.tickets
+        WHERE created_at >= ? AND created_at < ?
+        ORDER BY created_at, id
+        LIMIT ?
+    ''', (month, _shift_month(month, 1), batch_size))]
+    if not ids:
+        return 0
+    
+    batch = (json.dumps(ids),)
+    in_batch = "IN (SELECT value FROM json_each(?))"
+    
+    conn.execute(f'''
+        INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.compression_dicts
+        SELECT * FROM main.compression_dicts
+        WHERE id IN (SELECT dict_id FROM main.ticket_bodies WHERE ticket_id {in_batch})
+    ''', batch)
+    # Files are committed separately, so a crash can leave a batch copied but
+    # not yet deleted. OR IGNORE makes the rerun skip those rows, which also
+    # keeps the partition's FTS trigger from indexing a ticket twice.
+    conn.execute(f'''
+        INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.tickets ({TICKET_COLUMNS})
+        SELECT {TICKET_COLUMNS} FROM main.tickets WHERE id {in_batch}
+    ''', batch)
+    conn.execute(f'''
+        INSERT OR IGNORE INTO {ARCHIVE_SCHEMA}.ticket_bodies (ticket_id, dict_id, transcript, summary_full)
+        SELECT ticket_id, dict_id, transcript, summary_full FROM main.ticket_bodies WHERE ticket_id {in_batch}
+    ''', batch)
+    
+    counts = _rollup_counts(conn, "main.tickets", f"id {in_batch}", batch)
+    conn.execute(f"DELETE FROM main.tickets WHERE id {in_batch}", batch)
+    # The delete triggers decremented the rollups, but archived tickets still
+    # count towards the dashboard totals
+    _adjust_rollups(conn, counts, 1)
+    return len(ids)
+
+def archive_old_tickets(keep_months: int = ARCHIVE_AFTER_MONTHS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                        pause_seconds: float = 0.01, now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Move tickets older than the live window into monthly archive partitions.
+    
+    Each batch is one short write transaction with the month's partition
+    file attached, pausing between batches so interactive writes are not
+    held up. Recent-ticket and dashboard queries then only touch the live
+    file; query_history() and get_ticket() still find archived tickets.
+    
+    Args:
+        keep_months (int): Whole months before the current one kept live
+        batch_size (int): Tickets moved per transaction
+        pause_seconds (float): Sleep between batches
+        now (Optional[datetime]): Reference time, defaults to now
+        
+    Returns:
+        Dict[str, int]: YYYY-MM month mapped to the number of tickets moved
+    """
+    manager = get_connection_manager()
+    cutoff = _shift_month(_month_key(now or datetime.now()), -keep_months)
+    moved = {}
+    
+    while True:
+        with manager.reader() as conn:
+            row = conn.execute('''
+                SELECT substr(created_at, 1, 7) AS month FROM tickets
+                WHERE created_at >= '0000' AND created_at < ?
+                ORDER BY created_at
+                LIMIT 1
+            ''', (cutoff,)).fetchone()
+        if row is None or not re.fullmatch(r"\d{4}-\d{2}", row["month"]):
+            break
+        
+        month = row["month"]
+        os.makedirs(get_archive_dir(), exist_ok=True)
+        with manager.writer(attach={ARCHIVE_SCHEMA: _archive_path(month)}) as conn:
+            _init_archive_schema(conn.cursor(), manager.db_name)
+            count = _archive_batch(conn, month, batch_size)
+        
+        moved[month] = moved.get(month, 0) + count
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    
+    return moved
+
+def apply_retention(retention_months: Optional[int] = ARCHIVE_RETENTION_MONTHS,
+                    action: str = ARCHIVE_RETENTION_ACTION,
+                    now: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Apply the retention policy to archive partitions past the retention window.
+    
+    "purge_transcripts" drops the compressed bodies but keeps every ticket's
+    metadata (and its searchable caller details and short summary);
+    "delete" removes the partition and its tickets from the rollup counts.
+    
+    Args:
+        retention_months (Optional[int]): Whole months before the current one
+            kept in full; None keeps everything
+        action (str): One of RETENTION_ACTIONS
+        now (Optional[datetime]): Reference time, defaults to now
+        
+    Returns:
+        Dict[str, str]: YYYY-MM month mapped to the action applied to it
+        
+    Raises:
+        ValueError: If action is not a known retention action
+    """
+    if action not in RETENTION_ACTIONS:
+        raise ValueError(f"Unknown retention action: {action}. Choose from: {', '.join(RETENTION_ACTIONS)}")
+    if retention_months is None:
+        return {}
+    
+    manager = get_connection_manager()
+    cutoff = _shift_month(_month_key(now or datetime.now()), -retention_months)
+    applied = {}
+    
+    for month, path in list_archive_partitions():
+        if month >= cutoff:
+            continue
+        
+        if action == "delete":
+            with manager.writer(attach={ARCHIVE_SCHEMA: path}) as conn:
+                _adjust_rollups(conn, _rollup_counts(conn, f"{ARCHIVE_SCHEMA}.tickets"), -1)
+            manager.invalidate_replica()
+            os.remove(path)
+        else:
+            with manager.writer(attach={ARCHIVE_SCHEMA: path}) as conn:
+                purged = conn.execute(f"SELECT 1 FROM {ARCHIVE_SCHEMA}.ticket_bodies LIMIT 1").fetchone() is None
+                if not purged:
+                    conn.execute(f"DELETE FROM {ARCHIVE_SCHEMA}.ticket_bodies")
+                    conn.execute(f"INSERT INTO {ARCHIVE_SCHEMA}.tickets_fts (tickets_fts) VALUES ('rebuild')")
+            if purged:
+                continue
+            # Give the freed pages back to the filesystem
+            conn = open_connection(path)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        
+        applied[month] = action
+    
+    return applied
+
+def run_archive_job(now: Optional[datetime] = None) -> Dict:
+    """
+    Archive old tickets, then apply the retention policy from config.py.
+    
+    Args:
+        now (Optional[datetime]): Reference time, defaults to now
+        
+    Returns:
+        Dict: Tickets moved per month, retention actions and run time
+    """
+    started = time.perf_counter()
+    archived = archive_old_tickets(now=now)
+    retention = apply_retention(now=now)
+    return {
+        "archived": archived,
+        "retention": retention,
+        "seconds": time.perf_counter() - started,
+    }
+
+_archive_thread: Optional[threading.Thread] = None
+_archive_lock = threading.Lock()
+_archive_status: Dict = {"runs": 0, "last_result": None, "last_error": None}
+
+def _archive_loop(interval_seconds: float):
+    while True:
+        try:
+            result = run_archive_job()
+            _archive_status["last_result"] = result
+            _archive_status["last_error"] = None
+        except Exception as e:
+            # Keep the worker alive; the next run retries from where this stopped
+            _archive_status["last_error"] = str(e)
+        _archive_status["runs"] += 1
+        time.sleep(interval_seconds)
+
+def start_archive_worker(interval_seconds: float = ARCHIVE_INTERVAL_SECONDS):
+    """Run run_archive_job() periodically on a background thread, once per process."""
+    global _archive_thread
+    with _archive_lock:
+        if _archive_thread is not None and _archive_thread.is_alive():
+            return
+        _archive_thread = threading.Thread(
+            target=_archive_loop, args=(interval_seconds,), name="ticket-archiver", daemon=True
+        )
+        _archive_thread.start()
+
+def get_archive_status() -> Dict:
+    """
+    Get the partitions on disk and the outcome of the last archive run.
+    
+    Returns:
+        Dict: Partition months, run count, last result and last error
+    """
+    return {"partitions": [month for month, _ in list_archive_partitions()], **_archive_status}
+
+def _history_select(schema: str, match: str, department: Optional[str], priority: Optional[str],
+                    before: Optional[Tuple[str, int]], start_ms: Optional[int],
+                    end_ms: Optional[int]) -> Tuple[str, list]:
+    """Build one UNION arm of query_history() for the live or an archive schema."""
+    if match:
+        sql = f'''
+            SELECT {SUMMARY_COLUMNS}, {SNIPPET_SQL} AS snippet
+            FROM {schema}.tickets_fts
+            JOIN {schema}.tickets t ON t.id = tickets_fts.rowid
+            WHERE tickets_fts MATCH ?
+        '''
+        params = [match]
+    else:
+        sql = f"SELECT {SUMMARY_COLUMNS}, NULL AS snippet FROM {schema}.tickets t WHERE 1 = 1"
+        params = []
+    
+    if department and department != "All":
+        sql += " AND t.department = ?"
+        params.append(_filter_code("department", department))
+    if priority and priority != "All":
+        sql += " AND t.priority = ?"
+        params.append(_filter_code("priority", priority))
+    if before is not None:
+        sql += " AND (t.created_at, t.id) < (?, ?)"
+        params.extend(before)
+    if start_ms is not None:
+        sql += " AND t.created_at_ms >= ?"
+        params.append(start_ms)
+    if end_ms is not None:
+        sql += " AND t.created_at_ms < ?"
+        params.append(end_ms)
+    
+    return sql, params
+
+def query_history(department: Optional[str] = None, priority: Optional[str] = None,
+                  text: Optional[str] = None, before: Optional[Tuple[str, int]] = None,
+                  limit: int = 10, start=None,
+                  end=None) -> Tuple[List[TicketSummary], Optional[Tuple[str, int]]]:
+    """
+    Fetch one page of tickets across the live database and its archives.
+    
+    Works like query_tickets(), but the archive partitions are ATTACHed on
+    demand and queried together with the live file in one UNION ALL per
+    group of partitions. Partitions outside [start, end) or newer than the
+    cursor are skipped, and older groups are not read once the page is full.
+    
+    Args:
+        department (Optional[str]): Only return tickets for this department
+        priority (Optional[str]): Only return tickets with this priority
+        text (Optional[str]): Free-text search over the full-text indexes
+        before (Optional[Tuple[str, int]]): Cursor (created_at, id) returned
+            for the previous page; None for the first page
+        limit (int): Page size
+        start: Optional range start as datetime, ISO string or epoch milliseconds
+        end: Optional range end (exclusive), same types as start
+        
+    Returns:
+        Tuple[List[TicketSummary], Optional[Tuple[str, int]]]: The page of
+            tickets and the cursor for the next page (None on the last page)
+    """
+    match = _fts_match_expression(text)
+    start_ms, end_ms = to_epoch_ms(start), to_epoch_ms(end)
+    
+    partitions = list_archive_partitions()
+    if start is not None:
+        partitions = [p for p in partitions if p[0] >= _month_key(start)]
+    if end is not None:
+        partitions = [p for p in partitions if p[0] <= _month_key(end)]
+    if before is not None:
+        partitions = [p for p in partitions if p[0] <= before[0][:7]]
+    groups = [partitions[i:i + MAX_ATTACHED_ARCHIVES] for i in range(0, len(partitions), MAX_ATTACHED_ARCHIVES)]
+    
+    rows: List[TicketSummary] = []
+    with get_connection_manager().reader() as conn:
+        for index, group in enumerate(groups or [[]]):
+            # Partitions hold disjoint months, newest group first, so once the
+            # page is full of newer tickets the older groups cannot contribute
+            if len(rows) > limit and rows[limit].created_at >= _shift_month(group[0][0], 1):
+                break
+            
+            aliases = {f"archive_{i}": path for i, (_, path) in enumerate(group)}
+            schemas = (["main"] if index == 0 else []) + list(aliases)
+            selects, params = [], []
+            for schema in schemas:
+                sql, arm_params = _history_select(schema, match, department, priority, before, start_ms, end_ms)
+                selects.append(sql)
+                params.extend(arm_params)
+            sql = " UNION ALL ".join(selects) + " ORDER BY created_at DESC, id DESC LIMIT ?"
+            params.append(limit + 1)
+            
+            with attached(conn, aliases):
+                cursor = conn.cursor()
+                cursor.row_factory = _summary_factory
+                rows.extend(cursor.execute(sql, params).fetchall())
+            rows.sort(key=lambda r: (r.created_at, r.id), reverse=True)
+            del rows[limit + 1:]
+    
+    tickets = rows[:limit]
+    next_before = None
+    if len(rows) > limit:
+        last = tickets[-1]
+        next_before = (last.created_at, last.id)
+    
+    return tickets, next_before
+
+def _get_archived_ticket(ticket_id: int) -> Optional[Dict]:
+    """Look a ticket up in the archive partitions, newest first."""
+    with get_connection_manager().reader() as conn:
+        for _, path in list_archive_partitions():
+            with attached(conn, {ARCHIVE_SCHEMA: path}):
+                row = conn.execute(
+                    f"SELECT * FROM {ARCHIVE_SCHEMA}.tickets_full WHERE id = ?", (ticket_id,)
+                ).fetchone()
+            if row is not None:
+                return dict(row)
+    return None
+
+# Columns written by export_tickets(), in file order
+EXPORT_COLUMNS = [
+    "id", "created_at", "caller_name", "caller_contact", "intent_category", "department",
+    "priority", "sentiment", "summary_short", "summary_full", "transcript"
+]
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+def _export_select(schema: str, match: str, department: Optional[str],
+                   priority: Optional[str]) -> Tuple[str, list]:
+    """Build the filtered, newest-first export query for the live or an archive schema."""
+    sql = f'''
+        SELECT t.id, t.created_at, t.caller_name, t.caller_contact, t.intent_category, t.department,
+               t.priority, t.sentiment, t.summary_short,
+               ticket_text(b.summary_full, b.dict_id) AS summary_full,
+               ticket_text(b.transcript, b.dict_id) AS transcript
+        FROM {schema}.tickets t
+        LEFT JOIN {schema}.ticket_bodies b ON b.ticket_id = t.id
+    '''
+    params = []
+    if match:
+        sql += f" JOIN {schema}.tickets_fts ON tickets_fts.rowid = t.id WHERE tickets_fts MATCH ?"
+        params.append(match)
+    else:
+        sql += " WHERE 1 = 1"
+    
+    if department and department != "All":
+        sql += " AND t.department = ?"
+        params.append(_filter_code("department", department))
+    if priority and priority != "All":
+        sql += " AND t.priority = ?"
+        params.append(_filter_code("priority", priority))
+    
+    sql += " ORDER BY t.created_at DESC, t.id DESC"
+    return sql, params
+
+def export_tickets(fmt: str = "csv", department: Optional[str] = None, priority: Optional[str] = None,
+                   text: Optional[str] = None, include_archive: bool = False,
+                   batch_size: int = EXPORT_STREAM_BATCH_SIZE) -> Iterator[str]:
+    """
+    Stream tickets as CSV or JSON Lines, newest first, one chunk per batch.
+    
+    Rows are stepped out of an open cursor with fetchmany(), so only one
+    batch of tickets is in memory at a time however large the table is.
+    Filters match query_tickets(). Each source is read inside one read
+    transaction, so the live tickets come from a single snapshot, and so
+    does each archive partition (ATTACH is not allowed inside a
+    transaction, so partitions cannot share the live snapshot). Close the
+    generator early to end the transaction.
+    
+    Args:
+        fmt (str): "csv" (with a header row) or "jsonl"
+        department (Optional[str]): Only export tickets for this department
+        priority (Optional[str]): Only export tickets with this priority
+        text (Optional[str]): Free-text search over the full-text index
+        include_archive (bool): Also export tickets from the archive partitions
+        batch_size (int): Rows fetched and encoded per chunk
+    
+    Yields:
+        str: The next chunk of the file
+    
+    Raises:
+        ValueError: If fmt is not one of EXPORT_FORMATS
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+    
+    # A search with no usable terms matches nothing; the CSV still gets its header
+    match = _fts_match_expression(text)
+    if text and not match:
+        return
+    
+    # Archive months are all older than the live tickets and disjoint from
+    # each other, so live first, then partitions newest first, stays sorted
+    sources = [("main", None)]
+    if include_archive:
+        sources += [(ARCHIVE_SCHEMA, path) for _, path in list_archive_partitions()]
+    
+    with get_connection_manager().reader() as conn:
+        for schema, path in sources:
+            sql, params = _export_select(schema, match, department, priority)
+            with attached(conn, {schema: path} if path else None):
+                # Autocommit would give every fetchmany() step its own snapshot
+                conn.execute("BEGIN")
+                cursor = conn.execute(sql, params)
+                try:
+                    while True:
+                        rows = cursor.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        records = []
+                        for row in rows:
+                            record = dict(row)
+                            for column in ENUM_COLUMNS:
+                                record[column] = _decode(column, record[column])
+                            records.append(record)
+                        
+                        if fmt == "csv":
+                            buffer = io.StringIO()
+                            writer = csv.writer(buffer)
+                            writer.writerows([record[c] for c in EXPORT_COLUMNS] for record in records)
+                            yield buffer.getvalue()
+                        else:
+                            yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                finally:
+                    # Finish the statement and the transaction so the archive can be detached
+                    cursor.close()
+                    conn.execute("COMMIT")
+
+def check_query_plans() -> Dict[str, str]:
+    """
+    Verify with EXPLAIN QUERY PLAN that every hot query uses its index.
+    
+    Returns:
+        Dict[str, str]: Query name mapped to its plan, one step per line
+        
+    Raises:
+        RuntimeError: If a query does not use its expected index or needs a
+            temporary B-tree to sort
+    """
+    plans = {}
+    problems = []
+    
+    with get_connection_manager().reader() as conn:
+        for name, (sql, params, expected_index) in HOT_QUERIES.items():
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            plan = "\n".join(row["detail"] for row in rows)
+            plans[name] = plan
+            
+            if expected_index not in plan:
+                problems.append(f"{name}: expected {expected_index}, got: {plan}")
+            elif "USE TEMP B-TREE" in plan:
+                problems.append(f"{name}: sorts with a temp B-tree: {plan}")
     
-    cursor.execute('SELECT COUNT(*) FROM tickets')
-    count = cursor.fetchone()[0]
-    conn.close()
+    if problems:
+        raise RuntimeError("Query plan check failed:\n" + "\n".join(problems))
     
-    return count
\ No newline at end of file
+    return plans
\ No newline at end of file
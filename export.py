@@ -0,0 +1,243 @@
+"""
+Export tickets to month-partitioned Parquet files for analytics.
+
+Tickets are read in id-ordered batches, so memory stays bounded by the
+batch size and each batch holds a read snapshot only briefly. Output uses
+Hive-style partitions by UTC month, the same time zone as the created_at
+column, that pandas, pyarrow, DuckDB and Spark read as a dataset:
+
+    <export_dir>/month=2025-11/part-0000000123.parquet
+
+The categorical columns are dictionary-encoded with the fixed category
+lists from config.py, so they load as pandas categoricals. A watermark
+file records the highest exported ticket id; incremental runs only export
+newer tickets and add new part files next to the existing ones.
+
+Requires pyarrow (listed in requirements.txt).
+
+Usage:
+    python export.py [export_dir] [--full]
+"""
+
+import sys
+import os
+import json
+import logging
+import shutil
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import db
+from config import EXPORT_DIR, EXPORT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_FILE = "_watermark.json"
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+def get_export_dir() -> str:
+    """Directory holding the Parquet dataset, next to the current database file."""
+    return os.path.join(os.path.dirname(os.path.abspath(db.DB_NAME)), EXPORT_DIR)
+
+def read_watermark(export_dir: Optional[str] = None) -> int:
+    """
+    Get the highest ticket id already exported.
+    
+    Args:
+        export_dir (Optional[str]): Dataset directory, defaults to get_export_dir()
+    
+    Returns:
+        int: Last exported ticket id, 0 if nothing was exported yet
+    """
+    path = os.path.join(export_dir or get_export_dir(), WATERMARK_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(json.load(f)["last_id"])
+
+def _write_watermark(export_dir: str, last_id: int, rows: int):
+    path = os.path.join(export_dir, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"last_id": last_id, "rows": rows, "exported_at": datetime.now().isoformat()}, f)
+    os.replace(path + ".tmp", path)
+
+def _schema(pa, include_transcripts: bool):
+    category = pa.dictionary(pa.int8(), pa.string())
+    fields = [
+        ("id", pa.int64()),
+        ("created_at", pa.timestamp("ms", tz="UTC")),
+        ("caller_name", pa.string()),
+        ("caller_contact", pa.string()),
+        ("intent_category", category),
+        ("department", category),
+        ("priority", category),
+        ("sentiment", category),
+        ("summary_short", pa.string()),
+        ("summary_full", pa.string()),
+    ]
+    if include_transcripts:
+        fields.append(("transcript", pa.string()))
+    return pa.schema(fields)
+
+def _batch_select(schema: str, include_transcripts: bool) -> str:
+    """Keyset-paginated read of raw rows; enum columns stay integer codes."""
+    transcript = ", ticket_text(b.transcript, b.dict_id) AS transcript" if include_transcripts else ""
+    return f'''
+        SELECT t.id, t.created_at, t.created_at_ms, t.caller_name, t.caller_contact,
+               t.intent_category, t.department, t.priority, t.sentiment, t.summary_short,
+               ticket_text(b.summary_full, b.dict_id) AS summary_full{transcript}
+        FROM {schema}.tickets t
+        LEFT JOIN {schema}.ticket_bodies b ON b.ticket_id = t.id
+        WHERE t.id > ?
+        ORDER BY t.id
+        LIMIT ?
+    '''
+
+def _created_at_ms(row) -> Optional[int]:
+    """A row's creation time in UTC epoch milliseconds."""
+    if row["created_at_ms"] is not None:
+        return row["created_at_ms"]
+    return db.to_epoch_ms(row["created_at"])
+
+def _month(row) -> str:
+    """The UTC month a row is partitioned under, matching its created_at column."""
+    created_at_ms = _created_at_ms(row)
+    if created_at_ms is None:
+        return row["created_at"][:7]
+    return datetime.fromtimestamp(created_at_ms / 1000, timezone.utc).strftime("%Y-%m")
+
+def _to_table(pa, schema, rows: List, include_transcripts: bool):
+    """Build an Arrow table from one month's rows of a batch."""
+    def column(name):
+        return [row[name] for row in rows]
+    
+    def category(name):
+        # Stored codes index straight into the config.py list
+        return pa.DictionaryArray.from_arrays(
+            pa.array(column(name), pa.int8()), pa.array(db.ENUM_COLUMNS[name], pa.string())
+        )
+    
+    arrays = [
+        pa.array(column("id"), pa.int64()),
+        pa.array([_created_at_ms(row) for row in rows], pa.timestamp("ms", tz="UTC")),
+        pa.array(column("caller_name"), pa.string()),
+        pa.array(column("caller_contact"), pa.string()),
+        category("intent_category"),
+        category("department"),
+        category("priority"),
+        category("sentiment"),
+        pa.array(column("summary_short"), pa.string()),
+        pa.array(column("summary_full"), pa.string()),
+    ]
+    if include_transcripts:
+        arrays.append(pa.array(column("transcript"), pa.string()))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+def export_parquet(export_dir: Optional[str] = None, incremental: bool = True,
+                   batch_size: int = EXPORT_BATCH_SIZE, include_transcripts: bool = True) -> Dict:
+    """
+    Export tickets to a month-partitioned Parquet dataset.
+    
+    Archive partitions are read as well as the live database, so a full
+    export covers the whole history. Each run writes one part file per
+    month it touches, named after the first ticket id in it; files are
+    written under a temporary name and the watermark only advances once
+    every file is complete, so an interrupted run is simply repeated.
+    
+    Args:
+        export_dir (Optional[str]): Dataset directory, defaults to get_export_dir()
+        incremental (bool): Only export tickets newer than the watermark
+        batch_size (int): Tickets read per query and written per row group
+        include_transcripts (bool): Whether to include the transcript column
+    
+    Returns:
+        Dict: Rows exported, files written, new watermark and run time
+    
+    Raises:
+        ImportError: If pyarrow is not installed
+    """
+    pa, pq = _require_pyarrow()
+    started = time.perf_counter()
+    export_dir = export_dir or get_export_dir()
+    os.makedirs(export_dir, exist_ok=True)
+    watermark = read_watermark(export_dir) if incremental else 0
+    schema = _schema(pa, include_transcripts)
+    if not incremental:
+        # A full export replaces the dataset rather than adding duplicates
+        for name in os.listdir(export_dir):
+            if name.startswith("month="):
+                shutil.rmtree(os.path.join(export_dir, name))
+    
+    # Oldest first: archive partitions, then the live database
+    sources = [(db.ARCHIVE_SCHEMA, path) for _, path in reversed(db.list_archive_partitions())]
+    sources.append(("main", None))
+    
+    writers: Dict[str, tuple] = {}
+    rows_exported = 0
+    last_id = watermark
+    try:
+        for schema_name, path in sources:
+            select = _batch_select(schema_name, include_transcripts)
+            after = watermark
+            with db.get_connection_manager().reader() as conn:
+                with db.attached(conn, {schema_name: path} if path else None):
+                    while True:
+                        rows = conn.execute(select, (after, batch_size)).fetchall()
+                        if not rows:
+                            break
+                        by_month: Dict[str, List] = {}
+                        for row in rows:
+                            by_month.setdefault(_month(row), []).append(row)
+                        for month, month_rows in by_month.items():
+                            if month not in writers:
+                                partition = os.path.join(export_dir, f"month={month}")
+                                os.makedirs(partition, exist_ok=True)
+                                final = os.path.join(partition, f"part-{month_rows[0]['id']:010d}.parquet")
+                                writers[month] = (pq.ParquetWriter(final + ".tmp", schema), final)
+                            writers[month][0].write_table(_to_table(pa, schema, month_rows, include_transcripts))
+                        rows_exported += len(rows)
+                        after = rows[-1]["id"]
+                        last_id = max(last_id, after)
+    except BaseException:
+        for writer, final in writers.values():
+            writer.close()
+            os.remove(final + ".tmp")
+        raise
+    
+    files = []
+    for writer, final in writers.values():
+        writer.close()
+        os.replace(final + ".tmp", final)
+        files.append(final)
+    _write_watermark(export_dir, last_id, rows_exported)
+    
+    report = {
+        "rows": rows_exported,
+        "files": files,
+        "last_id": last_id,
+        "seconds": time.perf_counter() - started,
+    }
+    logger.info("parquet export finished in %.3fs, %d rows: %s", report["seconds"], rows_exported, report)
+    return report
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    full = "--full" in sys.argv[1:]
+    
+    db.init_db()
+    try:
+        export_parquet(args[0] if args else None, incremental=not full)
+    finally:
+        db.close_connections()
+
+if __name__ == "__main__":
+    main()
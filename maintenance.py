@@ -0,0 +1,383 @@
+"""
+Online backup and routine upkeep for the ticket database.
+
+Every task works against the live database while the app keeps running:
+backups copy a few pages per step, vacuum and optimize use short write
+transactions, and the WAL checkpoint never waits on readers or writers.
+Each task logs its duration and the pages it moved.
+
+Usage:
+    python maintenance.py [all|backup|optimize|vacuum|checkpoint|enable-incremental-vacuum] [backup_path]
+"""
+
+import sys
+import os
+import glob
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import db
+from config import (
+    DB_BUSY_TIMEOUT_MS, MAINT_BACKUP_DIR, MAINT_BACKUP_KEEP, MAINT_BACKUP_PAGES_PER_STEP,
+    MAINT_BACKUP_STEP_SLEEP, MAINT_VACUUM_PAGES_PER_STEP, MAINT_CHECKPOINT_MODE,
+    MAINT_ANALYSIS_LIMIT, MAINT_INTERVAL_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_MODES = ("PASSIVE", "FULL", "RESTART", "TRUNCATE")
+
+# Backup restarts tolerated before falling back to a single-step snapshot
+MAX_BACKUP_RESTARTS = 3
+
+class BackupRestarted(Exception):
+    """The source changed under a stepped backup too often to finish."""
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Open a plain connection for one maintenance task."""
+    conn = db.open_connection(path)
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+    return conn
+
+def _log_run(task: str, report: Dict) -> Dict:
+    logger.info(
+        "%s finished in %.3fs, %d pages: %s",
+        task, report["seconds"], report.get("pages", 0), report
+    )
+    return report
+
+def get_backup_dir() -> str:
+    """Directory holding the backups, next to the current database file."""
+    return os.path.join(os.path.dirname(os.path.abspath(db.DB_NAME)), MAINT_BACKUP_DIR)
+
+def list_backups() -> List[str]:
+    """
+    Get the backup files on disk.
+    
+    Returns:
+        List[str]: Backup paths, newest first
+    """
+    stem = os.path.splitext(os.path.basename(db.DB_NAME))[0]
+    return sorted(glob.glob(os.path.join(get_backup_dir(), f"{stem}-*.db")), reverse=True)
+
+def _prune_backups(keep: int) -> List[str]:
+    removed = list_backups()[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def backup_database(dest: Optional[str] = None, pages_per_step: int = MAINT_BACKUP_PAGES_PER_STEP,
+                    sleep_seconds: float = MAINT_BACKUP_STEP_SLEEP, keep: int = MAINT_BACKUP_KEEP) -> Dict:
+    """
+    Copy the live database to a backup file with the SQLite online backup API.
+    
+    The copy advances pages_per_step pages at a time and sleeps in between,
+    so each step holds its read snapshot only briefly and writers keep
+    committing. When another connection writes mid-copy, SQLite restarts
+    the backup from the first page; after MAX_BACKUP_RESTARTS the copy is
+    finished in one step instead, which in WAL mode still does not block
+    writers. The file is written under a temporary name, switched to a
+    rollback journal so it is self-contained, checked, then renamed.
+    
+    Archive partitions are separate files and are not included.
+    
+    Args:
+        dest (Optional[str]): Backup path, defaults to a timestamped file in get_backup_dir()
+        pages_per_step (int): Pages copied per step
+        sleep_seconds (float): Pause between steps
+        keep (int): Timestamped backups kept; older ones are deleted
+    
+    Returns:
+        Dict: Backup path, pages copied, steps, restarts, size and run time
+    
+    Raises:
+        sqlite3.DatabaseError: If the copy fails its integrity check
+    """
+    started = time.perf_counter()
+    default_dest = dest is None
+    if default_dest:
+        os.makedirs(get_backup_dir(), exist_ok=True)
+        stem = os.path.splitext(os.path.basename(db.DB_NAME))[0]
+        dest = os.path.join(get_backup_dir(), f"{stem}-{datetime.now():%Y%m%d-%H%M%S}.db")
+    partial = dest + ".part"
+    if os.path.exists(partial):
+        os.remove(partial)
+    
+    progress = {"steps": 0, "restarts": 0, "remaining": None, "pages": 0}
+    
+    def on_progress(status, remaining, total):
+        # remaining only grows when SQLite started the copy over
+        if progress["remaining"] is not None and remaining > progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > MAX_BACKUP_RESTARTS:
+                raise BackupRestarted()
+        progress["steps"] += 1
+        progress["remaining"] = remaining
+        progress["pages"] = total
+        # backup() only sleeps when a step hits a lock, so yield here;
+        # no lock is held between steps
+        if remaining and sleep_seconds:
+            time.sleep(sleep_seconds)
+    
+    source = _connect(db.DB_NAME)
+    target = db.open_connection(partial)
+    try:
+        try:
+            source.backup(target, pages=pages_per_step, progress=on_progress)
+        except BackupRestarted:
+            source.backup(target, pages=-1)
+            progress["steps"] += 1
+            progress["pages"] = target.execute("PRAGMA page_count").fetchone()[0]
+        target.execute("PRAGMA journal_mode = DELETE")
+        check = target.execute("PRAGMA quick_check").fetchone()[0]
+        if check != "ok":
+            raise sqlite3.DatabaseError(f"Backup failed quick_check: {check}")
+    except BaseException:
+        target.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(partial, dest)
+    
+    return _log_run("backup", {
+        "path": dest,
+        "pages": progress["pages"],
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "bytes": os.path.getsize(dest),
+        "pruned": _prune_backups(keep) if default_dest else [],
+        "seconds": time.perf_counter() - started,
+    })
+
+def optimize_database(analysis_limit: int = MAINT_ANALYSIS_LIMIT) -> Dict:
+    """
+    Refresh the query planner statistics with PRAGMA optimize.
+    
+    PRAGMA optimize only re-analyzes tables whose statistics are missing or
+    stale, and analysis_limit caps how many rows each index samples, so a
+    run stays short even on a large table. A database that has never been
+    analyzed gets one bounded ANALYZE first.
+    
+    Args:
+        analysis_limit (int): Rows examined per index (PRAGMA analysis_limit)
+    
+    Returns:
+        Dict: Whether a full ANALYZE ran, sqlite_stat1 rows and run time
+    """
+    started = time.perf_counter()
+    manager = db.get_connection_manager()
+    with manager.writer() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {int(analysis_limit)}")
+        analyzed = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone() is None
+        if analyzed:
+            conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        stat_rows = conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0]
+    
+    return _log_run("optimize", {
+        "full_analyze": analyzed,
+        "stat_rows": stat_rows,
+        "seconds": time.perf_counter() - started,
+    })
+
+def enable_incremental_vacuum() -> Dict:
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL.
+    
+    Databases created by init_db() already use it. Older files need one
+    full VACUUM to change the mode, which rewrites the whole file and holds
+    the write lock meanwhile, so run this once while the app is idle.
+    
+    Returns:
+        Dict: Pages in the rewritten file and run time
+    """
+    started = time.perf_counter()
+    conn = _connect(db.DB_NAME)
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+    db.get_connection_manager().invalidate_replica()
+    
+    return _log_run("enable-incremental-vacuum", {
+        "pages": pages,
+        "seconds": time.perf_counter() - started,
+    })
+
+def incremental_vacuum(pages_per_step: int = MAINT_VACUUM_PAGES_PER_STEP) -> Dict:
+    """
+    Return free pages to the file system a few at a time.
+    
+    Each step releases at most pages_per_step pages in its own short write
+    transaction, so queued ticket writes get the lock in between. Does
+    nothing unless the database uses auto_vacuum=INCREMENTAL (see
+    enable_incremental_vacuum()).
+    
+    Args:
+        pages_per_step (int): Pages released per transaction
+    
+    Returns:
+        Dict: Pages released, free pages left, steps and run time
+    """
+    started = time.perf_counter()
+    manager = db.get_connection_manager()
+    released = 0
+    steps = 0
+    with manager.reader() as conn:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    
+    if mode == 2:
+        while True:
+            with manager.writer() as conn:
+                free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                # The sqlite3 module steps this pragma once and each step frees
+                # one page, so the loop does what incremental_vacuum(N) would
+                for _ in range(min(free_before, pages_per_step)):
+                    conn.execute("PRAGMA incremental_vacuum")
+                free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            steps += 1
+            released += free_before - free_after
+            if free_after == 0 or free_after >= free_before:
+                break
+    
+    with manager.reader() as conn:
+        free_left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    
+    return _log_run("vacuum", {
+        "pages": released,
+        "free_pages": free_left,
+        "steps": steps,
+        "skipped": mode != 2,
+        "seconds": time.perf_counter() - started,
+    })
+
+def checkpoint_wal(mode: str = MAINT_CHECKPOINT_MODE) -> Dict:
+    """
+    Copy committed WAL frames back into the database file.
+    
+    PASSIVE checkpoints as much as it can without waiting on any reader or
+    writer; the stronger modes wait (up to the busy timeout) and, for
+    TRUNCATE, also shrink the WAL file to zero bytes.
+    
+    Args:
+        mode (str): One of CHECKPOINT_MODES
+    
+    Returns:
+        Dict: Frames in the WAL, frames checkpointed, whether it was busy, run time
+    
+    Raises:
+        ValueError: If mode is not a checkpoint mode
+    """
+    mode = mode.upper()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"Unknown checkpoint mode: {mode}")
+    
+    started = time.perf_counter()
+    conn = _connect(db.DB_NAME)
+    try:
+        busy, wal_frames, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    finally:
+        conn.close()
+    
+    return _log_run("checkpoint", {
+        "mode": mode,
+        "pages": max(checkpointed, 0),
+        "wal_frames": wal_frames,
+        "busy": bool(busy),
+        "seconds": time.perf_counter() - started,
+    })
+
+def run_maintenance(backup: bool = True, backup_path: Optional[str] = None) -> Dict:
+    """
+    Run every maintenance task once: checkpoint, optimize, vacuum, backup.
+    
+    Args:
+        backup (bool): Whether to take a backup
+        backup_path (Optional[str]): Backup path, see backup_database()
+    
+    Returns:
+        Dict: Report per task and total run time
+    """
+    started = time.perf_counter()
+    report = {
+        "checkpoint": checkpoint_wal(),
+        "optimize": optimize_database(),
+        "vacuum": incremental_vacuum(),
+    }
+    if backup:
+        report["backup"] = backup_database(backup_path)
+    report["seconds"] = time.perf_counter() - started
+    logger.info("maintenance finished in %.3fs", report["seconds"])
+    return report
+
+_maintenance_thread: Optional[threading.Thread] = None
+_maintenance_lock = threading.Lock()
+_maintenance_status: Dict = {"runs": 0, "last_result": None, "last_error": None}
+
+def _maintenance_loop(interval_seconds: float):
+    while True:
+        # Wait first so app restarts do not each trigger a backup
+        time.sleep(interval_seconds)
+        try:
+            _maintenance_status["last_result"] = run_maintenance()
+            _maintenance_status["last_error"] = None
+        except Exception as e:
+            logger.exception("maintenance failed")
+            _maintenance_status["last_error"] = str(e)
+        _maintenance_status["runs"] += 1
+
+def start_maintenance_worker(interval_seconds: float = MAINT_INTERVAL_SECONDS):
+    """Run run_maintenance() periodically on a background thread, once per process."""
+    global _maintenance_thread
+    with _maintenance_lock:
+        if _maintenance_thread is not None and _maintenance_thread.is_alive():
+            return
+        _maintenance_thread = threading.Thread(
+            target=_maintenance_loop, args=(interval_seconds,), name="db-maintenance", daemon=True
+        )
+        _maintenance_thread.start()
+
+def get_maintenance_status() -> Dict:
+    """
+    Get the backups on disk and the outcome of the last scheduled run.
+    
+    Returns:
+        Dict: Backup paths, run count, last result and last error
+    """
+    return {"backups": list_backups(), **_maintenance_status}
+
+TASKS = {
+    "all": lambda path: run_maintenance(backup_path=path),
+    "backup": backup_database,
+    "optimize": lambda path: optimize_database(),
+    "vacuum": lambda path: incremental_vacuum(),
+    "checkpoint": lambda path: checkpoint_wal(),
+    "enable-incremental-vacuum": lambda path: enable_incremental_vacuum(),
+}
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    task = sys.argv[1] if len(sys.argv) > 1 else "all"
+    if task not in TASKS:
+        print(f"Unknown task {task!r}; expected one of: {', '.join(TASKS)}")
+        sys.exit(2)
+    
+    db.init_db()
+    try:
+        TASKS[task](sys.argv[2] if len(sys.argv) > 2 else None)
+    finally:
+        db.close_connections()
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,24 @@ Test script to verify that all modules are working correctly.
 
 import sys
 import os
+import tempfile
+from contextlib import contextmanager
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+@contextmanager
+def temp_database(name: str):
+    """Point db.DB_NAME at a new database file in a temporary directory, yielding the directory."""
+    import db
+    
+    original_db_name = db.DB_NAME
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_NAME = os.path.join(tmp_dir, name)
+        try:
+            yield tmp_dir
+        finally:
+            db.close_connections()
+            db.DB_NAME = original_db_name
+
 def test_imports():
     """Test that all modules can be imported without errors."""
     try:
@@ -24,6 +40,12 @@ def test_imports():
         import app
         print("✓ app module imported successfully")
         
+        # Background workers start only under `streamlit run`, never on import
+        import maintenance
+        assert db._archive_thread is None, "archive worker started on import"
+        assert maintenance._maintenance_thread is None, "maintenance worker started on import"
+        print("✓ No background workers started on import")
+        
         return True
     except Exception as e:
         print(f"✗ Error importing modules: {e}")
@@ -67,6 +89,1368 @@ def test_database():
         print(f"✗ Error testing database: {e}")
         return False
 
+def test_connection_manager():
+    """Test that database connections are pooled and reused."""
+    try:
+        import db
+        
+        with temp_database("pool_test.db"):
+            db.init_db()
+            for _ in range(5):
+                db.get_ticket_count()
+            
+            stats = db.get_db_stats()
+            assert stats["read_reuses"] >= 4, stats
+            assert stats["connections_opened"] <= 2, stats
+            print(f"✓ {stats['connections_opened']} connections served {stats['read_checkouts']} reads")
+            
+            health = db.check_db_health()
+            assert health["ok"] and health["journal_mode"] == "wal", health
+            print("✓ Database health check passed (WAL mode)")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing connection manager: {e}")
+        return False
+
+def test_query_plans():
+    """Test that the hot ticket queries are served by their indexes."""
+    try:
+        import db
+        
+        with temp_database("plan_test.db"):
+            db.init_db()
+            plans = db.check_query_plans()
+            for name, plan in plans.items():
+                print(f"✓ {name}: {plan.splitlines()[0]}")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error checking query plans: {e}")
+        return False
+
+def test_search():
+    """Test full-text ticket search and its sync triggers."""
+    try:
+        import db
+        
+        with temp_database("search_test.db"):
+            db.init_db()
+            base_ticket = {
+                "caller_contact": None,
+                "intent_category": "billing_issue",
+                "department": "Billing",
+                "priority": "high",
+                "sentiment": "negative",
+                "summary_short": "Invoice problem",
+                "summary_full": "The caller disputes an invoice."
+            }
+            db.insert_ticket({**base_ticket, "caller_name": "Jane Doe",
+                              "transcript": "I was charged twice for my subscription."})
+            db.insert_ticket({**base_ticket, "caller_name": "John Smith", "priority": "low",
+                              "transcript": "Please call me back about the refund."})
+            
+            results = db.search_tickets("refund")
+            assert [t.caller_name for t in results] == ["John Smith"], results
+            assert "<mark>refund</mark>" in results[0].snippet, results[0].snippet
+            print(f"✓ Search found: {results[0].snippet}")
+            
+            assert len(db.search_tickets("jo smi")) == 1
+            assert len(db.search_tickets("invoice", priority="high")) == 1
+            assert db.search_tickets('"unbalanced AND (') == []
+            print("✓ Prefix search, filters and malformed input handled")
+            
+            assert len(db.search_tickets("billing")) == 2
+            assert len(db.search_tickets("billing_issue")) == 2
+            db.insert_ticket({**base_ticket, "caller_name": "Ann Lee", "intent_category": "appointment",
+                              "department": "Sales", "transcript": "Hello."})
+            assert [t.caller_name for t in db.search_tickets("sales")] == ["Ann Lee"]
+            assert [t.caller_name for t in db.search_tickets("appointment")] == ["Ann Lee"]
+            print("✓ Intent and department are searchable")
+            
+            # An index built with the older column set is rebuilt on startup
+            with db.get_connection_manager().writer() as conn:
+                for trigger in db.FTS_TRIGGERS:
+                    conn.execute(f"DROP TRIGGER {trigger}")
+                conn.execute("DROP TABLE tickets_fts")
+                conn.execute("CREATE VIRTUAL TABLE tickets_fts USING fts5(caller_name, content='tickets_full', content_rowid='id')")
+            db.init_db()
+            assert [t.caller_name for t in db.search_tickets("sales")] == ["Ann Lee"]
+            print("✓ Older search index upgraded")
+            
+            db.insert_ticket({**base_ticket, "caller_name": "Max", "transcript": "<script>alert(1)</script>"})
+            snippet = db.search_tickets("alert")[0].snippet
+            assert "<script>" not in snippet and "&lt;script&gt;<mark>alert</mark>" in snippet, snippet
+            print(f"✓ Snippet text is HTML-escaped: {snippet}")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing search: {e}")
+        return False
+
+def test_pagination():
+    """Test server-side filtering with keyset pagination."""
+    try:
+        import db
+        
+        with temp_database("page_test.db"):
+            db.init_db()
+            for i in range(25):
+                db.insert_ticket({
+                    "created_at": f"2025-01-01T10:{i // 2:02d}:00",  # pairs share a timestamp
+                    "caller_name": f"Caller {i}",
+                    "caller_contact": None,
+                    "intent_category": "general_query",
+                    "department": "Support" if i % 2 else "Sales",
+                    "priority": "medium",
+                    "sentiment": "neutral",
+                    "transcript": "Question about opening hours.",
+                    "summary_short": "Opening hours",
+                    "summary_full": "The caller asked about opening hours."
+                })
+            
+            seen = []
+            cursor = None
+            while True:
+                page, cursor = db.query_tickets(before=cursor, limit=10)
+                seen.extend(t.id for t in page)
+                if cursor is None:
+                    break
+            assert seen == list(range(25, 0, -1)), seen
+            print("✓ Keyset pagination walked 25 tickets in 3 pages")
+            
+            page, cursor = db.query_tickets(department="Support", text="hours", limit=20)
+            assert len(page) == 12 and cursor is None
+            assert all(t.department == "Support" for t in page)
+            print("✓ Department and text filters applied in SQL")
+            
+            detail = db.get_ticket(page[0].id)
+            assert detail["transcript"] == "Question about opening hours."
+            assert db.get_ticket(9999) is None
+            print("✓ Full ticket body loaded by id")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing pagination: {e}")
+        return False
+
+def test_bulk_insert():
+    """Test batched ticket insertion from a generator."""
+    try:
+        import db
+        
+        with temp_database("bulk_test.db"):
+            db.init_db()
+            first_id = db.insert_ticket({
+                "caller_name": "Single", "caller_contact": None,
+                "intent_category": "other", "department": "General",
+                "priority": "low", "sentiment": "neutral",
+                "transcript": "Single insert.", "summary_short": "Single",
+                "summary_full": "Single insert."
+            })
+            tickets = ({
+                "caller_name": f"Bulk {i}", "caller_contact": None,
+                "intent_category": "other", "department": "General",
+                "priority": "low", "sentiment": "neutral",
+                "transcript": f"Bulk insert number {i}.", "summary_short": "Bulk",
+                "summary_full": "Bulk insert."
+            } for i in range(25))
+            
+            ticket_ids = db.insert_tickets(tickets, batch_size=10)
+            assert ticket_ids == list(range(first_id + 1, first_id + 26)), ticket_ids
+            assert db.get_ticket_count() == 26
+            
+            page, _ = db.query_tickets(text="number 7", limit=5)
+            assert [t.id for t in page] == [ticket_ids[7]], page
+            print(f"✓ Bulk inserted {len(ticket_ids)} tickets in batches of 10")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing bulk insert: {e}")
+        return False
+
+def test_ticket_writer():
+    """Test the background writer with concurrent submitters."""
+    try:
+        import threading
+        import db
+        
+        with temp_database("writer_test.db"):
+            writer = db.TicketWriter(max_queue=50, max_batch=20)
+            try:
+                db.init_db()
+                futures = []
+                futures_lock = threading.Lock()
+                
+                def submit_many(thread_no):
+                    for i in range(20):
+                        future = writer.submit({
+                            "caller_name": f"Thread {thread_no} call {i}", "caller_contact": None,
+                            "intent_category": "other", "department": "General",
+                            "priority": "low", "sentiment": "neutral",
+                            "transcript": "Queued insert.", "summary_short": "Queued",
+                            "summary_full": "Queued insert."
+                        })
+                        with futures_lock:
+                            futures.append(future)
+                
+                threads = [threading.Thread(target=submit_many, args=(n,)) for n in range(5)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                
+                ticket_ids = [f.result(timeout=10) for f in futures]
+                assert len(set(ticket_ids)) == 100 and db.get_ticket_count() == 100
+                
+                try:
+                    writer.submit({"caller_name": "Incomplete"})
+                    raise AssertionError("incomplete ticket was accepted")
+                except KeyError:
+                    pass
+                
+                writer.close(timeout=10)
+                stats = writer.stats()
+                assert stats["committed"] == 100 and stats["queue_depth"] == 0, stats
+                print(f"✓ 100 queued tickets committed in {stats['group_commits']} group commits")
+            finally:
+                writer.close(timeout=10)
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing ticket writer: {e}")
+        return False
+
+def test_time_range():
+    """Test epoch timestamps, their backfill and time-range queries."""
+    try:
+        import sqlite3
+        from datetime import datetime, timedelta
+        import db
+        
+        with temp_database("range_test.db") as tmp_dir:
+            # A database in the original schema, without created_at_ms
+            conn = sqlite3.connect(db.DB_NAME)
+            conn.execute('''
+                CREATE TABLE tickets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL,
+                    caller_name TEXT, caller_contact TEXT, intent_category TEXT NOT NULL,
+                    department TEXT NOT NULL, priority TEXT NOT NULL, sentiment TEXT NOT NULL,
+                    transcript TEXT NOT NULL, summary_short TEXT NOT NULL, summary_full TEXT NOT NULL
+                )
+            ''')
+            now = datetime.now()
+            for days_ago in range(5):
+                conn.execute(
+                    "INSERT INTO tickets VALUES (NULL, ?, 'Old', NULL, 'other', 'General', 'low', "
+                    "'neutral', 'Legacy row.', 'Legacy', 'Legacy row.')",
+                    ((now - timedelta(days=days_ago)).isoformat(),)
+                )
+            conn.commit()
+            conn.close()
+            
+            db.init_db()
+            db._backfill_thread.join()
+            
+            # A backfill started for another file leaves this one alone
+            with db.get_connection_manager().writer() as conn:
+                conn.execute("UPDATE tickets SET created_at_ms = NULL")
+            assert db.migrate_created_at_ms(pause_seconds=0, db_name=os.path.join(tmp_dir, "other.db")) == 0
+            assert db.migrate_created_at_ms(batch_size=2, pause_seconds=0) == 5
+            
+            start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            today = db.fetch_tickets_between(start_of_today, start_of_today + timedelta(days=1))
+            assert len(today) == 1 and today[0].created_at_ms == db.to_epoch_ms(today[0].created_at)
+            
+            last_three_days = db.fetch_tickets_between(start_of_today - timedelta(days=2), now + timedelta(seconds=1))
+            assert len(last_three_days) == 3, last_three_days
+            print("✓ Legacy rows backfilled and range queries return the right days")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing time-range queries: {e}")
+        return False
+
+def test_rollups():
+    """Test rollup counts and the facet cache built on them."""
+    try:
+        import db
+        
+        with temp_database("rollup_test.db"):
+            db.init_db()
+            tickets = []
+            for i in range(12):
+                tickets.append({
+                    "created_at": f"2025-03-0{1 + i % 3}T09:00:00",
+                    "caller_name": None, "caller_contact": None,
+                    "intent_category": "billing_issue" if i % 2 else "complaint",
+                    "department": "Billing" if i % 2 else "Support",
+                    "priority": "high" if i < 4 else "low",
+                    "sentiment": "negative",
+                    "transcript": "Rollup test.", "summary_short": "Rollup",
+                    "summary_full": "Rollup test."
+                })
+            ticket_ids = db.insert_tickets(tickets)
+            assert db.get_ticket_count() == 12
+            
+            by_department = {s["department"]: s["count"] for s in db.get_stats(group_by=["department"])}
+            assert by_department == {"Billing": 6, "Support": 6}, by_department
+            
+            day_one = db.get_stats(("2025-03-01", "2025-03-02"), ["priority"])
+            assert {s["priority"]: s["count"] for s in day_one} == {"high": 2, "low": 2}, day_one
+            
+            with db.get_connection_manager().writer() as conn:
+                conn.execute("UPDATE tickets SET department = ? WHERE id = ?", (db.DEPARTMENTS.index("HR"), ticket_ids[0]))
+                conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_ids[1],))
+            by_department = {s["department"]: s["count"] for s in db.get_stats(group_by=["department"])}
+            assert by_department == {"Billing": 5, "Support": 5, "HR": 1}, by_department
+            assert db.get_ticket_count() == 11
+            print(f"✓ Rollups track inserts, updates and deletes: {by_department}")
+            
+            facets = db.get_facets()
+            assert facets["department"] == {"Billing": 5, "HR": 1, "Support": 5}, facets
+            assert db.get_facets() is facets
+            db.insert_ticket({**tickets[2], "department": "Sales"})
+            assert db.get_facets()["department"]["Sales"] == 1
+            print("✓ Facet cache reused until the database changed")
+            
+            # Days are UTC, like created_at_ms: just after midnight at
+            # UTC+2 is still the previous day in the rollups
+            from datetime import datetime, timezone
+            db.insert_ticket({**tickets[0], "created_at": "2025-03-05T00:30:00+02:00"})
+            utc_day = (datetime(2025, 3, 4, tzinfo=timezone.utc), datetime(2025, 3, 5, tzinfo=timezone.utc))
+            assert db.get_stats(utc_day)[0]["count"] == len(db.fetch_tickets_between(*utc_day)) == 1
+            assert db.get_stats(("2025-03-05", "2025-03-06"))[0]["count"] == 0
+            
+            # Rollups keyed by the local day are rebuilt on upgrade
+            with db.get_connection_manager().writer() as conn:
+                conn.execute("DROP TRIGGER ticket_rollups_ai")
+                conn.execute("CREATE TRIGGER ticket_rollups_ai AFTER INSERT ON tickets BEGIN SELECT substr(new.created_at, 1, 10); END")
+                conn.execute("UPDATE ticket_rollups SET day = '2025-03-05' WHERE day = '2025-03-04'")
+            db.init_db()
+            assert db.get_stats(utc_day)[0]["count"] == 1
+            assert db.get_ticket_count() == 13
+            print("✓ Rollup days are UTC and agree with range queries")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing rollups: {e}")
+        return False
+
+def test_ticket_bodies():
+    """Test migrating transcripts into compressed ticket bodies."""
+    try:
+        import sqlite3
+        import db
+        
+        with temp_database("bodies_test.db"):
+            # A database with transcripts stored inline in tickets
+            conn = sqlite3.connect(db.DB_NAME)
+            conn.execute('''
+                CREATE TABLE tickets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL,
+                    caller_name TEXT, caller_contact TEXT, intent_category TEXT NOT NULL,
+                    department TEXT NOT NULL, priority TEXT NOT NULL, sentiment TEXT NOT NULL,
+                    transcript TEXT NOT NULL, summary_short TEXT NOT NULL, summary_full TEXT NOT NULL
+                )
+            ''')
+            for i in range(60):
+                conn.execute(
+                    "INSERT INTO tickets VALUES (NULL, '2025-01-01T09:00:00', ?, NULL, 'other', "
+                    "'General', 'low', 'neutral', ?, 'Callback', 'The caller asked for a callback.')",
+                    (f"Caller {i}", f"Hi, this is caller number {i}. Please call me back about my account.")
+                )
+            conn.commit()
+            conn.close()
+            
+            db.init_db()
+            with db.get_connection_manager().reader() as conn:
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(tickets)")}
+                stored = conn.execute("SELECT dict_id, transcript FROM ticket_bodies WHERE ticket_id = 7").fetchone()
+            assert "transcript" not in columns and "summary_full" not in columns, columns
+            assert stored["dict_id"] is not None and isinstance(stored["transcript"], bytes)
+            assert db.get_ticket(7)["transcript"] == "Hi, this is caller number 6. Please call me back about my account."
+            
+            new_id = db.insert_ticket({
+                "caller_name": "After migration", "caller_contact": None,
+                "intent_category": "other", "department": "General",
+                "priority": "low", "sentiment": "neutral",
+                "transcript": "A brand new transcript about invoices.",
+                "summary_short": "New", "summary_full": "A new ticket."
+            })
+            assert [t.id for t in db.search_tickets("invoices")] == [new_id]
+            assert len(db.search_tickets("caller number", limit=None)) == 60
+            print(f"✓ Migrated 60 transcripts into compressed ticket bodies ({len(stored['transcript'])} bytes for one)")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing ticket bodies: {e}")
+        return False
+
+def test_archive():
+    """Test moving old tickets into archive partitions and querying across them."""
+    try:
+        from datetime import datetime
+        import db
+        
+        with temp_database("archive_test.db"):
+            db.init_db()
+            tickets = []
+            for month, day in [(1, 5), (1, 20), (2, 3), (3, 9), (6, 1), (6, 2)]:
+                tickets.append({
+                    "created_at": f"2024-{month:02d}-{day:02d}T10:00:00",
+                    "caller_name": f"Caller {month}-{day}", "caller_contact": None,
+                    "intent_category": "complaint", "department": "Support",
+                    "priority": "high", "sentiment": "negative",
+                    "transcript": f"Archived zebra call from month {month}.",
+                    "summary_short": "Archive", "summary_full": "Archive test."
+                })
+            ticket_ids = db.insert_tickets(tickets)
+            
+            moved = db.archive_old_tickets(keep_months=2, batch_size=1, now=datetime(2024, 6, 15))
+            assert moved == {"2024-01": 2, "2024-02": 1, "2024-03": 1}, moved
+            assert [month for month, _ in db.list_archive_partitions()] == ["2024-03", "2024-02", "2024-01"]
+            live, _ = db.query_tickets(limit=10)
+            assert [t.id for t in live] == ticket_ids[:3:-1]
+            assert db.get_ticket_count() == 6
+            print(f"✓ Archived {sum(moved.values())} tickets into {len(moved)} monthly partitions")
+            
+            history, cursor = db.query_history(limit=4)
+            older, cursor = db.query_history(limit=4, before=cursor)
+            assert [t.id for t in history + older] == ticket_ids[::-1] and cursor is None
+            found, _ = db.query_history(text="zebra", start="2024-01-01", end="2024-02-01")
+            assert [t.id for t in found] == ticket_ids[1::-1] and "<mark>" in found[0].snippet
+            assert db.get_ticket(ticket_ids[0])["transcript"] == "Archived zebra call from month 1."
+            print("✓ History queries UNION the live database with the archives")
+            
+            assert db.apply_retention(4, "purge_transcripts", now=datetime(2024, 6, 15)) == {"2024-01": "purge_transcripts"}
+            assert db.get_ticket(ticket_ids[0])["transcript"] is None
+            assert db.get_ticket(ticket_ids[0])["caller_name"] == "Caller 1-5"
+            assert db.apply_retention(4, "delete", now=datetime(2024, 6, 15)) == {"2024-01": "delete"}
+            assert db.get_ticket(ticket_ids[0]) is None and db.get_ticket_count() == 4
+            print("✓ Retention purges transcripts or deletes expired partitions")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing archive: {e}")
+        return False
+
+def test_read_replica():
+    """Test serving reads from the in-memory replica."""
+    try:
+        import db
+        
+        original_replica = db.DB_READ_REPLICA
+        with temp_database("replica_test.db"):
+            db.DB_READ_REPLICA = True
+            try:
+                db.init_db()
+                ticket = {
+                    "caller_name": "Replica Caller", "caller_contact": None,
+                    "intent_category": "other", "department": "General",
+                    "priority": "low", "sentiment": "neutral",
+                    "transcript": "Checking the walrus replica.",
+                    "summary_short": "Replica", "summary_full": "Replica test."
+                }
+                ticket_ids = db.insert_tickets([ticket] * 5)
+                db.sync_read_replica()
+                with db.get_connection_manager().reader() as conn:
+                    assert conn.execute("PRAGMA database_list").fetchone()["file"] == ""
+                assert db.get_ticket_count() == 5 and len(db.search_tickets("walrus")) == 5
+                
+                db.insert_ticket({**ticket, "caller_name": "Newest Caller"})
+                db.sync_read_replica()
+                assert db.query_tickets(limit=1)[0][0].caller_name == "Newest Caller"
+                
+                with db.get_connection_manager().writer() as conn:
+                    conn.execute("DELETE FROM tickets WHERE id = ?", (ticket_ids[0],))
+                db.sync_read_replica()
+                stats = db.get_db_stats()["replica"]
+                assert db.get_ticket_count() == 5 and db.get_facets()["department"] == {"General": 5}
+                assert stats["incremental_refreshes"] >= 1 and stats["rebuilds"] == 2, stats
+                print(f"✓ Replica refreshed incrementally and rebuilt after a delete (lag {stats['max_lag_seconds']:.4f}s max)")
+            finally:
+                db.DB_READ_REPLICA = original_replica
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing read replica: {e}")
+        return False
+
+def test_enum_columns():
+    """Test integer-coded categorical columns."""
+    try:
+        import sqlite3
+        import db
+        
+        with temp_database("enum_test.db"):
+            # Categorical columns stored as TEXT, as before the encoding
+            conn = sqlite3.connect(db.DB_NAME)
+            conn.execute('''
+                CREATE TABLE tickets (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TEXT NOT NULL,
+                    caller_name TEXT, caller_contact TEXT, intent_category TEXT NOT NULL,
+                    department TEXT NOT NULL, priority TEXT NOT NULL, sentiment TEXT NOT NULL,
+                    transcript TEXT NOT NULL, summary_short TEXT NOT NULL, summary_full TEXT NOT NULL
+                )
+            ''')
+            for i, priority in enumerate(["medium", "critical", "low", "high"]):
+                conn.execute(
+                    "INSERT INTO tickets VALUES (NULL, ?, NULL, NULL, 'billing_issue', 'Billing', ?, 'neutral', "
+                    "'Enum test.', 'Enum', 'Enum test.')",
+                    (f"2025-02-0{i + 1}T09:00:00", priority)
+                )
+            conn.commit()
+            conn.close()
+            
+            db.init_db()
+            with db.get_connection_manager().reader() as conn:
+                stored = conn.execute("SELECT department, priority FROM tickets WHERE id = 2").fetchone()
+            assert tuple(stored) == (db.DEPARTMENTS.index("Billing"), db.PRIORITIES.index("critical")), tuple(stored)
+            assert db.get_ticket(2)["priority"] == "critical"
+            assert [t.priority for t in db.fetch_urgent_tickets()] == ["critical", "high", "medium", "low"]
+            assert [t.id for t in db.query_tickets(priority="High")[0]] == [4]
+            assert db.query_tickets(department="Nowhere")[0] == []
+            print("✓ Enum columns re-encoded as integers and sorted by urgency in SQL")
+            
+            # Off-list model answers are matched loosely or stored as the default
+            ticket_id = db.submit_ticket({
+                **db.get_ticket(1), "department": "IT Support", "priority": "High",
+                "intent_category": "Billing Issue", "sentiment": None
+            }).result()
+            stored = db.get_ticket(ticket_id)
+            assert (stored["department"], stored["priority"], stored["intent_category"], stored["sentiment"]) == (
+                "General", "high", "billing_issue", "neutral"), stored
+            print("✓ Off-list enum values normalized on insert")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing enum columns: {e}")
+        return False
+
+def test_maintenance():
+    """Test online backup and scheduled maintenance tasks."""
+    try:
+        import sqlite3
+        import db
+        import maintenance
+        
+        with temp_database("maintenance_test.db") as tmp_dir:
+            db.init_db()
+            db.insert_tickets({
+                "caller_name": f"Caller {i}",
+                "intent_category": "support_request",
+                "department": "Support",
+                "priority": "low",
+                "sentiment": "neutral",
+                "transcript": f"Maintenance ticket {i}. " + "Padding text for free pages. " * 60,
+                "summary_short": "Maintenance",
+                "summary_full": "Maintenance test ticket."
+            } for i in range(200))
+            with db.get_connection_manager().writer() as conn:
+                conn.execute("DELETE FROM tickets WHERE id > 20")
+            
+            report = maintenance.run_maintenance()
+            assert not report["vacuum"]["skipped"] and report["vacuum"]["pages"] > 0, report["vacuum"]
+            assert report["vacuum"]["free_pages"] == 0
+            assert report["optimize"]["stat_rows"] > 0
+            assert report["checkpoint"]["mode"] == "PASSIVE"
+            print(f"✓ Incremental vacuum released {report['vacuum']['pages']} pages; statistics refreshed")
+            
+            backup = report["backup"]
+            assert maintenance.list_backups() == [backup["path"]]
+            assert backup["steps"] >= 1 and backup["pages"] > 0
+            copy = sqlite3.connect(backup["path"])
+            assert copy.execute("SELECT COUNT(*) FROM tickets").fetchone()[0] == 20
+            assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+            copy.close()
+            print(f"✓ Online backup copied {backup['pages']} pages in {backup['steps']} steps")
+            
+            # Connections opened outside the manager can read the
+            # decompressing view, loading dictionaries through themselves
+            db._zdicts.clear()
+            copy = maintenance._connect(backup["path"])
+            row = copy.execute("SELECT transcript FROM tickets_full WHERE id = 1").fetchone()
+            assert row[0].startswith("Maintenance ticket 0."), row
+            copy.close()
+            print("✓ Plain connection reads tickets_full from the backup")
+            
+            # Commits from another connection restart a stepped copy; the
+            # backup must still finish once the restart limit is hit
+            import threading
+            stop = threading.Event()
+            def keep_writing():
+                while not stop.is_set():
+                    db.insert_ticket({**db.get_ticket(1), "caller_name": "During backup"})
+            writer = threading.Thread(target=keep_writing)
+            writer.start()
+            try:
+                dest = os.path.join(tmp_dir, "explicit.db")
+                result = maintenance.backup_database(dest, pages_per_step=1, sleep_seconds=0.01)
+            finally:
+                stop.set()
+                writer.join()
+            assert result["restarts"] > 0 and result["pruned"] == [], result
+            assert maintenance.list_backups() == [backup["path"]]
+            print(f"✓ Backup finished under concurrent writes ({result['restarts']} restarts)")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing maintenance: {e}")
+        return False
+
+def test_parquet_export():
+    """Test incremental Parquet export (requires pyarrow)."""
+    try:
+        import db
+        import export
+        
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("ℹ️  pyarrow not installed - skipping Parquet export tests")
+            return True
+        
+        with temp_database("export_test.db") as tmp_dir:
+            db.init_db()
+            def ticket(month, i):
+                return {
+                    "created_at": f"2099-{month:02d}-{i + 1:02d}T10:00:00",
+                    "caller_name": f"Caller {i}",
+                    "intent_category": "billing_issue",
+                    "department": "Billing",
+                    "priority": "high" if i % 2 else "low",
+                    "sentiment": "neutral",
+                    "transcript": f"Export ticket {i}.",
+                    "summary_short": "Export",
+                    "summary_full": "Export test ticket."
+                }
+            db.insert_tickets([ticket(1, i) for i in range(5)] + [ticket(2, i) for i in range(3)])
+            
+            export_dir = os.path.join(tmp_dir, "parquet")
+            report = export.export_parquet(export_dir, batch_size=3)
+            assert report["rows"] == 8 and report["last_id"] == 8, report
+            assert sorted(os.listdir(export_dir)) == ["_watermark.json", "month=2099-01", "month=2099-02"]
+            table = pq.read_table(export_dir)
+            assert table.num_rows == 8
+            assert str(table.schema.field("priority").type) == "dictionary<values=string, indices=int8, ordered=0>"
+            assert table.column("department").to_pylist() == ["Billing"] * 8
+            print("✓ Tickets exported to month partitions with dictionary-encoded categories")
+            
+            db.insert_ticket(ticket(2, 10))
+            report = export.export_parquet(export_dir)
+            assert report["rows"] == 1 and export.read_watermark(export_dir) == 9, report
+            assert pq.read_table(export_dir).num_rows == 9
+            assert export.export_parquet(export_dir)["rows"] == 0
+            assert export.export_parquet(export_dir, incremental=False)["rows"] == 9
+            assert pq.read_table(export_dir).num_rows == 9
+            print("✓ Incremental export only wrote tickets past the watermark")
+            
+            # Partitioned by the UTC month, like the created_at column: just
+            # after midnight on March 1st at UTC+2 is still February
+            db.insert_ticket({**ticket(3, 0), "created_at": "2099-03-01T00:30:00+02:00"})
+            assert export.export_parquet(export_dir)["rows"] == 1
+            assert "month=2099-03" not in os.listdir(export_dir)
+            february = pq.read_table(os.path.join(export_dir, "month=2099-02"))
+            assert february.num_rows == 5 and max(february.column("created_at").to_pylist()).month == 2
+            print("✓ Parquet months are UTC months")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing Parquet export: {e}")
+        return False
+
+def test_stream_export():
+    """Test streaming CSV/JSONL export."""
+    try:
+        import csv
+        import json
+        import db
+        
+        with temp_database("stream_export_test.db"):
+            db.init_db()
+            db.insert_tickets({
+                "created_at": f"2099-03-{i + 1:02d}T10:00:00",
+                "caller_name": f"Caller {i}",
+                "intent_category": "support_request",
+                "department": "Support" if i % 2 else "Billing",
+                "priority": "medium",
+                "sentiment": "neutral",
+                "transcript": f"Streaming export ticket {i}, with a comma." + (" Router reset." if i < 4 else ""),
+                "summary_short": "Stream",
+                "summary_full": "Streaming export test."
+            } for i in range(10))
+            
+            chunks = list(db.export_tickets("csv", batch_size=3))
+            assert len(chunks) == 1 + 4, len(chunks)  # header + ceil(10 / 3) batches
+            rows = list(csv.DictReader("".join(chunks).splitlines()))
+            assert [int(r["id"]) for r in rows] == list(range(10, 0, -1))
+            assert rows[0]["department"] == "Support" and rows[-1]["transcript"].endswith("Router reset.")
+            print("✓ CSV export streamed in batches, newest first")
+            
+            # A ticket deleted mid-export is still in the export's snapshot
+            export = db.export_tickets("csv", batch_size=3)
+            chunks = [next(export), next(export)]
+            with db.get_connection_manager().writer() as conn:
+                conn.execute("DELETE FROM tickets WHERE id = 1")
+            chunks.extend(export)
+            rows = list(csv.DictReader("".join(chunks).splitlines()))
+            assert [int(r["id"]) for r in rows] == list(range(10, 0, -1)), rows
+            assert len(list(csv.DictReader("".join(db.export_tickets("csv")).splitlines()))) == 9
+            print("✓ Export reads one snapshot")
+            
+            lines = "".join(db.export_tickets("jsonl", department="Support", text="router")).splitlines()
+            assert [json.loads(line)["id"] for line in lines] == [4, 2]
+            assert db.query_tickets(department="Support", text="router")[0][0].id == 4
+            print("✓ JSONL export honors department and search filters")
+            
+            # A search with no usable terms still exports a header-only CSV
+            assert "".join(db.export_tickets("csv", text="?!")) == ",".join(db.EXPORT_COLUMNS) + "\r\n"
+            assert list(db.export_tickets("jsonl", text="?!")) == []
+            
+            try:
+                next(db.export_tickets("xml"))
+                raise AssertionError("unknown format was accepted")
+            except ValueError:
+                pass
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing streaming export: {e}")
+        return False
+
+def test_gemini_client_manager():
+    """Test that Gemini configuration and models are reused across calls."""
+    try:
+        from ai_core import GeminiClientManager
+        
+        manager = GeminiClientManager(api_key="test-key", transport="rest", api_endpoint="http://127.0.0.1:9")
+        config = {"temperature": 0.3, "response_mime_type": "application/json"}
+        model = manager.get_model("models/test", config)
+        assert manager.get_model("models/test", dict(reversed(list(config.items())))) is model
+        assert manager.get_model("models/test") is not model
+        assert manager.get_model("models/test", config, system_instruction="Be brief") is not model
+        stats = manager.stats()
+        assert stats["configures"] == 1 and stats["models_created"] == 3 and stats["model_reuses"] == 1, stats
+        print("✓ SDK configured once; models cached per name, config and system instruction")
+        
+        try:
+            GeminiClientManager(api_key=None).get_model("models/test")
+            raise AssertionError("missing API key was accepted")
+        except ValueError:
+            print("✓ Missing API key reported before any request")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing Gemini client manager: {e}")
+        return False
+
+def test_process_call_audio():
+    """Test the single-request transcribe-and-analyze path and its fallback."""
+    try:
+        import json
+        import ai_core
+        from types import SimpleNamespace
+        
+        analysis = {
+            "caller_name": "Dana", "caller_contact": None, "intent_category": "billing_issue",
+            "sentiment": "neutral", "priority": "medium", "department": "Billing",
+            "summary_short": "Invoice question", "summary_full": "Dana asked about an invoice."
+        }
+        
+        class FakeModel:
+            """Returns queued responses and records the prompts it was sent."""
+            def __init__(self, responses):
+                self.responses = list(responses)
+                self.prompts = []
+            def generate_content(self, contents, **kwargs):
+                self.prompts.append(contents[0])
+                return SimpleNamespace(text=self.responses.pop(0))
+        
+        original = (ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file,
+                    ai_core.ANALYSIS_CACHE_ENABLED, ai_core.INLINE_AUDIO_MAX_BYTES)
+        deleted = []
+        ai_core._upload_audio = lambda path: SimpleNamespace(name="files/test")
+        ai_core.genai.delete_file = deleted.append
+        ai_core.ANALYSIS_CACHE_ENABLED = False
+        ai_core.INLINE_AUDIO_MAX_BYTES = 0  # Upload path
+        try:
+            model = FakeModel([json.dumps({"transcript": "Hi, this is Dana.", **analysis})])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            result = ai_core.process_call_audio("call.wav")
+            assert result == {"transcript": "Hi, this is Dana.", **analysis}, result
+            assert ai_core.wait_for_file_cleanup(5)
+            assert model.prompts == [ai_core.COMBINED_PROMPT] and deleted == ["files/test"]
+            print("✓ Transcript and analysis returned by one request")
+            
+            # Invalid department: the transcript is kept and analyze_call() runs
+            model = FakeModel([
+                json.dumps({"transcript": "Hi, this is Dana.", **analysis, "department": "Accounts"}),
+                json.dumps(analysis)
+            ])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            result = ai_core.process_call_audio("call.wav")
+            assert result["department"] == "Billing" and result["transcript"] == "Hi, this is Dana."
+            assert model.prompts == [ai_core.COMBINED_PROMPT, ai_core.ANALYSIS_PROMPT], model.prompts
+            
+            # Case differences are not worth a second request; analyze_call()
+            # stores what is still off-list as the default
+            model = FakeModel([
+                json.dumps({"transcript": "Hi, this is Dana.", **analysis, "priority": "High"}),
+                json.dumps({**analysis, "department": "IT Support", "sentiment": "Annoyed"})
+            ])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            assert ai_core.process_call_audio("call.wav")["priority"] == "high"
+            result = ai_core.analyze_call("Hi, this is Dana.")
+            assert (result["department"], result["sentiment"]) == ("General", "neutral") and ai_core.validate_analysis(result)
+            print("✓ Off-list model values normalized before validation")
+            
+            # Unparseable response: transcribe the uploaded file, then analyze
+            model = FakeModel(["not json", "Hi, this is Dana.", json.dumps(analysis)])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            reserved = []
+            result = ai_core.process_call_audio("call.wav", before_fallback=reserved.append)
+            assert result["transcript"] == "Hi, this is Dana." and ai_core.validate_analysis(result)
+            assert reserved == ["transcribe", "analyze"], reserved
+            assert ai_core.wait_for_file_cleanup(5)
+            assert model.prompts[1] == ai_core.TRANSCRIPTION_PROMPT and len(deleted) == 4
+            print("✓ Invalid combined responses fall back to the two-step path")
+        finally:
+            (ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file,
+             ai_core.ANALYSIS_CACHE_ENABLED, ai_core.INLINE_AUDIO_MAX_BYTES) = original
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing process_call_audio: {e}")
+        return False
+
+def test_async_ai_core():
+    """Test the async AI core: concurrency, cancellation and per-loop clients."""
+    try:
+        import asyncio
+        import json
+        import time
+        import ai_core
+        from types import SimpleNamespace
+        
+        analysis = {
+            "caller_name": None, "caller_contact": None, "intent_category": "general_query",
+            "sentiment": "neutral", "priority": "low", "department": "General",
+            "summary_short": "Question", "summary_full": "The caller asked a question."
+        }
+        
+        class FakeAsyncModel:
+            async def generate_content_async(self, contents, **kwargs):
+                await asyncio.sleep(0.1)
+                return SimpleNamespace(text=json.dumps({"transcript": "Hello.", **analysis}))
+        
+        original = (ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file, ai_core.INLINE_AUDIO_MAX_BYTES)
+        uploaded, deleted = [], []
+        def slow_upload(path):
+            time.sleep(0.05)
+            uploaded.append(path)
+            return SimpleNamespace(name=f"files/{path}")
+        ai_core._upload_audio = slow_upload
+        ai_core.genai.delete_file = deleted.append
+        ai_core._client_manager = SimpleNamespace(get_async_model=lambda *args, **kwargs: FakeAsyncModel())
+        ai_core.INLINE_AUDIO_MAX_BYTES = 0  # Upload path
+        try:
+            async def many():
+                started = time.perf_counter()
+                results = await asyncio.gather(*(ai_core.run_call_pipeline_async(f"call{i}.wav", combined=True) for i in range(8)))
+                return results, time.perf_counter() - started
+            results, elapsed = asyncio.run(many())
+            assert ai_core.wait_for_file_cleanup(5)
+            assert all(r["transcript"] == "Hello." for r in results) and len(deleted) == 8
+            assert elapsed < 0.5, elapsed  # 8 sequential calls would take over 1.2s
+            print(f"✓ 8 calls in flight on one event loop finished in {elapsed:.2f}s")
+            
+            async def cancel_during_upload():
+                task = asyncio.create_task(ai_core.transcribe_audio_async("cancelled.wav"))
+                await asyncio.sleep(0.01)
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    return True
+                return False
+            assert asyncio.run(cancel_during_upload())
+            time.sleep(0.2)
+            assert ai_core.wait_for_file_cleanup(5)
+            assert "files/cancelled.wav" in deleted, deleted
+            print("✓ Cancelled upload is cleaned up once it lands")
+        finally:
+            (ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file,
+             ai_core.INLINE_AUDIO_MAX_BYTES) = original
+        
+        manager = ai_core.GeminiClientManager(api_key="test-key")
+        async def model_pair():
+            return manager.get_async_model("models/test"), manager.get_async_model("models/test")
+        first, again = asyncio.run(model_pair())
+        second, _ = asyncio.run(model_pair())
+        assert first is again and first is not second and first._async_client is not second._async_client
+        print("✓ Async models cached per event loop")
+        
+        # An SDK version not known to use _async_client keeps its own binding
+        original_versions = ai_core.SDK_ASYNC_CLIENT_VERSIONS
+        ai_core.SDK_ASYNC_CLIENT_VERSIONS = []
+        try:
+            manager = ai_core.GeminiClientManager(api_key="test-key")
+            unverified, _ = asyncio.run(model_pair())
+            assert unverified._async_client is None and "client" not in list(manager._async_models.values())[0]
+        finally:
+            ai_core.SDK_ASYNC_CLIENT_VERSIONS = original_versions
+        print("✓ Private async client only set on verified SDK versions")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing async AI core: {e}")
+        return False
+
+def test_batch_processor():
+    """Test quota-aware batch processing."""
+    try:
+        import time
+        import sqlite3
+        import tempfile
+        import ai_core
+        import batch_processor
+        import db
+        from concurrent.futures import Future
+        from google.api_core import exceptions as google_exceptions
+        
+        now = [0.0]
+        def advance(seconds):
+            now[0] += seconds
+        bucket = batch_processor.TokenBucket(per_minute=600, capacity=1, clock=lambda: now[0], wait=advance)
+        waited = sum(bucket.acquire() for _ in range(4))
+        assert abs(waited - 0.3) < 1e-9 and abs(now[0] - 0.3) < 1e-9, (waited, now)  # 3 refills at 10 per second
+        print(f"✓ Token bucket paced 4 requests at 10/s ({waited:.2f}s)")
+        
+        analysis = {
+            "transcript": "Please call me back.", "caller_name": None, "caller_contact": None,
+            "intent_category": "general_query", "sentiment": "neutral", "priority": "low",
+            "department": "General", "summary_short": "Callback", "summary_full": "Callback request."
+        }
+        calls = {"count": 0}
+        def flaky_pipeline(path, raise_on_error=False, before_fallback=None, use_cache=True):
+            assert raise_on_error
+            calls["count"] += 1
+            if calls["count"] in (2, 3):
+                raise google_exceptions.ResourceExhausted("Quota exceeded")
+            if calls["count"] == 4:
+                # Invalid combined reply: the two fallback requests are reserved as well
+                before_fallback("transcribe")
+                before_fallback("analyze")
+            time.sleep(0.02)
+            return dict(analysis)
+        
+        original = ai_core.process_call_audio
+        ai_core.process_call_audio = flaky_pipeline
+        progress = []
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                paths = []
+                for i in range(6):
+                    path = os.path.join(tmp_dir, f"voicemail{i}.mp3")
+                    with open(path, "wb") as f:
+                        f.write(b"\0" * 16000)
+                    paths.append(path)
+                
+                processor = batch_processor.BatchProcessor(
+                    max_workers=4, requests_per_minute=6000, combined=True, store=False,
+                    backoff_seconds=0.01, on_progress=lambda path, status, detail: progress.append(status)
+                )
+                report = processor.run(paths)
+                
+                # A ticket the database rejects fails its file; the batch carries on
+                submitted = []
+                def flaky_submit(ticket):
+                    future = Future()
+                    if len(submitted) == 1:
+                        future.set_exception(sqlite3.OperationalError("database is locked"))
+                    else:
+                        future.set_result(len(submitted) + 1)
+                    submitted.append(ticket)
+                    return future
+                original_submit = db.submit_ticket
+                db.submit_ticket = flaky_submit
+                try:
+                    processor = batch_processor.BatchProcessor(
+                        max_workers=2, requests_per_minute=6000, combined=True, store=True, force=True
+                    )
+                    store_report = processor.run(paths[:3])
+                finally:
+                    db.submit_ticket = original_submit
+        finally:
+            ai_core.process_call_audio = original
+        
+        assert report["succeeded"] == 6 and report["quota_errors"] == 2, report
+        assert report["lowest_concurrency"] == 1 and report["requests"] == 10, report
+        assert progress.count("retrying") == 2 and progress.count("done") == 6
+        assert all(r.analysis["department"] == "General" for r in report["results"])
+        print(f"✓ Batch of 6 finished after 2 quota errors; concurrency backed off to {report['lowest_concurrency']}")
+        
+        failed = [r for r in store_report["results"] if r.status == "failed"]
+        assert store_report["succeeded"] == 2 and len(failed) == 1, store_report
+        assert "database is locked" in failed[0].error and failed[0].ticket_id is None
+        print("✓ A rejected ticket fails only its own file")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing batch processor: {e}")
+        return False
+
+def test_resilience():
+    """Test retries, the circuit breaker and hedging around model calls."""
+    try:
+        import time
+        import ai_core
+        from types import SimpleNamespace
+        from google.api_core import exceptions as google_exceptions
+        from utils.resilience import Resilience, CircuitBreaker, CircuitOpenError
+        
+        class FlakyModel:
+            """Fails with the queued errors, then answers."""
+            def __init__(self, errors):
+                self.errors = list(errors)
+                self.calls = 0
+                self.timeouts = []
+            def generate_content(self, contents, **kwargs):
+                self.calls += 1
+                self.timeouts.append(kwargs["request_options"]["timeout"])
+                if self.errors:
+                    raise self.errors.pop(0)
+                return SimpleNamespace(text="Hello.")
+        
+        waits = []
+        original = (ai_core._resilience, ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file,
+                    ai_core.ANALYSIS_CACHE_ENABLED, ai_core.INLINE_AUDIO_MAX_BYTES)
+        ai_core._upload_audio = lambda path: SimpleNamespace(name="files/test")
+        ai_core.genai.delete_file = lambda name: None
+        ai_core.ANALYSIS_CACHE_ENABLED = False
+        ai_core.INLINE_AUDIO_MAX_BYTES = 0
+        try:
+            ai_core._resilience = None
+            resilience = ai_core.get_resilience()
+            resilience.sleep = waits.append
+            model = FlakyModel([google_exceptions.ServiceUnavailable("down"), google_exceptions.ResourceExhausted("quota")])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            assert ai_core.transcribe_audio("call.wav") == "Hello." and model.calls == 3
+            assert model.timeouts == [ai_core.GEMINI_TIMEOUT_SECONDS] * 3
+            assert len(waits) == 2 and waits[0] <= ai_core.GEMINI_BACKOFF_BASE_SECONDS
+            print(f"✓ 503 and 429 retried with jittered backoff ({waits[0]:.2f}s, {waits[1]:.2f}s)")
+            
+            # Not transient: no retry, and the analysis falls back as before
+            model = FlakyModel([google_exceptions.InvalidArgument("bad request")])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            assert ai_core.analyze_call("Hi")["summary_short"] == "Analysis failed" and model.calls == 1
+            
+            assert ai_core.wait_for_file_cleanup(5)
+            stats = ai_core.get_resilience_stats()
+            assert stats["retries"] == 2 and stats["failures"] == 1 and stats["circuit"] == "closed"
+            assert stats["latency"]["transcribe"]["samples"] == 1, stats
+            print("✓ Non-transient errors fail at once and are counted")
+            
+            # Callers with their own rate limiting get 429s back without retries
+            model = FlakyModel([google_exceptions.ResourceExhausted("quota")])
+            ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+            with ai_core.no_quota_retries():
+                try:
+                    ai_core.transcribe_audio("call.wav")
+                    assert False, "expected the quota error"
+                except google_exceptions.ResourceExhausted:
+                    pass
+            assert model.calls == 1 and ai_core.get_resilience_stats()["circuit"] == "closed"
+            assert ai_core.transcribe_audio("call.wav") == "Hello." and model.calls == 2
+            print("✓ no_quota_retries() raises 429s at once")
+        finally:
+            (ai_core._resilience, ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file,
+             ai_core.ANALYSIS_CACHE_ENABLED, ai_core.INLINE_AUDIO_MAX_BYTES) = original
+        
+        def down():
+            raise google_exceptions.ServiceUnavailable("down")
+        breaker = CircuitBreaker(failure_threshold=4, cooldown_seconds=0.1)
+        resilience = Resilience(ai_core.is_retryable_error, max_attempts=2, breaker=breaker, sleep=lambda s: None)
+        for _ in range(2):
+            try:
+                resilience.call("test", down)
+            except google_exceptions.ServiceUnavailable:
+                pass
+        assert breaker.state == "open"
+        try:
+            resilience.call("test", down)
+            assert False, "expected the open circuit to fail fast"
+        except CircuitOpenError:
+            pass
+        time.sleep(0.15)
+        assert resilience.call("test", lambda: "up") == "up" and breaker.state == "closed"
+        stats = resilience.stats()
+        assert stats["circuit_rejections"] == 1 and stats["circuit_opens"] == 1
+        print("✓ Circuit opens after repeated outages, fails fast, and closes after a good trial")
+        
+        # A cancelled half-open trial must not leave the breaker rejecting for good
+        import asyncio
+        for _ in range(2):
+            try:
+                resilience.call("test", down)
+            except google_exceptions.ServiceUnavailable:
+                pass
+        assert breaker.state == "open"
+        time.sleep(0.15)
+        async def cancelled_trial():
+            trial = asyncio.ensure_future(resilience.call_async("test", lambda: asyncio.sleep(10)))
+            await asyncio.sleep(0.01)
+            trial.cancel()
+            try:
+                await trial
+            except asyncio.CancelledError:
+                pass
+            async def up():
+                return "up"
+            return await resilience.call_async("test", up)
+        assert asyncio.run(cancelled_trial()) == "up" and breaker.state == "closed"
+        print("✓ A cancelled trial frees the half-open slot")
+        
+        # Hedging: once p95 is known, a slow request gets a duplicate that wins
+        resilience = Resilience(ai_core.is_retryable_error, hedge_min_samples=5)
+        for _ in range(5):
+            resilience.call("gen", lambda: time.sleep(0.01), hedge=True)
+        delays = iter([1.0])
+        def sometimes_slow():
+            time.sleep(next(delays, 0.01))
+            return "done"
+        started = time.perf_counter()
+        assert resilience.call("gen", sometimes_slow, hedge=True) == "done"
+        elapsed = time.perf_counter() - started
+        stats = resilience.stats()
+        assert elapsed < 0.5 and stats["hedges"] == 1 and stats["hedge_wins"] == 1, (elapsed, stats)
+        print(f"✓ Hedged request answered in {elapsed:.2f}s instead of 1s")
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing resilience: {e}")
+        return False
+
+def test_analysis_cache():
+    """Test the two-tier analysis cache and its use by analyze_call()."""
+    try:
+        import json
+        import time
+        import db
+        import ai_core
+        import analysis_cache
+        from types import SimpleNamespace
+        
+        analysis = {
+            "caller_name": None, "caller_contact": None, "intent_category": "general_query",
+            "sentiment": "neutral", "priority": "low", "department": "General",
+            "summary_short": "Callback", "summary_full": "The caller asked to be called back."
+        }
+        
+        class CountingModel:
+            def __init__(self):
+                self.calls = 0
+            def generate_content(self, contents, **kwargs):
+                self.calls += 1
+                return SimpleNamespace(text=json.dumps(analysis))
+        
+        original = (ai_core._client_manager, analysis_cache._cache)
+        with temp_database("cache_test.db"):
+            try:
+                db.init_db()
+                model = CountingModel()
+                ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+                analysis_cache._cache = analysis_cache.AnalysisCache()
+                
+                assert ai_core.analyze_call("Please call me back.") == analysis
+                assert ai_core.analyze_call("  please CALL me\nback. ") == analysis and model.calls == 1
+                print("✓ Repeated transcript (modulo case and whitespace) answered from memory")
+                
+                # A new process: empty memory tier, same table
+                analysis_cache._cache = analysis_cache.AnalysisCache()
+                assert ai_core.analyze_call("Please call me back.") == analysis and model.calls == 1
+                stats = ai_core.get_analysis_cache_stats()
+                assert stats["db_hits"] == 1 and stats["memory_entries"] == 1, stats
+                print("✓ Entry survives a restart via the SQLite tier")
+                
+                # Force reprocess skips the lookup and stores the fresh result
+                analysis["summary_short"] = "Callback requested"
+                assert ai_core.analyze_call("Please call me back.", use_cache=False)["summary_short"] == "Callback requested"
+                assert model.calls == 2 and ai_core.analyze_call("Please call me back.") == analysis and model.calls == 2
+                print("✓ use_cache=False analyzes again and replaces the cached entry")
+                
+                # Hits only read; their last-used times are written in a batch
+                writes = db.get_db_stats()["write_transactions"]
+                cache = analysis_cache.get_analysis_cache()
+                assert ai_core.analyze_call("Please call me back.") == analysis
+                assert db.get_db_stats()["write_transactions"] == writes
+                def last_used():
+                    with db.get_connection_manager().reader(primary=True) as conn:
+                        return conn.execute("SELECT last_used_at FROM analysis_cache").fetchone()[0]
+                before = last_used()
+                cache.flush_touches()
+                assert last_used() > before and db.get_db_stats()["write_transactions"] == writes + 1
+                print("✓ Cache hits never wait on the writer; last-used times are batched")
+                
+                # Another prompt version or model is another key
+                key = analysis_cache.make_key("Please call me back.", ai_core.GEMINI_MODEL, ai_core.ANALYSIS_PROMPT_VERSION)
+                assert key != analysis_cache.make_key("Please call me back.", ai_core.GEMINI_MODEL, "other-prompt")
+                assert key != analysis_cache.make_key("Please call me back.", "models/other", ai_core.ANALYSIS_PROMPT_VERSION)
+                
+                cache = analysis_cache.AnalysisCache(ttl_seconds=0.05, max_rows=3, memory_entries=2)
+                for i in range(5):
+                    cache.put(f"key{i}", analysis)
+                with db.get_connection_manager().reader(primary=True) as conn:
+                    rows = conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+                assert rows == 3 and cache.get("key4") == analysis and cache.stats()["evicted"] == 3, cache.stats()
+                time.sleep(0.06)
+                assert cache.get("key4") is None and cache.get("key3") is None
+                print(f"✓ Size and TTL eviction ({cache.stats()})")
+            finally:
+                ai_core._client_manager, analysis_cache._cache = original
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing analysis cache: {e}")
+        return False
+
+def test_audio_dedup():
+    """Test that a recording processed before is matched to its ticket by content hash."""
+    try:
+        import io
+        import shutil
+        import db
+        import ai_core
+        import batch_processor
+        from utils.audio import hash_audio_file, hash_uploaded_file
+        
+        analysis = {
+            "transcript": "Please call me back.", "caller_name": None, "caller_contact": None,
+            "intent_category": "general_query", "sentiment": "neutral", "priority": "low",
+            "department": "General", "summary_short": "Callback", "summary_full": "Callback request."
+        }
+        calls = []
+        def pipeline(path, raise_on_error=False, before_fallback=None, use_cache=True):
+            calls.append(os.path.basename(path))
+            return dict(analysis)
+        
+        original_pipeline = ai_core.process_call_audio
+        with temp_database("dedup_test.db") as tmp_dir:
+            ai_core.process_call_audio = pipeline
+            try:
+                db.init_db()
+                first = os.path.join(tmp_dir, "voicemail.wav")
+                with open(first, "wb") as f:
+                    f.write(os.urandom(3 * 1024 * 1024 + 17))
+                retry = os.path.join(tmp_dir, "voicemail-retry.wav")
+                shutil.copyfile(first, retry)
+                other = os.path.join(tmp_dir, "other.wav")
+                with open(other, "wb") as f:
+                    f.write(b"different audio")
+                
+                audio_hash = hash_audio_file(first)
+                with open(first, "rb") as f:
+                    assert hash_uploaded_file(io.BytesIO(f.read())) == audio_hash == hash_audio_file(retry)
+                
+                report = batch_processor.BatchProcessor(combined=True).run([first])
+                ticket_id = report["results"][0].ticket_id
+                assert db.find_ticket_by_audio_hash(audio_hash)["id"] == ticket_id
+                
+                report = batch_processor.BatchProcessor(combined=True).run([retry, other])
+                duplicate, fresh = report["results"]
+                assert duplicate.duplicate and duplicate.ticket_id == ticket_id
+                assert duplicate.analysis == analysis and not fresh.duplicate
+                assert calls == ["voicemail.wav", "other.wav"] and report["duplicates"] == 1, calls
+                print("✓ Identical recording reused ticket #%d without a request" % ticket_id)
+                
+                report = batch_processor.BatchProcessor(combined=True, force=True).run([retry])
+                forced_id = report["results"][0].ticket_id
+                assert calls[-1] == "voicemail-retry.wav" and forced_id != ticket_id
+                assert db.find_ticket_by_audio_hash(audio_hash)["id"] == forced_id
+                print("✓ Force reprocess sends the request and remaps the hash to the new ticket")
+                
+                ids = db.insert_tickets([{**analysis, "audio_hash": "a" * 64}, dict(analysis)])
+                assert db.find_ticket_by_audio_hash("a" * 64)["id"] == ids[0]
+                assert db.find_ticket_by_audio_hash("b" * 64) is None
+            finally:
+                ai_core.process_call_audio = original_pipeline
+                db.shutdown_ticket_writer()
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing audio deduplication: {e}")
+        return False
+
+def test_inline_audio():
+    """Test inline transcription of small files and background deletes of uploads."""
+    try:
+        import tempfile
+        import time
+        import config
+        import ai_core
+        from types import SimpleNamespace
+        
+        class RecordingModel:
+            def __init__(self):
+                self.contents = []
+            def generate_content(self, contents, **kwargs):
+                self.contents.append(contents)
+                return SimpleNamespace(text="Hello.")
+        
+        uploads, deleted = [], []
+        def upload(path):
+            uploads.append(path)
+            return SimpleNamespace(name="files/large")
+        def slow_delete(name):
+            time.sleep(0.3)
+            deleted.append(name)
+        
+        model = RecordingModel()
+        original = (ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file, ai_core.INLINE_AUDIO_MAX_BYTES)
+        ai_core._client_manager = SimpleNamespace(get_model=lambda *args, **kwargs: model)
+        ai_core._upload_audio = upload
+        ai_core.genai.delete_file = slow_delete
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "voicemail.wav")
+            with open(path, "wb") as f:
+                f.write(b"RIFF" + b"\0" * 1000)
+            try:
+                ai_core.INLINE_AUDIO_MAX_BYTES = 2048
+                assert ai_core.transcribe_audio(path) == "Hello."
+                part = model.contents[0][1]
+                assert part == {"mime_type": "audio/wav", "data": b"RIFF" + b"\0" * 1000}, part
+                assert uploads == [] and deleted == []
+                print("✓ Small recording sent inline: one request, no upload or delete")
+                
+                ai_core.INLINE_AUDIO_MAX_BYTES = 512
+                started = time.perf_counter()
+                assert ai_core.transcribe_audio(path) == "Hello."
+                elapsed = time.perf_counter() - started
+                assert uploads == [path] and model.contents[1][1].name == "files/large"
+                assert elapsed < 0.2 and deleted == [], elapsed  # Not waiting on the 0.3s delete
+                assert ai_core.wait_for_file_cleanup(5) and deleted == ["files/large"]
+                print(f"✓ Large recording uploaded; its delete ran in the background ({elapsed * 1000:.0f} ms call)")
+                
+                # The default threshold leaves room for base64 and the prompt under the request cap
+                assert ai_core.inline_request_bytes(config.INLINE_AUDIO_MAX_BYTES) <= config.GEMINI_REQUEST_MAX_BYTES
+                ai_core.INLINE_AUDIO_MAX_BYTES = 2048
+                original_cap = ai_core.GEMINI_REQUEST_MAX_BYTES
+                ai_core.GEMINI_REQUEST_MAX_BYTES = ai_core.inline_request_bytes(1004) - 1
+                try:
+                    assert ai_core.transcribe_audio(path) == "Hello." and uploads == [path, path]
+                finally:
+                    ai_core.GEMINI_REQUEST_MAX_BYTES = original_cap
+                print("✓ Recording whose encoded request exceeds the cap is uploaded")
+            finally:
+                (ai_core._client_manager, ai_core._upload_audio, ai_core.genai.delete_file,
+                 ai_core.INLINE_AUDIO_MAX_BYTES) = original
+        
+        return True
+    except Exception as e:
+        print(f"✗ Error testing inline audio: {e}")
+        return False
+
 def test_ai_core():
     """Test AI core functions (requires API key)."""
     try:
@@ -132,6 +1516,29 @@ def main():
     tests = [
         ("Module Imports", test_imports),
         ("Database Operations", test_database),
+        ("Connection Manager", test_connection_manager),
+        ("Query Plans", test_query_plans),
+        ("Ticket Search", test_search),
+        ("Ticket Pagination", test_pagination),
+        ("Bulk Insert", test_bulk_insert),
+        ("Ticket Writer", test_ticket_writer),
+        ("Time Range Queries", test_time_range),
+        ("Rollup Stats", test_rollups),
+        ("Compressed Ticket Bodies", test_ticket_bodies),
+        ("Archive Partitions", test_archive),
+        ("Read Replica", test_read_replica),
+        ("Enum Columns", test_enum_columns),
+        ("Database Maintenance", test_maintenance),
+        ("Parquet Export", test_parquet_export),
+        ("Streaming Export", test_stream_export),
+        ("Gemini Client Manager", test_gemini_client_manager),
+        ("Combined Audio Analysis", test_process_call_audio),
+        ("Async AI Core", test_async_ai_core),
+        ("Batch Processor", test_batch_processor),
+        ("Resilience", test_resilience),
+        ("Analysis Cache", test_analysis_cache),
+        ("Audio Deduplication", test_audio_dedup),
+        ("Inline Audio", test_inline_audio),
         ("AI Core Functions", test_ai_core),
         ("Utility Functions", test_utils)
     ]
@@ -1,5 +1,8 @@
 import os
+import hashlib
+import mimetypes
 import tempfile
+import wave
 from typing import Optional
 
 def save_uploaded_file(uploaded_file) -> str:
@@ -66,4 +69,92 @@ def cleanup_temp_file(file_path: str):
         if os.path.exists(file_path):
             os.unlink(file_path)
     except Exception:
-        pass  # Ignore errors during cleanup
\ No newline at end of file
+        pass  # Ignore errors during cleanup
+
+# MIME types Gemini accepts for the supported formats
+AUDIO_MIME_TYPES = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mp3",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+}
+
+def get_audio_mime_type(file_path: str) -> str:
+    """
+    MIME type to send with an audio file's bytes.
+    
+    Args:
+        file_path (str): Path to the audio file
+        
+    Returns:
+        str: MIME type from AUDIO_MIME_TYPES, else guessed from the extension
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in AUDIO_MIME_TYPES:
+        return AUDIO_MIME_TYPES[ext]
+    return mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+# Fallback bitrate for compressed formats: 128 kbps
+COMPRESSED_BYTES_PER_SECOND = 16000
+
+def estimate_audio_seconds(file_path: str) -> float:
+    """
+    Estimate the duration of an audio file without decoding it.
+    
+    WAV headers give the exact length; compressed formats are estimated
+    from the file size at COMPRESSED_BYTES_PER_SECOND.
+    
+    Args:
+        file_path (str): Path to the audio file
+        
+    Returns:
+        float: Duration in seconds
+    """
+    if file_path.lower().endswith(".wav"):
+        try:
+            with wave.open(file_path, "rb") as audio:
+                return audio.getnframes() / float(audio.getframerate())
+        except (wave.Error, EOFError):
+            pass
+    return os.path.getsize(file_path) / COMPRESSED_BYTES_PER_SECOND
+
+# Read size for hashing, so large recordings never sit in memory whole
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def _hash_stream(stream) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_audio_file(file_path: str) -> str:
+    """
+    Content hash of an audio file, streamed in HASH_CHUNK_SIZE reads.
+    
+    Identical recordings (telephony retries, re-uploads) hash the same
+    whatever their file name.
+    
+    Args:
+        file_path (str): Path to the audio file
+        
+    Returns:
+        str: Hex SHA-256 of the file's bytes
+    """
+    with open(file_path, "rb") as f:
+        return _hash_stream(f)
+
+def hash_uploaded_file(uploaded_file) -> str:
+    """
+    Content hash of an uploaded Streamlit file, equal to hash_audio_file() of its saved copy.
+    
+    Args:
+        uploaded_file: Streamlit UploadedFile object
+        
+    Returns:
+        str: Hex SHA-256 of the file's bytes
+    """
+    uploaded_file.seek(0)
+    try:
+        return _hash_stream(uploaded_file)
+    finally:
+        uploaded_file.seek(0)
@@ -0,0 +1,92 @@
+import zlib
+from collections import Counter
+from typing import Iterable, Optional
+
+# zlib only looks back 32 KB, so a larger preset dictionary is wasted
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+# Raw deflate streams: no zlib header or checksum, which matters for short texts
+WBITS = -15
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """
+    Build a zlib preset dictionary from sample texts.
+    
+    Call transcripts repeat the same greetings and phrases ("Hi, this is ...
+    calling about my account"), so phrases that recur across many samples are
+    packed into the dictionary. Compressing a new text can then refer back to
+    them even when the text itself is short.
+    
+    Args:
+        samples (Iterable[str]): Representative texts, e.g. recent transcripts
+        size (int): Maximum dictionary size in bytes
+    
+    Returns:
+        bytes: The dictionary, most valuable phrases last (zlib finds those
+            with the shortest back-references)
+    """
+    counts = Counter()
+    for text in samples:
+        words = text.split()
+        # Count each phrase once per sample so one long rambling call
+        # cannot dominate the dictionary
+        phrases = set()
+        for n in (2, 3, 4, 6):
+            for i in range(len(words) - n + 1):
+                phrases.add(" ".join(words[i:i + n]))
+        counts.update(phrases)
+    
+    # Bytes saved if the phrase becomes a back-reference in every sample using it
+    scored = sorted(
+        ((count - 1) * len(phrase), phrase)
+        for phrase, count in counts.items()
+        if count > 1
+    )
+    
+    selected = []
+    used = 0
+    joined = ""
+    for _, phrase in reversed(scored[-5000:]):
+        if phrase in joined:
+            continue
+        if used + len(phrase) + 1 > size:
+            break
+        selected.append(phrase)
+        joined += phrase + " "
+        used += len(phrase) + 1
+    
+    return " ".join(reversed(selected)).encode("utf-8")[:size]
+
+def compress_text(text: str, zdict: Optional[bytes] = None) -> bytes:
+    """
+    Compress text with raw deflate, optionally primed with a preset dictionary.
+    
+    Args:
+        text (str): Text to compress
+        zdict (Optional[bytes]): Preset dictionary from train_dictionary()
+    
+    Returns:
+        bytes: Compressed data
+    """
+    if zdict:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, WBITS, zdict=zdict)
+    else:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, WBITS)
+    return compressor.compress(text.encode("utf-8")) + compressor.flush()
+
+def decompress_text(data: bytes, zdict: Optional[bytes] = None) -> str:
+    """
+    Reverse compress_text(); the same dictionary must be supplied.
+    
+    Args:
+        data (bytes): Compressed data
+        zdict (Optional[bytes]): The dictionary used for compression
+    
+    Returns:
+        str: The original text
+    """
+    if zdict:
+        decompressor = zlib.decompressobj(WBITS, zdict=zdict)
+    else:
+        decompressor = zlib.decompressobj(WBITS)
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
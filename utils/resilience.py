@@ -0,0 +1,335 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an endpoint that the circuit breaker has marked as down."""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+    
+    After failure_threshold failures in a row the circuit opens and calls
+    fail fast for cooldown_seconds. Then a single trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.opens = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a call may go out now."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+                self._trial_running = False
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_running = False
+    
+    def release_trial(self):
+        """Free the half-open trial slot when the trial ended without an answer, e.g. cancelled."""
+        with self._lock:
+            self._trial_running = False
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+class LatencyTracker:
+    """Recent call durations, for percentile estimates."""
+    
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def count(self) -> int:
+        return len(self._samples)
+    
+    def percentile(self, q: float) -> Optional[float]:
+        """The q-th quantile (0-1) of the recent durations, None without samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+class Resilience:
+    """
+    Retries, circuit breaking and optional request hedging for remote calls.
+    
+    call() runs a zero-argument function: retryable errors are retried
+    with exponential backoff and full jitter, outages count towards the
+    circuit breaker, and with hedging on a
+    duplicate is started once the first attempt has run longer than the
+    operation's recent p95 latency; the first success wins. call_async()
+    does the same for coroutine functions, cancelling the losing hedge.
+    
+    Args:
+        is_retryable (Callable): Classifies an exception as transient
+        is_timeout (Callable): Classifies an exception as a timeout, for the counters
+        is_outage (Optional[Callable]): Classifies a retryable exception as the
+            endpoint being down; defaults to every retryable exception
+        max_attempts (int): Tries per call, including the first
+        backoff_base (float): Upper bound of the first retry delay, doubled per attempt
+        backoff_max (float): Cap on the retry delay
+        breaker (Optional[CircuitBreaker]): Shared breaker, None to disable
+        hedge_min_samples (int): Latency samples needed before hedging starts
+        sleep (Callable): Sleep function, replaceable in tests
+    """
+    
+    def __init__(self, is_retryable: Callable[[BaseException], bool],
+                 is_timeout: Callable[[BaseException], bool] = lambda e: isinstance(e, TimeoutError),
+                 is_outage: Optional[Callable[[BaseException], bool]] = None,
+                 max_attempts: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 breaker: Optional[CircuitBreaker] = None, hedge_min_samples: int = 20,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.is_retryable = is_retryable
+        self.is_timeout = is_timeout
+        self.is_outage = is_outage or is_retryable
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker
+        self.hedge_min_samples = hedge_min_samples
+        self.sleep = sleep
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0, "timeouts": 0,
+            "circuit_rejections": 0, "hedges": 0, "hedge_wins": 0,
+        }
+    
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._counters[key] += amount
+    
+    def _tracker(self, operation: str) -> LatencyTracker:
+        with self._lock:
+            return self._latency.setdefault(operation, LatencyTracker())
+    
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """Seconds after which a hedge is sent: the recent p95, once enough samples exist."""
+        tracker = self._tracker(operation)
+        if tracker.count() < self.hedge_min_samples:
+            return None
+        return tracker.percentile(0.95)
+    
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number attempt (1-based)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+    
+    def _timed(self, operation: str, fn: Callable[[], Any]) -> Any:
+        started = time.perf_counter()
+        result = fn()
+        self._tracker(operation).add(time.perf_counter() - started)
+        return result
+    
+    def _hedged(self, operation: str, fn: Callable[[], Any]) -> Any:
+        delay = self.hedge_delay(operation)
+        if delay is None:
+            return self._timed(operation, fn)
+        
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(thread_name_prefix="hedge")
+        primary = self._hedge_pool.submit(self._timed, operation, fn)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        
+        self._count("hedges")
+        hedge = self._hedge_pool.submit(self._timed, operation, fn)
+        error = None
+        # The slower request cannot be cancelled; its result is dropped
+        for future in as_completed([primary, hedge]):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if future is hedge:
+                self._count("hedge_wins")
+            return result
+        raise error
+    
+    def _before_attempt(self):
+        if self.breaker is not None and not self.breaker.allow():
+            self._count("circuit_rejections")
+            raise CircuitOpenError("Circuit open: the endpoint failed repeatedly, failing fast")
+    
+    def _after_failure(self, error: Exception, attempt: int) -> bool:
+        """Record a failed attempt; returns whether to retry."""
+        retryable = self.is_retryable(error)
+        if self.is_timeout(error):
+            self._count("timeouts")
+        if self.breaker is not None:
+            # Any other answer (bad request, quota exceeded) proves the endpoint is up
+            if retryable and self.is_outage(error):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        if retryable and attempt < self.max_attempts:
+            self._count("retries")
+            return True
+        self._count("failures")
+        return False
+    
+    def _after_abort(self):
+        """The attempt was cancelled or interrupted: it says nothing about the endpoint."""
+        if self.breaker is not None:
+            self.breaker.release_trial()
+    
+    def _after_success(self):
+        if self.breaker is not None:
+            self.breaker.record_success()
+        self._count("successes")
+    
+    def call(self, operation: str, fn: Callable[[], Any], hedge: bool = False) -> Any:
+        """
+        Run fn with retries, circuit breaking and optional hedging.
+        
+        Args:
+            operation (str): Name used for latency tracking, e.g. "analyze"
+            fn (Callable): The remote call; must be safe to repeat
+            hedge (bool): Allow a duplicate request when this one is slow
+        
+        Returns:
+            Any: fn's result
+        
+        Raises:
+            CircuitOpenError: If the circuit is open
+            Exception: fn's last error once it is not retryable or attempts run out
+        """
+        self._count("calls")
+        for attempt in range(1, self.max_attempts + 1):
+            self._before_attempt()
+            try:
+                result = self._hedged(operation, fn) if hedge else self._timed(operation, fn)
+            except Exception as e:
+                if not self._after_failure(e, attempt):
+                    raise
+                self.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                self._after_abort()
+                raise
+            self._after_success()
+            return result
+    
+    async def _timed_async(self, operation: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        result = await fn()
+        self._tracker(operation).add(time.perf_counter() - started)
+        return result
+    
+    async def _hedged_async(self, operation: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self.hedge_delay(operation)
+        primary = asyncio.ensure_future(self._timed_async(operation, fn))
+        if delay is None:
+            return await primary
+        
+        done, _ = await asyncio.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        
+        self._count("hedges")
+        hedge = asyncio.ensure_future(self._timed_async(operation, fn))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    async def call_async(self, operation: str, fn: Callable[[], Awaitable[Any]], hedge: bool = False) -> Any:
+        """
+        Awaitable call(): fn returns a new coroutine per attempt.
+        
+        Cancellation propagates immediately and is never retried.
+        """
+        self._count("calls")
+        for attempt in range(1, self.max_attempts + 1):
+            self._before_attempt()
+            try:
+                if hedge:
+                    result = await self._hedged_async(operation, fn)
+                else:
+                    result = await self._timed_async(operation, fn)
+            except Exception as e:
+                if not self._after_failure(e, attempt):
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            except BaseException:
+                # CancelledError: release a half-open trial so the breaker can try again
+                self._after_abort()
+                raise
+            self._after_success()
+            return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the counters, breaker state and latency percentiles per operation.
+        
+        Returns:
+            Dict[str, Any]: Counters plus "circuit", "circuit_opens" and
+                "latency" ({operation: {"p50", "p95", "samples"}})
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            trackers = dict(self._latency)
+        return {
+            **counters,
+            "circuit": self.breaker.state if self.breaker else None,
+            "circuit_opens": self.breaker.opens if self.breaker else 0,
+            "latency": {
+                operation: {
+                    "p50": tracker.percentile(0.5),
+                    "p95": tracker.percentile(0.95),
+                    "samples": tracker.count(),
+                }
+                for operation, tracker in trackers.items()
+            },
+        }